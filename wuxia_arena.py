@@ -0,0 +1,356 @@
+import math
+import random
+import time
+
+from wuxia_trace import Ev
+from wuxia_timeline_demo import TIME_UNIT, State, to_ms, create_heavy_fighter, create_swift_fighter
+
+# --- 群战竞技场 ---
+# 每个角色有自己的平面坐标 (一维战场令 y 恒为 0)，Fighter.update 原样复用:
+# 更新某个角色时传给它的不是 DistanceManager，而是一个“视图”，读 distance 得到它与当前目标的实时距离，
+# 写 distance 则换算成坐标位移 ——
+#   - 移动、突进、后撤 (出招判定之前的写入): 自己沿着与目标的连线前进/后退
+#   - 击退 (perform_hit_check 里的写入，以 ATTACK 事件为界): 把目标沿连线推开
+# 目标选择用网格分桶: 每帧按存活角色的坐标重建一次 (O(n))，帧内有人移动、突进、后撤或被击退时
+# 立即把他挪到新格子，所以查询时格子归属总是最新的，结果与两两比较完全一致。
+# 找最近的敌人只看附近几圈格子，整帧的开销约为 O(n)，而不是两两比较的 O(n²)。
+# 目标在出招过程中保持不变，回到站立或目标倒下时才重新选择。
+# 范围查询 within / reachable 同样走网格: 某点周围一定半径内的敌人、某角色当前招式 (攻击距离 + 突进) 够得着的敌人。
+# 击退只作用于被命中的目标本身，不是范围效果，所以没有对应的范围查询。
+
+class _View:
+    """角色 i 眼中与目标 j 的距离 (伪装成 DistanceManager)"""
+    __slots__ = ("arena", "i", "j", "knock")
+
+    def __init__(self, arena):
+        self.arena = arena
+        self.i = self.j = 0
+        self.knock = False # 进入命中判定之后的写入算作击退
+
+    @property
+    def distance(self):
+        x, y = self.arena.x, self.arena.y
+        return math.hypot(x[self.j] - x[self.i], y[self.j] - y[self.i])
+
+    @distance.setter
+    def distance(self, value):
+        x, y = self.arena.x, self.arena.y
+        i, j = self.i, self.j
+        dx = x[j] - x[i]
+        dy = y[j] - y[i]
+        d = math.hypot(dx, dy)
+        if d > 0:
+            ux, uy = dx / d, dy / d
+        else:
+            ux, uy = (1.0, 0.0) if i < j else (-1.0, 0.0) # 重合时按编号决定朝向
+        if self.knock:
+            x[j] = x[i] + ux * value
+            y[j] = y[i] + uy * value
+        else:
+            x[i] = x[j] - ux * value
+            y[i] = y[j] - uy * value
+
+class _ArenaTrace:
+    """挂在竞技场角色上: 遇到出招事件打开击退标记，其余事件原样转发给外部的 CombatTrace"""
+    def __init__(self, view, trace=None):
+        self.view = view
+        self.trace = trace
+
+    def record(self, t, actor, code, node, a, b, c):
+        if code == Ev.ATTACK:
+            self.view.knock = True
+        if self.trace is not None:
+            self.trace.record(t, actor, code, node, a, b, c)
+
+class ArenaResult:
+    """群战结果: 获胜队伍 (None 表示超时或同归于尽)、用时、各队存活人数、各角色击倒数"""
+    def __init__(self, winner, duration, alive, kills):
+        self.winner = winner
+        self.duration = duration
+        self.alive = alive
+        self.kills = kills
+
+class Arena:
+    """N 个角色的群战
+
+    cell: 网格边长 (米)，取常用出手距离 (atk_range + dash) 的量级即可。
+    index: "grid" 用网格找最近的敌人；"brute" 两两比较 (只用于对照)。
+    """
+    def __init__(self, cell=4.0, index="grid"):
+        if index not in ("grid", "brute"):
+            raise ValueError(f"未知的空间索引: {index}")
+        self.cell = cell
+        self.index = index
+        self.fighters = []
+        self.teams = []
+        self.x = []
+        self.y = []
+        self.targets = []
+        self.kills = []
+        self._grid = {}
+        self._cells = []  # 角色 -> 所在格子 (不在网格里为 None)
+        self._bounds = (0, 0, 0, 0)
+
+    def add(self, fighter, x, y=0.0, team=None):
+        """加入一名角色 (team 为 None 时自成一队，即混战)，返回其编号"""
+        self.fighters.append(fighter)
+        self.teams.append(len(self.fighters) - 1 if team is None else team)
+        self.x.append(float(x))
+        self.y.append(float(y))
+        self.targets.append(-1)
+        self.kills.append(0)
+        return len(self.fighters) - 1
+
+    def alive_teams(self):
+        alive = {}
+        for fighter, team in zip(self.fighters, self.teams):
+            if fighter.hp > 0:
+                alive[team] = alive.get(team, 0) + 1
+        return alive
+
+    # --- 空间索引 ---
+
+    def _cell_of(self, k):
+        return int(math.floor(self.x[k] / self.cell)), int(math.floor(self.y[k] / self.cell))
+
+    def _build_grid(self):
+        grid = {}
+        cells = [None] * len(self.fighters)
+        for k, fighter in enumerate(self.fighters):
+            if fighter.hp > 0:
+                key = cells[k] = self._cell_of(k)
+                grid.setdefault(key, []).append(k)
+        self._grid = grid
+        self._cells = cells
+        if grid:
+            cxs = [cx for cx, _ in grid]
+            cys = [cy for _, cy in grid]
+            self._bounds = (min(cxs), max(cxs), min(cys), max(cys))
+        else:
+            self._bounds = (0, 0, 0, 0)
+
+    def _relocate(self, k):
+        """角色 k 在帧内移动过: 如果换了格子就挪过去 (边界只会扩大，不影响查询的正确性)"""
+        old = self._cells[k]
+        if old is None:
+            return
+        key = self._cell_of(k)
+        if key == old:
+            return
+        self._grid[old].remove(k)
+        self._grid.setdefault(key, []).append(k)
+        self._cells[k] = key
+        x0, x1, y0, y1 = self._bounds
+        cx, cy = key
+        self._bounds = (min(x0, cx), max(x1, cx), min(y0, cy), max(y1, cy))
+
+    def _rings(self, px, py):
+        """从点 (px, py) 所在格子向外逐圈产出 (圈号, 该圈上的角色编号列表)"""
+        cell, grid = self.cell, self._grid
+        cx = int(math.floor(px / cell))
+        cy = int(math.floor(py / cell))
+        x0, x1, y0, y1 = self._bounds
+        max_ring = max(cx - x0, x1 - cx, cy - y0, y1 - cy)
+        for r in range(max_ring + 1):
+            members = []
+            for gx in range(cx - r, cx + r + 1):
+                edge = gx == cx - r or gx == cx + r
+                for gy in (range(cy - r, cy + r + 1) if edge else (cy - r, cy + r)):
+                    members.extend(grid.get((gx, gy), ()))
+            yield r, members
+
+    def _nearest_grid(self, i):
+        x, y, teams, fighters = self.x, self.y, self.teams, self.fighters
+        cell = self.cell
+        xi, yi, team = x[i], y[i], teams[i]
+        best, best_d = -1, math.inf
+        for r, members in self._rings(xi, yi):
+            # 第 r 圈上的格子离本格至少 (r - 1) * cell 远，已找到的严格更近就不必再往外
+            if best >= 0 and best_d < (r - 1) * cell:
+                break
+            for k in members:
+                if teams[k] != team and fighters[k].hp > 0:
+                    d = math.hypot(x[k] - xi, y[k] - yi)
+                    if d < best_d or (d == best_d and k < best):
+                        best, best_d = k, d
+        return best
+
+    # --- 范围查询 ---
+
+    def within(self, i, radius):
+        """角色 i 周围 radius 米内 (含边界) 的存活敌人，按编号排序"""
+        x, y, teams, fighters = self.x, self.y, self.teams, self.fighters
+        xi, yi, team = x[i], y[i], teams[i]
+        if self.index == "brute":
+            candidates = range(len(fighters))
+        else:
+            if not self._cells:
+                self._build_grid()
+            candidates = []
+            for r, members in self._rings(xi, yi):
+                if (r - 1) * self.cell > radius:
+                    break
+                candidates.extend(members)
+        return sorted(k for k in candidates
+                      if teams[k] != team and fighters[k].hp > 0 and math.hypot(x[k] - xi, y[k] - yi) <= radius)
+
+    def reachable(self, i):
+        """角色 i 当前招式 (出招中的招式，站立时为即将使用的招式) 的攻击距离 + 突进范围内的敌人"""
+        fighter = self.fighters[i]
+        node = fighter.current_action_node
+        if node is None:
+            node = fighter.nodes.get(fighter.current_node_name or fighter.root_node_name)
+        reach = getattr(node, "atk_range", 0.0) + getattr(node, "dash", 0.0) # 条件节点没有距离参数
+        return self.within(i, reach) if reach > 0 else []
+
+    def _nearest_brute(self, i):
+        x, y, teams, fighters = self.x, self.y, self.teams, self.fighters
+        xi, yi, team = x[i], y[i], teams[i]
+        best, best_d = -1, math.inf
+        for k in range(len(fighters)):
+            if teams[k] != team and fighters[k].hp > 0:
+                d = math.hypot(x[k] - xi, y[k] - yi)
+                if d < best_d:
+                    best, best_d = k, d
+        return best
+
+    # --- 推进 ---
+
+    def step(self, dt, t, view):
+        grid = self.index == "grid"
+        if grid:
+            self._build_grid()
+            nearest = self._nearest_grid
+        else:
+            nearest = self._nearest_brute
+        fighters, targets = self.fighters, self.targets
+        for i, fighter in enumerate(fighters):
+            if fighter.hp <= 0:
+                continue
+            j = targets[i]
+            # 出招/移动途中不换目标，回到站立或目标倒下才重新选择
+            if j < 0 or fighters[j].hp <= 0 or fighter.state == State.IDLE:
+                j = targets[i] = nearest(i)
+                if j < 0:
+                    continue
+                if fighter.state == State.MOVE:
+                    fighter.state = State.IDLE # 原来的目标没了，重新思考
+            target = fighters[j]
+            before = target.hp
+            view.i, view.j, view.knock = i, j, False
+            fighter.update(dt, target, t, view)
+            if grid: # 自己可能移动/突进/后撤，目标可能被击退
+                self._relocate(i)
+                self._relocate(j)
+            if before > 0 >= target.hp:
+                self.kills[i] += 1
+
+    def run(self, dt=0.1, time_limit=60.0, trace=None, on_frame=None):
+        """打到只剩一队 (或时限) 为止，返回 ArenaResult
+
+        trace: wuxia_trace.CombatTrace，给出时记录所有角色的事件 (角色编号按加入顺序，接在缓冲里已有的角色之后)。
+        on_frame(time_elapsed, arena) 在每帧结束时调用。
+        """
+        view = _View(self)
+        saved = [(f.trace, f.trace_id) for f in self.fighters]
+        base = 0
+        if trace is not None:
+            base = len(trace.fighters) # 缓冲里已有别的角色时，本场的编号接在后面
+            trace.attach(*self.fighters)
+        hook = _ArenaTrace(view, trace)
+        for k, fighter in enumerate(self.fighters):
+            fighter.trace = hook
+            fighter.trace_id = base + k
+        step, limit = to_ms(dt), to_ms(time_limit)
+        if step <= 0:
+            raise ValueError(f"dt 至少为 1 毫秒: {dt}")
+        elapsed = 0 # 与 simulate_duel 相同的整数毫秒时间轴
+        try:
+            while len(self.alive_teams()) > 1 and elapsed < limit:
+                time_elapsed = elapsed / TIME_UNIT
+                self.step(dt, time_elapsed, view)
+                if on_frame is not None:
+                    on_frame(time_elapsed, self)
+                elapsed += step
+        finally:
+            for fighter, (old_trace, old_id) in zip(self.fighters, saved):
+                fighter.trace, fighter.trace_id = old_trace, old_id
+            if trace is not None:
+                trace.detach(*self.fighters)
+        alive = self.alive_teams()
+        winner = next(iter(alive)) if len(alive) == 1 else None
+        return ArenaResult(winner, elapsed / TIME_UNIT, alive, list(self.kills))
+
+def create_melee(n, seed=0, density=0.05, index="grid", cell=4.0):
+    """n 人混战: 重剑与快剑各半，在面积 n / density 的正方形内随机站位，分成两队"""
+    rng = random.Random(seed)
+    side = math.sqrt(n / density)
+    arena = Arena(cell=cell, index=index)
+    for k in range(n):
+        if k % 2 == 0:
+            fighter = create_heavy_fighter(f"重剑{k}", verbose=False)
+        else:
+            fighter = create_swift_fighter(f"快剑{k}", verbose=False)
+        fighter.compile()
+        arena.add(fighter, rng.uniform(0, side), rng.uniform(0, side), team=k % 2)
+    return arena
+
+if __name__ == "__main__":
+    import os
+    import shutil
+    import tempfile
+    from wuxia_trace import CombatTrace
+
+    frames = 50
+    print(f"每种规模推进 {frames} 帧:")
+    for n in (50, 200, 1000, 4000):
+        timings = {}
+        for index in ("grid", "brute"):
+            if index == "brute" and n > 1000:
+                continue
+            arena = create_melee(n, index=index)
+            start = time.perf_counter()
+            arena.run(time_limit=frames * 0.1)
+            timings[index] = (time.perf_counter() - start) / frames
+        line = f"  {n:>5} 人: 网格 {timings['grid'] * 1000:7.2f} ms/帧"
+        if "brute" in timings:
+            line += f"  |  两两比较 {timings['brute'] * 1000:7.2f} ms/帧  ({timings['brute'] / timings['grid']:.1f}x)"
+        print(line)
+
+    # 网格与两两比较逐帧选出的目标、最终结果都应完全一致
+    runs = []
+    for index in ("grid", "brute"):
+        arena = create_melee(200, seed=1, index=index)
+        picks = []
+        result = arena.run(on_frame=lambda t, a: picks.append(tuple(a.targets)))
+        runs.append((picks, result.duration, result.alive, result.kills))
+    print(f"\n网格与两两比较 (200 人整场): {'一致' if runs[0] == runs[1] else '不一致!'}")
+
+    arena = create_melee(200, seed=1)
+    reach = [(len(arena.reachable(k)), k) for k in range(len(arena.fighters))]
+    same = all(arena.within(k, 6.0) == [j for j in range(200) if arena.teams[j] != arena.teams[k]
+                                        and math.hypot(arena.x[j] - arena.x[k], arena.y[j] - arena.y[k]) <= 6.0]
+               for k in range(200))
+    print(f"范围查询 (6m 内的敌人) 与两两比较: {'一致' if same else '不一致!'}  "
+          f"开局招式够得着敌人的角色 {sum(1 for c, _ in reach if c)} 名")
+
+    # 事件缓冲的角色编号要容得下上百名角色 (写入文件再读回)
+    traced = create_melee(200, seed=1)
+    trace = CombatTrace()
+    traced.run(time_limit=5.0, trace=trace)
+    root = tempfile.mkdtemp(prefix="wuxia_arena_")
+    try:
+        path = os.path.join(root, "melee.wxtr")
+        trace.write(path)
+        loaded = CombatTrace.load(path)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    actors = set(loaded.actor)
+    print(f"200 人混战前 5 秒: {len(loaded)} 条事件，涉及 {len(actors)} 名角色 (最大编号 {max(actors)})，"
+          f"读回{'一致' if list(loaded.actor) == list(trace.actor) else '不一致!'}")
+
+    result = arena.run()
+    top = sorted(range(len(arena.fighters)), key=lambda k: -result.kills[k])[:3]
+    team_names = {0: "重剑队", 1: "快剑队"}
+    print(f"\n200 人混战: {team_names.get(result.winner, '无人')}获胜，用时 {result.duration:.1f}s，存活 {result.alive}")
+    print("击倒最多: " + ", ".join(f"{arena.fighters[k].name} ({result.kills[k]})" for k in top))
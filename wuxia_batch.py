@@ -0,0 +1,220 @@
+import io
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+
+from wuxia_cycle import simulate_duel_cycles
+from wuxia_memo import simulate_duel_cached
+from wuxia_timeline_demo import (Fighter, State, simulate_duel, print_frame, create_heavy_fighter, create_swift_fighter,
+                                 _GUARD_STATES)
+
+# --- 批量模拟 (无界面、无输出) ---
+
+class BatchResult:
+    """一批对决的汇总统计 (可合并，方便分块/并行后汇总)"""
+    def __init__(self, dt=0.1):
+        self.dt = dt
+        self.duels = 0
+        self.wins = [0, 0, 0]           # [平局, P1胜, P2胜]
+        self.ttk_hist = {}              # 分出胜负所用帧数 -> 场数 (击杀时间分布)
+        self.damage_dealt = [0.0, 0.0]  # 双方累计造成伤害
+        self.stuns = [0, 0]             # 双方累计被打入僵直次数
+
+    def add(self, result):
+        self.duels += 1
+        self.wins[result.winner] += 1
+        if result.winner:
+            ticks = int(round(result.duration / self.dt))
+            self.ttk_hist[ticks] = self.ttk_hist.get(ticks, 0) + 1
+        self.damage_dealt[0] += result.damage_dealt[0]
+        self.damage_dealt[1] += result.damage_dealt[1]
+        self.stuns[0] += result.stuns[0]
+        self.stuns[1] += result.stuns[1]
+
+    def merge(self, other):
+        """合并另一批结果 (两批必须使用相同的 dt)"""
+        if other.dt != self.dt:
+            raise ValueError(f"dt 不一致: {self.dt} != {other.dt}")
+        self.duels += other.duels
+        for i in range(3):
+            self.wins[i] += other.wins[i]
+        for ticks, count in other.ttk_hist.items():
+            self.ttk_hist[ticks] = self.ttk_hist.get(ticks, 0) + count
+        for i in range(2):
+            self.damage_dealt[i] += other.damage_dealt[i]
+            self.stuns[i] += other.stuns[i]
+        return self
+
+    def win_rate(self, player):
+        """player: 1 或 2"""
+        return self.wins[player] / self.duels if self.duels else 0.0
+
+    @property
+    def draw_rate(self):
+        return self.wins[0] / self.duels if self.duels else 0.0
+
+    def ttk_quantile(self, q):
+        """击杀时间的分位数 (秒)，没有分出胜负的对局时返回 None"""
+        total = sum(self.ttk_hist.values())
+        if total == 0:
+            return None
+        target = q * (total - 1)
+        seen = 0
+        for ticks in sorted(self.ttk_hist):
+            seen += self.ttk_hist[ticks]
+            if seen > target:
+                return ticks * self.dt
+        return max(self.ttk_hist) * self.dt
+
+    def mean_ttk(self):
+        total = sum(self.ttk_hist.values())
+        if total == 0:
+            return None
+        return sum(t * c for t, c in self.ttk_hist.items()) * self.dt / total
+
+    def summary(self, p1_name="P1", p2_name="P2"):
+        lines = [
+            f"对局数: {self.duels}",
+            f"{p1_name} 胜率: {self.win_rate(1):.1%}  |  {p2_name} 胜率: {self.win_rate(2):.1%}  |  平局: {self.draw_rate:.1%}",
+        ]
+        if self.duels:
+            lines.append(f"场均伤害: {p1_name} {self.damage_dealt[0] / self.duels:.1f}  |  {p2_name} {self.damage_dealt[1] / self.duels:.1f}")
+            lines.append(f"场均被僵直: {p1_name} {self.stuns[0] / self.duels:.2f}  |  {p2_name} {self.stuns[1] / self.duels:.2f}")
+        if self.ttk_hist:
+            lines.append(f"击杀时间: 均值 {self.mean_ttk():.2f}s  P10 {self.ttk_quantile(0.1):.1f}s  中位 {self.ttk_quantile(0.5):.1f}s  P90 {self.ttk_quantile(0.9):.1f}s")
+        return "\n".join(lines)
+
+_MASK64 = (1 << 64) - 1
+
+def seed_uniform(seed):
+    """把种子映射为 [0, 1) 内的均匀数 (splitmix64)
+
+    比每场新建 random.Random(seed) 快一个数量级，且能用 NumPy 的 uint64 运算逐位复现。
+    """
+    z = (seed + 0x9E3779B97F4A7C15) & _MASK64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+    z ^= z >> 31
+    return (z >> 11) * (1.0 / (1 << 53))
+
+def duel_distance(seed, initial_distance=3.0, distance_jitter=0.5):
+    """由种子决定本场的初始距离 (时间轴引擎本身没有随机性，种子只扰动开局站位)"""
+    if distance_jitter <= 0:
+        return initial_distance
+    return initial_distance + (-distance_jitter + 2 * distance_jitter * seed_uniform(seed))
+
+def run_batch(p1, p2, seeds, initial_distance=3.0, distance_jitter=0.5, dt=0.1, time_limit=60.0, cache=None, detect_cycles=False):
+    """对同一对角色按种子区间批量对决，不产生任何控制台输出
+
+    p1/p2 的招式图被复用 (开跑前编译并校验一次)，运行时状态会在每场开始前 reset()。
+    cache: wuxia_memo.TranspositionCache，给出时重复出现的局面直接套用已知结局 (结果不变)。
+    detect_cycles: 为 True 时局面进入周期后不再逐帧推进 (见 wuxia_cycle，结果不变)，不能与 cache 同时使用。
+    """
+    if cache is not None and detect_cycles:
+        raise ValueError("cache 与 detect_cycles 不能同时使用")
+    p1.compile()
+    p2.compile()
+    result = BatchResult(dt)
+    verbose = (p1.verbose, p2.verbose)
+    p1.verbose = p2.verbose = False
+    try:
+        for seed in seeds:
+            p1.reset()
+            p2.reset()
+            distance = duel_distance(seed, initial_distance, distance_jitter)
+            if cache is not None:
+                result.add(simulate_duel_cached(p1, p2, cache, distance, dt, time_limit))
+            elif detect_cycles:
+                result.add(simulate_duel_cycles(p1, p2, distance, dt, time_limit))
+            else:
+                result.add(simulate_duel(p1, p2, distance, dt, time_limit))
+    finally:
+        p1.verbose, p2.verbose = verbose
+    return result
+
+# --- 基准测试 ---
+
+def benchmark(n_batch=5000, n_printing=200):
+    """对比逐帧打印的原始循环与无输出批量模式的吞吐量"""
+    p1 = create_heavy_fighter()
+    p2 = create_swift_fighter()
+
+    # 原始方式: 每帧格式化并打印 (输出写入内存缓冲，排除终端本身的速度影响)
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        for seed in range(n_printing):
+            p1.reset()
+            p2.reset()
+            simulate_duel(p1, p2, duel_distance(seed), on_frame=print_frame)
+    printing_rate = n_printing / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    result = run_batch(p1, p2, range(n_batch))
+    batch_rate = n_batch / (time.perf_counter() - start)
+
+    print(result.summary(p1.name, p2.name))
+    print(f"\n逐帧打印: {printing_rate * 60:,.0f} 场/分钟")
+    print(f"批量模式: {batch_rate * 60:,.0f} 场/分钟  (加速 {batch_rate / printing_rate:.1f}x)")
+
+def _allocated(build, n):
+    """build() 构造 n 个对象时新增的内存 (字节/个)"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [build() for _ in range(n)]
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del objects
+    return used / n
+
+class _DictFighter:
+    """原先 Fighter 的内存布局 (普通类，字段在实例 __dict__ 里)，只用于对比"""
+
+def benchmark_footprint(n_fighters=100000, n_duels=3000, n_checks=1000000):
+    """紧凑运行时 (__slots__ + 整数状态) 与原先 __dict__ + 字符串状态的内存/吞吐对比"""
+    template = create_heavy_fighter(verbose=False)
+
+    # 同时在场的角色共享招式图，只比较每个角色自己的运行时状态
+    # 原先的表示: 同样的字段放在实例 __dict__ 里，状态是字符串，外加一个没用到的 log_buffer 列表
+    fields = template.__getstate__()
+    legacy_fields = dict(fields, state=State.NAMES[template.state])
+
+    def build_compact():
+        fighter = Fighter.__new__(Fighter)
+        fighter.__setstate__(fields)
+        return fighter
+
+    compact = _allocated(build_compact, n_fighters)
+
+    def build_legacy():
+        fighter = _DictFighter()
+        for field, value in legacy_fields.items(): # 逐个赋值，保持与原类相同的共享键字典布局
+            setattr(fighter, field, value)
+        fighter.log_buffer = []
+        return fighter
+
+    legacy = _allocated(build_legacy, n_fighters)
+    print(f"在场角色内存: 紧凑 {compact:.0f} B/个  |  原先 {legacy:.0f} B/个  (节省 {1 - compact / legacy:.0%})")
+
+    # 热路径上的状态判断: 整数 + 预建集合 vs 字符串 + 临时列表
+    windup_name, active_name = State.NAMES[State.WINDUP], State.NAMES[State.ACTIVE]
+    state, name = State.RECOVERY, State.NAMES[State.RECOVERY]
+    start = time.perf_counter()
+    for _ in range(n_checks):
+        state in _GUARD_STATES
+    fast = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(n_checks):
+        name in [windup_name, active_name]
+    slow = time.perf_counter() - start
+    print(f"状态判断: 整数集合 {fast / n_checks * 1e9:.0f}ns  |  字符串列表 {slow / n_checks * 1e9:.0f}ns")
+
+    p1 = create_heavy_fighter(verbose=False)
+    p2 = create_swift_fighter(verbose=False)
+    start = time.perf_counter()
+    run_batch(p1, p2, range(n_duels))
+    print(f"对决吞吐: {n_duels / (time.perf_counter() - start):,.0f} 场/秒")
+
+if __name__ == "__main__":
+    benchmark()
+    print()
+    benchmark_footprint()
@@ -0,0 +1,222 @@
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+from functools import partial
+
+from wuxia_arena import create_melee
+from wuxia_batch import run_batch, duel_distance
+from wuxia_condition import Condition, Cond
+from wuxia_timeline_demo import (Fighter, ActionNode, ConditionNode, ActionType, simulate_duel,
+                                 create_heavy_fighter, create_swift_fighter)
+
+# --- 性能基准与回归门禁 ---
+# 固定种子 + 固定招式 (开山斧 vs 太极剑) 的几个场景，结果存成 JSON 基线:
+#   python wuxia_bench.py run --save bench_baseline.json
+#   python wuxia_bench.py compare bench_baseline.json --threshold 0.25
+# compare 会重新跑一遍，吞吐下降超过阈值、或场景的校验值 (对局结果) 变了都算回归，退出码为 1。
+# 每个场景跑 repeat 轮，吞吐取各轮的中位数，并用每轮前后的参考负载换算成相对吞吐来判定
+# (虚拟机上整台机器的速度能漂移 30% 以上，绝对吞吐前后两次运行不可比)；
+# 看起来回归的场景会再跑一组，两组都低于阈值才判定回归。默认阈值 25%: 更小的退化请用更多 --repeat 在安静的机器上确认。
+
+SCENARIOS = {}
+
+def scenario(name, unit):
+    """注册一个场景: 函数返回 (完成的工作量, 校验值)，工作量单位为 unit"""
+    def register(func):
+        SCENARIOS[name] = (func, unit)
+        return func
+    return register
+
+# --- 场景 ---
+
+@scenario("duel_ticks", "帧/秒")
+def bench_duel_ticks(n_duels=200):
+    """单场对决逐帧推进的速度 (不经过批量封装)"""
+    p1 = create_heavy_fighter(verbose=False)
+    p2 = create_swift_fighter(verbose=False)
+    p1.compile()
+    p2.compile()
+    ticks = 0
+    wins = [0, 0, 0]
+    for seed in range(n_duels):
+        p1.reset()
+        p2.reset()
+        result = simulate_duel(p1, p2, duel_distance(seed))
+        ticks += int(round(result.duration / 0.1))
+        wins[result.winner] += 1
+    return ticks, wins
+
+@scenario("batch_duels", "场/秒")
+def bench_batch_duels(n_duels=2000):
+    """批量模式的对决吞吐"""
+    p1 = create_heavy_fighter(verbose=False)
+    p2 = create_swift_fighter(verbose=False)
+    result = run_batch(p1, p2, range(n_duels))
+    return n_duels, result.wins
+
+def create_chain_fighter(depth, name="连环计", hp=200, verbose=False):
+    """depth 层条件节点串成的判断链 (按距离阈值逐层筛选)，链尾才是动作节点"""
+    fighter = Fighter(name, hp, root_node_name="c0", verbose=verbose)
+    for k in range(depth):
+        # 距离 > 阈值时提前命中对应招式，否则继续往下判断
+        fighter.add_node(ConditionNode(f"c{k}", Condition(Cond.DISTANCE_GT, 10.0 - k * 0.1))).set_branches(f"a{k}", f"c{k + 1}" if k + 1 < depth else "tail")
+        fighter.add_node(ActionNode(f"a{k}", ActionType.ATTACK, windup=0.3, active=0.1, recovery=0.3, power=10, cost=10, atk_range=1.0))
+    fighter.add_node(ActionNode("tail", ActionType.ATTACK, windup=0.3, active=0.1, recovery=0.3, power=10, cost=10, atk_range=1.0))
+    return fighter
+
+@scenario("resolve_chain", "次解析/秒")
+def bench_resolve_chain(depth=40, n_calls=20000):
+    """get_next_action_node 穿过深条件链的开销 (每次都走到链尾)"""
+    fighter = create_chain_fighter(depth)
+    enemy = create_heavy_fighter(verbose=False)
+    fighter.compile()
+    node = None
+    for _ in range(n_calls):
+        fighter.current_node_name = fighter.root_node_name
+        node = fighter.get_next_action_node(enemy, 1.0)
+    return n_calls, node.name
+
+SCALING_SIZES = (64, 256, 1024) # arena_scaling 的在场角色数，每个规模是一个独立场景
+
+def bench_arena_scaling(n_fighters=256, n_frames=20):
+    """n_fighters 人混战 (wuxia_arena): 每帧网格选目标 + 推进，帧末再对每名存活角色做一次出手范围查询
+
+    吞吐按 “存活角色帧” 计: 角色之间的互相查找是 O(n²) 还是 O(n)，在这里直接体现为吞吐是否随规模下降。
+    """
+    arena = create_melee(n_fighters, seed=0)
+    counts = [0, 0] # 存活角色帧, 范围查询命中的敌人数
+
+    def queries(t, arena):
+        for k, fighter in enumerate(arena.fighters):
+            if fighter.hp > 0:
+                counts[0] += 1
+                counts[1] += len(arena.reachable(k))
+
+    result = arena.run(time_limit=n_frames * 0.1, on_frame=queries)
+    return counts[0], [counts[0], counts[1], sum(result.kills)]
+
+for _n in SCALING_SIZES:
+    scenario(f"arena_scaling_{_n}", "角色帧/秒")(partial(bench_arena_scaling, _n))
+
+# --- 运行与比较 ---
+
+def _calibrate(n=200000):
+    """固定的纯 Python 参考负载，返回用时 (秒)；用来抵消整台机器忽快忽慢的漂移"""
+    start = time.perf_counter()
+    table = {}
+    x = 0.0
+    for i in range(n):
+        table[i & 255] = x
+        x = x * 0.5 + i
+    return time.perf_counter() - start
+
+def run_scenario(name, repeat=5):
+    """跑一个场景 repeat 轮
+
+    rate 为各轮吞吐的中位数，best_rate 为最快一轮；relative 为相对吞吐:
+    每轮前后各跑一次参考负载，场景用时除以参考负载用时后取中位数，机器整体变慢时它基本不变。
+    """
+    if name not in SCENARIOS:
+        raise ValueError(f"未知的基准场景: {name}")
+    func, unit = SCENARIOS[name]
+    seconds = []
+    ratios = []
+    for _ in range(repeat):
+        before = _calibrate()
+        start = time.perf_counter()
+        work, check = func()
+        elapsed = time.perf_counter() - start
+        seconds.append(elapsed)
+        ratios.append(elapsed / ((before + _calibrate()) / 2))
+    return {"rate": work / statistics.median(seconds), "best_rate": work / min(seconds),
+            "relative": work / statistics.median(ratios), "unit": unit,
+            "work": work, "seconds": seconds, "check": check}
+
+def run_scenarios(names=None, repeat=5):
+    """跑指定场景 (默认全部)，返回可写入 JSON 的基线字典"""
+    results = {name: run_scenario(name, repeat) for name in names or SCENARIOS}
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "repeat": repeat,
+        "results": results,
+    }
+
+def compare(baseline, current, threshold=0.25, rerun=None):
+    """对比两份基线，返回 (报告行, 回归的场景名列表)
+
+    吞吐比基线低 threshold 以上、或校验值不同 (行为变了，吞吐已不可比) 都算回归。
+    两边都有相对吞吐 (relative) 时按它判定，否则按中位数吞吐 (旧基线)。
+    rerun(name) 给出时，吞吐看起来回归的场景再跑一组 (返回 run_scenario 的结果)，取两组中较高的吞吐再判定。
+    只在一边出现的场景只报告不判定。
+    """
+    lines = []
+    regressions = []
+    base_results = baseline["results"]
+    for name, now in current["results"].items():
+        base = base_results.get(name)
+        if base is None:
+            lines.append(f"{name:<22} {now['rate']:>14,.0f} {now['unit']}  (基线中没有)")
+            continue
+        key = "relative" if "relative" in base and "relative" in now else "rate"
+        change = now[key] / base[key] - 1
+        if change < -threshold and base["check"] == now["check"] and rerun is not None:
+            again = rerun(name)
+            if again[key] > now[key]:
+                now = current["results"][name] = again
+                change = now[key] / base[key] - 1
+        flag = ""
+        if base["check"] != now["check"]:
+            flag = f"  !! 校验值变化 {base['check']} -> {now['check']}"
+            regressions.append(name)
+        elif change < -threshold:
+            flag = "  !! 回归"
+            regressions.append(name)
+        lines.append(f"{name:<22} {base['rate']:>14,.0f} -> {now['rate']:>14,.0f} {now['unit']}  ({change:+.1%}){flag}")
+    for name in base_results:
+        if name not in current["results"]:
+            lines.append(f"{name:<22} (本次未运行)")
+    return lines, regressions
+
+def format_results(data):
+    return [f"{name:<22} {r['rate']:>14,.0f} {r['unit']}  (校验 {r['check']})" for name, r in data["results"].items()]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="战斗引擎性能基准")
+    sub = parser.add_subparsers(dest="command")
+    run_cmd = sub.add_parser("run", help="运行基准并打印结果")
+    run_cmd.add_argument("--save", help="把结果写成 JSON 基线")
+    cmp_cmd = sub.add_parser("compare", help="运行基准并与 JSON 基线比较，有回归时退出码为 1")
+    cmp_cmd.add_argument("baseline")
+    cmp_cmd.add_argument("--threshold", type=float, default=0.25, help="允许的吞吐下降比例 (默认 0.25)")
+    for cmd in (run_cmd, cmp_cmd):
+        cmd.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="只跑指定场景 (可重复)")
+        cmd.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        current = run_scenarios(args.scenario, args.repeat)
+        lines, regressions = compare(baseline, current, args.threshold, rerun=lambda name: run_scenario(name, args.repeat))
+        print("\n".join(lines))
+        if regressions:
+            print(f"\n{len(regressions)} 个场景回归: {', '.join(regressions)}")
+            return 1
+        print("\n没有回归")
+        return 0
+
+    data = run_scenarios(getattr(args, "scenario", None), getattr(args, "repeat", 5))
+    print("\n".join(format_results(data)))
+    if getattr(args, "save", None):
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        print(f"\n基线已写入 {args.save}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
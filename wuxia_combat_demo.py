@@ -1,6 +1,11 @@
+import json
 import time
 import random
 
+import wuxia_flowio
+from wuxia_condition import Condition, Cond, TURN_BASED_KINDS
+from wuxia_trace import Ev, render_event
+
 # --- 核心定义 ---
 
 class ActionType:
@@ -9,13 +14,22 @@ class ActionType:
     DODGE = "闪避"
     WAIT = "观望"
 
+ACTION_CODES = (ActionType.ATTACK, ActionType.DEFEND, ActionType.DODGE, ActionType.WAIT) # 与时间轴引擎的编码顺序一致
+
+# 简单的命中判定: 命中率只取决于敌人当前的招式类型
+BASE_HIT_CHANCE = 0.8
+HIT_CHANCE = {ActionType.DEFEND: 0.2, ActionType.DODGE: 0.0}
+
+def hit_chance(enemy_action):
+    return HIT_CHANCE.get(enemy_action, BASE_HIT_CHANCE)
+
 class Node:
     """招式节点"""
     def __init__(self, name):
         self.name = name
     
-    def execute(self, me, enemy):
-        """返回 (Result, Next_Node_Name)"""
+    def execute(self, me, enemy, rng):
+        """返回 (Result, Next_Node_Name)；rng 为本场对决独立的随机数流"""
         pass
 
 class ActionNode(Node):
@@ -31,33 +45,26 @@ class ActionNode(Node):
         self.next_node = node_name
         return self
 
-    def execute(self, me, enemy):
+    def execute(self, me, enemy, rng):
         # 更新自身状态
         me.current_action = self.action_type
 
-        # 简单的命中判定逻辑
-        hit_chance = 0.8
-        if enemy.current_action == ActionType.DEFEND:
-            hit_chance = 0.2
-        elif enemy.current_action == ActionType.DODGE:
-            hit_chance = 0.0
-        
         success = False
         damage = 0
         
         if self.action_type == ActionType.ATTACK:
-            if random.random() < hit_chance:
+            if rng.random() < hit_chance(enemy.current_action):
                 success = True
                 damage = self.power
                 enemy.hp -= damage
-                log(f"  > {me.name} 【{self.name}】 命中! 造成 {damage} 点伤害")
+                if me.verbose or me.trace is not None: me.emit(Ev.TURN_HIT, self, damage)
             else:
-                log(f"  > {me.name} 【{self.name}】 被化解/未命中!")
+                if me.verbose or me.trace is not None: me.emit(Ev.TURN_MISS, self)
         elif self.action_type == ActionType.DEFEND:
             success = True # 防御总是成功的动作（虽然效果取决于敌人）
-            log(f"  > {me.name} 架起防御姿态")
+            if me.verbose or me.trace is not None: me.emit(Ev.TURN_GUARD, self)
         else:
-            log(f"  > {me.name} 正在 {self.action_type}")
+            if me.verbose or me.trace is not None: me.emit(Ev.TURN_STANCE, self, ACTION_CODES.index(self.action_type))
             success = True
 
         return success, self.next_node
@@ -66,6 +73,8 @@ class ConditionNode(Node):
     """【判】节点：逻辑分支"""
     def __init__(self, name, check_func):
         super().__init__(name)
+        if isinstance(check_func, Condition) and check_func.kind not in TURN_BASED_KINDS:
+            raise ValueError(f"【{name}】的条件 {check_func.kind} 读取距离/耐力/状态，回合制角色没有这些属性")
         self.check_func = check_func
         self.true_node = None
         self.false_node = None
@@ -75,31 +84,46 @@ class ConditionNode(Node):
         self.false_node = false_name
         return self
 
-    def execute(self, me, enemy):
+    def execute(self, me, enemy, rng):
         result = self.check_func(me, enemy)
         next_node = self.true_node if result else self.false_node
-        log(f"  ? {me.name} 思考: {self.name}? -> {'是' if result else '否'}")
+        if me.verbose or me.trace is not None: me.emit(Ev.TURN_THINK, self, 1.0 if result else 0.0)
         return result, next_node
 
 # --- 角色与系统 ---
 
-def log(msg):
-    print(msg)
-
 class Fighter:
-    def __init__(self, name, hp):
+    def __init__(self, name, hp, verbose=True):
         self.name = name
-        self.hp = hp
+        self.max_hp = hp
+        self.verbose = verbose # 关闭后各招式不再拼接/打印日志文字
         self.nodes = {} # 存储所有招式节点
+        self.trace = None # wuxia_trace.CombatTrace，为 None 时不记录任何事件
+        self.trace_id = 0
+        self.reset()
+
+    def reset(self):
+        """重置运行时状态，招式链保持不变 (同一角色可反复开打)"""
+        self.hp = self.max_hp
         self.current_node_name = "start" # 当前执行到的节点
         self.current_action = ActionType.WAIT
+        self.turn = 0 # 已行动的回合数 (事件的时间戳)
+
+    def emit(self, code, node, a=0.0):
+        """记录一条结构化事件 (与时间轴引擎共用 wuxia_trace 的事件码)；文字只在 verbose 时才渲染"""
+        if self.trace is not None:
+            self.trace.record(self.turn, self.trace_id, code, node, a, 0.0, 0.0)
+        if self.verbose:
+            prefix = "?" if code == Ev.TURN_THINK else ">"
+            print(f"  {prefix} {self.name} {render_event(code, node.name, a, 0.0, 0.0)}")
     
     def add_node(self, node):
         self.nodes[node.name] = node
         return node
 
-    def step(self, enemy):
+    def step(self, enemy, rng):
         if self.hp <= 0: return
+        self.turn += 1
         
         if self.current_node_name not in self.nodes:
             # 招式链结束，重置回开头
@@ -109,30 +133,200 @@ class Fighter:
         
         # 执行节点逻辑
         # 注意：这里简化了，实际游戏中【动】节点会消耗时间帧，而【判】节点是瞬时的
-        _, next_name = current_node.execute(self, enemy)
+        _, next_name = current_node.execute(self, enemy, rng)
         
         self.current_node_name = next_name
 
+# --- 随机数流 ---
+
+class RecordingRandom(random.Random):
+    """记录每次 random() 的结果，按回合分组 (用于生成回放)"""
+    def __init__(self, seed):
+        super().__init__(seed)
+        self.turns = []
+
+    def new_turn(self):
+        self.turns.append([])
+
+    def random(self):
+        value = super().random()
+        self.turns[-1].append(value)
+        return value
+
+class ReplayRandom:
+    """按回放文件里记录的数值依次返回，次数对不上说明招式链或逻辑已经变了"""
+    def __init__(self, turns):
+        self.turns = turns
+        self.turn = -1
+        self.pos = 0
+
+    def new_turn(self):
+        if self.turn >= 0 and self.pos != len(self.turns[self.turn]):
+            raise ValueError(f"回合 {self.turn + 1} 的随机数没有用完，回放与当前逻辑不一致")
+        self.turn += 1
+        self.pos = 0
+
+    def random(self):
+        draws = self.turns[self.turn]
+        if self.pos >= len(draws):
+            raise ValueError(f"回合 {self.turn + 1} 的随机数不够用，回放与当前逻辑不一致")
+        self.pos += 1
+        return draws[self.pos - 1]
+
 # --- 战斗模拟 ---
 
-def run_simulation():
-    p1 = Fighter("赵无极 (莽夫流)", 100)
-    p2 = Fighter("张三丰 (太极AI)", 100)
+class DuelResult:
+    """单场对决的结果 (winner: 1/2 为获胜方，0 为平局)"""
+    def __init__(self, p1, p2, turns):
+        if p1.hp > p2.hp: self.winner = 1
+        elif p2.hp > p1.hp: self.winner = 2
+        else: self.winner = 0
+        self.turns = turns
+        self.hp = (p1.hp, p2.hp)
+
+def simulate_duel(p1, p2, seed, max_turns=10, on_turn=None, rng=None, trace=None):
+    """运行一场对决并返回 DuelResult
+
+    每场对决使用自己的 random.Random(seed)，不读写全局随机状态，结果只由种子决定。
+    rng 可以替换成 RecordingRandom / ReplayRandom (需提供 new_turn)；
+    on_turn(turn, p1, p2) 在每回合开始前调用，只用于显示。
+    trace: wuxia_trace.CombatTrace，给出时本场的结构化事件都记录到其中 (时间为回合数)。
+    """
+    if rng is None:
+        rng = random.Random(seed)
+    new_turn = getattr(rng, "new_turn", None)
+    turn = 0
+    if trace is not None:
+        trace.attach(p1, p2)
+    try:
+        while turn < max_turns and p1.hp > 0 and p2.hp > 0:
+            turn += 1
+            if new_turn is not None:
+                new_turn()
+            if on_turn is not None:
+                on_turn(turn, p1, p2)
+            # 双方同时行动 (简化处理，先结算P1动作更新状态，再结算P2)
+            # 实际游戏中应该是基于时间轴的并发
+            p1.step(p2, rng)
+            # P2 行动 (P2会读取P1当前状态)
+            p2.step(p1, rng)
+    finally:
+        if trace is not None:
+            trace.detach(p1, p2)
+    return DuelResult(p1, p2, turn)
+
+def run_batch(p1, p2, seeds, max_turns=10):
+    """按种子区间批量对决 (无输出)，返回 [平局, P1胜, P2胜] 的场数
+
+    每个种子对应一场独立的对决，种子块可以放心地拆给不同进程。
+    """
+    wins = [0, 0, 0]
+    verbose = (p1.verbose, p2.verbose)
+    p1.verbose = p2.verbose = False
+    try:
+        for seed in seeds:
+            p1.reset()
+            p2.reset()
+            wins[simulate_duel(p1, p2, seed, max_turns).winner] += 1
+    finally:
+        p1.verbose, p2.verbose = verbose
+    return wins
+
+# --- 回放 ---
+
+def _make_fighter(name, hp, root, verbose):
+    if root != "start":
+        raise ValueError(f"回合制角色总是从 'start' 开始，不支持根节点 '{root}'")
+    return Fighter(name, hp, verbose=verbose)
+
+def _action_type(value):
+    # 显示名 ("攻击") 或常量名 ("ATTACK")
+    if value in (ActionType.ATTACK, ActionType.DEFEND, ActionType.DODGE, ActionType.WAIT):
+        return value
+    return {"ATTACK": ActionType.ATTACK, "DEFEND": ActionType.DEFEND, "DODGE": ActionType.DODGE, "WAIT": ActionType.WAIT}[value]
 
-    # === 构建 P1 的招式链: 莽夫三板斧 ===
-    # 逻辑: 刺 -> 砍 -> 劈 -> (循环)
+# 与时间轴引擎共用 wuxia_flowio 的格式，只是数值参数不同
+FLOW_SCHEMA = wuxia_flowio.FlowSchema(_make_fighter, ActionNode, ConditionNode, ("power", "speed"),
+                                      ("next_node", "true_node", "false_node"), lambda action_type: action_type, _action_type)
+
+def flow_to_dict(fighter):
+    """把招式链序列化成纯数据 (条件节点必须是声明式 Condition)"""
+    return wuxia_flowio.flow_to_dict(fighter, FLOW_SCHEMA)
+
+def flow_from_dict(data, verbose=True):
+    return wuxia_flowio.flow_from_dict(data, FLOW_SCHEMA, verbose)
+
+class Replay:
+    """一场对决的回放: 种子 + 双方招式链 + 每回合的随机数 + 结果"""
+    def __init__(self, seed, flows, draws, max_turns, winner, hp):
+        self.seed = seed
+        self.flows = flows
+        self.draws = draws
+        self.max_turns = max_turns
+        self.winner = winner
+        self.hp = hp
+
+    @classmethod
+    def record(cls, p1, p2, seed, max_turns=10):
+        """跑一场并记录 (会先 reset 双方)"""
+        flows = [flow_to_dict(p1), flow_to_dict(p2)]
+        p1.reset()
+        p2.reset()
+        rng = RecordingRandom(seed)
+        result = simulate_duel(p1, p2, seed, max_turns, rng=rng)
+        return cls(seed, flows, rng.turns, max_turns, result.winner, list(result.hp))
+
+    def fighters(self, verbose=False):
+        return flow_from_dict(self.flows[0], verbose), flow_from_dict(self.flows[1], verbose)
+
+    def run(self, use_draws=True, verbose=False, on_turn=None):
+        """单独重跑这一场；use_draws 为 False 时改用种子重新生成随机数"""
+        p1, p2 = self.fighters(verbose)
+        rng = ReplayRandom(self.draws) if use_draws else None
+        result = simulate_duel(p1, p2, self.seed, self.max_turns, on_turn, rng)
+        if rng is not None:
+            rng.new_turn() # 校验最后一回合的随机数也恰好用完
+        return result
+
+    def verify(self):
+        """用记录的随机数和种子各重跑一次，结果都应与记录一致"""
+        expected = (self.winner, tuple(self.hp))
+        return all((r.winner, r.hp) == expected for r in (self.run(True), self.run(False)))
+
+    def to_dict(self):
+        return {"seed": self.seed, "max_turns": self.max_turns, "flows": self.flows,
+                "draws": self.draws, "winner": self.winner, "hp": self.hp}
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["seed"], data["flows"], data["draws"], data["max_turns"], data["winner"], data["hp"])
+
+# --- 预设流派 ---
+
+def create_brute_fighter(name="赵无极 (莽夫流)", hp=100, verbose=True):
+    """莽夫三板斧: 刺 -> 砍 -> 劈 -> (循环)"""
+    p1 = Fighter(name, hp, verbose=verbose)
     p1.add_node(ActionNode("start", ActionType.ATTACK, power=10)).set_next("move2")
     p1.add_node(ActionNode("move2", ActionType.ATTACK, power=15)).set_next("move3")
     p1.add_node(ActionNode("move3", ActionType.ATTACK, power=20)).set_next("start")
+    return p1
+
+def create_taiji_fighter(name="张三丰 (太极AI)", hp=100, verbose=True):
+    """智能反击流
+    start: 敌人是否在攻击?
+      Yes -> 格挡 -> (下一招)反击
+      No  -> 试探性攻击
+    """
+    p2 = Fighter(name, hp, verbose=verbose)
 
-    # === 构建 P2 的招式链: 智能反击流 ===
-    # 逻辑: 
-    # start: 敌人是否在攻击? 
-    #   Yes -> 格挡 -> (下一招)反击
-    #   No  -> 试探性攻击
-    
     # 1. 定义节点
-    check_enemy_atk = ConditionNode("敌方在攻击吗", lambda m, e: e.current_action == ActionType.ATTACK)
+    check_enemy_atk = ConditionNode("敌方在攻击吗", Condition(Cond.ENEMY_ACTION_TYPE, ActionType.ATTACK))
     defend_move = ActionNode("太极·云手(防)", ActionType.DEFEND)
     counter_atk = ActionNode("太极·搬拦捶(反)", ActionType.ATTACK, power=25) # 反击伤害高
     poke_atk = ActionNode("武当剑(试探)", ActionType.ATTACK, power=5)
@@ -148,30 +342,30 @@ def run_simulation():
     p2.nodes["defend"] = defend_move
     p2.nodes["counter"] = counter_atk
     p2.nodes["poke"] = poke_atk
+    return p2
 
-    # === 开始战斗 ===
-    print(f"--- 战斗开始: {p1.name} VS {p2.name} ---")
-    
-    for turn in range(1, 11): # 模拟10个回合
-        if p1.hp <= 0 or p2.hp <= 0: break
-        
+def run_simulation(seed=None, pace=0.5):
+    """逐回合打印一场对决；pace 只影响显示节奏，不参与模拟 (None 时随机取种子)"""
+    if seed is None:
+        seed = random.randrange(1 << 32)
+    p1 = create_brute_fighter()
+    p2 = create_taiji_fighter()
+
+    print(f"--- 战斗开始: {p1.name} VS {p2.name} (种子 {seed}) ---")
+
+    def show_turn(turn, p1, p2):
+        if turn > 1:
+            print(f"状态: {p1.name} HP:{p1.hp} | {p2.name} HP:{p2.hp}")
+            if pace: time.sleep(pace)
         print(f"\n[回合 {turn}]")
-        # 双方同时行动 (简化处理，先结算P1动作更新状态，再结算P2)
-        # 实际游戏中应该是基于时间轴的并发
-        
-        # P1 行动
-        p1.step(p2)
-        
-        # P2 行动 (P2会读取P1当前状态)
-        p2.step(p1)
-        
-        print(f"状态: {p1.name} HP:{p1.hp} | {p2.name} HP:{p2.hp}")
-        time.sleep(0.5)
+
+    result = simulate_duel(p1, p2, seed, on_turn=show_turn)
+    print(f"状态: {p1.name} HP:{p1.hp} | {p2.name} HP:{p2.hp}")
 
     print("\n--- 战斗结束 ---")
-    if p1.hp > p2.hp: print(f"胜者: {p1.name}")
-    elif p2.hp > p1.hp: print(f"胜者: {p2.name}")
+    if result.winner == 1: print(f"胜者: {p1.name}")
+    elif result.winner == 2: print(f"胜者: {p2.name}")
     else: print("平局")
 
 if __name__ == "__main__":
-    run_simulation()
\ No newline at end of file
+    run_simulation()
@@ -0,0 +1,131 @@
+from wuxia_timeline_demo import State, ActionType
+
+# --- 声明式条件 (对应 GDD 中观望节点的条件分支) ---
+# ConditionNode 的 check_func 可以直接传入 Condition 对象代替 lambda:
+#   - 可以 pickle (多进程对阵矩阵)
+#   - 标量引擎编译成按类型特化的求值函数 (me, enemy, distance) -> bool
+#   - 批量引擎求值成布尔掩码，同一帧内相同 (类型, 参数) 的条件只算一次
+
+class Cond:
+    ALWAYS_TRUE = "ALWAYS_TRUE"               # 无条件跳转
+    DISTANCE_GT = "DISTANCE_GT"               # 距离 > param
+    DISTANCE_LT = "DISTANCE_LT"               # 距离 < param
+    MY_HP_LT = "MY_HP_LT"                     # 自身生命 < param
+    MY_STAMINA_LT = "MY_STAMINA_LT"           # 自身耐力 < param
+    ENEMY_HP_LT = "ENEMY_HP_LT"               # 敌人生命 < param
+    ENEMY_STAMINA_LT = "ENEMY_STAMINA_LT"     # 敌人耐力 < param
+    ENEMY_STATE_WINDUP = "ENEMY_STATE_WINDUP" # 敌人处于攻击前摇 (抓前摇，param 忽略)
+    ENEMY_ACTION_TYPE = "ENEMY_ACTION_TYPE"   # 敌人当前招式类型 == param (ActionType)
+
+# 回合制引擎 (wuxia_combat_demo / wuxia_markov) 的角色只有生命和当前招式类型，没有距离、耐力和状态，
+# 只能使用下面这几类条件；其余类型在回合制的 ConditionNode 构造时就会被拒绝
+TURN_BASED_KINDS = frozenset({Cond.ALWAYS_TRUE, Cond.MY_HP_LT, Cond.ENEMY_HP_LT, Cond.ENEMY_ACTION_TYPE})
+
+def _action_type(fighter):
+    """当前招式类型 (时间轴角色读 current_action_node，回合制角色读 current_action)"""
+    node = getattr(fighter, "current_action_node", None)
+    if node is not None:
+        return node.action_type
+    return getattr(fighter, "current_action", None)
+
+class Condition:
+    """一个声明式条件 (类型 + 阈值)，可直接作为 ConditionNode 的 check_func"""
+    def __init__(self, kind, param=0.0):
+        if kind not in _EVALUATORS:
+            raise ValueError(f"未知的条件类型: {kind}")
+        self.kind = kind
+        self.param = param
+
+    @property
+    def key(self):
+        """读取相同输入、结果必然相同的条件共享同一个 key (用于帧内缓存)"""
+        if self.kind in (Cond.ALWAYS_TRUE, Cond.ENEMY_STATE_WINDUP):
+            return (self.kind,)
+        return (self.kind, self.param)
+
+    def compile(self):
+        """返回按类型特化的求值函数 f(me, enemy, distance) -> bool"""
+        return _EVALUATORS[self.kind](self.param)
+
+    def __call__(self, me, enemy, distance=None):
+        return self.compile()(me, enemy, distance)
+
+    def mask(self, inputs):
+        """对一批对局求值，返回布尔数组 (inputs 见 MaskInputs)"""
+        return _MASKS[self.kind](inputs, self.param)
+
+    def __eq__(self, other):
+        return isinstance(other, Condition) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        if len(self.key) == 1:
+            return f"Condition({self.kind})"
+        return f"Condition({self.kind}, {self.param!r})"
+
+# --- 标量求值 ---
+
+def _enemy_windup(me, enemy, distance):
+    node = enemy.current_action_node
+    return enemy.state == State.WINDUP and node is not None and node.action_type == ActionType.ATTACK
+
+_EVALUATORS = {
+    Cond.ALWAYS_TRUE: lambda p: lambda me, enemy, distance: True,
+    Cond.DISTANCE_GT: lambda p: lambda me, enemy, distance: distance > p,
+    Cond.DISTANCE_LT: lambda p: lambda me, enemy, distance: distance < p,
+    Cond.MY_HP_LT: lambda p: lambda me, enemy, distance: me.hp < p,
+    Cond.MY_STAMINA_LT: lambda p: lambda me, enemy, distance: me.stamina < p,
+    Cond.ENEMY_HP_LT: lambda p: lambda me, enemy, distance: enemy.hp < p,
+    Cond.ENEMY_STAMINA_LT: lambda p: lambda me, enemy, distance: enemy.stamina < p,
+    Cond.ENEMY_STATE_WINDUP: lambda p: _enemy_windup,
+    Cond.ENEMY_ACTION_TYPE: lambda p: lambda me, enemy, distance: _action_type(enemy) == p,
+}
+
+# --- 批量求值 ---
+
+class MaskInputs:
+    """批量条件求值的输入 (每个字段都是长度为 n 的数组)
+
+    enemy_windup: 敌人是否处于前摇；enemy_action_type: 敌人当前招式类型编码 (-1 表示无)，
+    action_codes 把 ActionType 映射到该编码。
+    """
+    def __init__(self, distance, my_hp, my_stamina, enemy_hp, enemy_stamina, enemy_windup, enemy_action_type, action_codes):
+        self.distance = distance
+        self.my_hp = my_hp
+        self.my_stamina = my_stamina
+        self.enemy_hp = enemy_hp
+        self.enemy_stamina = enemy_stamina
+        self.enemy_windup = enemy_windup
+        self.enemy_action_type = enemy_action_type
+        self.action_codes = action_codes
+
+def _always(inputs, p):
+    import numpy as np
+    return np.ones(len(inputs.distance), dtype=bool)
+
+_MASKS = {
+    Cond.ALWAYS_TRUE: _always,
+    Cond.DISTANCE_GT: lambda inputs, p: inputs.distance > p,
+    Cond.DISTANCE_LT: lambda inputs, p: inputs.distance < p,
+    Cond.MY_HP_LT: lambda inputs, p: inputs.my_hp < p,
+    Cond.MY_STAMINA_LT: lambda inputs, p: inputs.my_stamina < p,
+    Cond.ENEMY_HP_LT: lambda inputs, p: inputs.enemy_hp < p,
+    Cond.ENEMY_STAMINA_LT: lambda inputs, p: inputs.enemy_stamina < p,
+    Cond.ENEMY_STATE_WINDUP: lambda inputs, p: inputs.enemy_windup & (inputs.enemy_action_type == inputs.action_codes[ActionType.ATTACK]),
+    Cond.ENEMY_ACTION_TYPE: lambda inputs, p: inputs.enemy_action_type == inputs.action_codes[p],
+}
+
+class MaskCache:
+    """一帧之内的掩码缓存: 多个条件节点读取相同输入时只求值一次"""
+    def __init__(self, inputs):
+        self.inputs = inputs
+        self.masks = {}
+
+    def get(self, condition):
+        key = condition.key
+        mask = self.masks.get(key)
+        if mask is None:
+            mask = self.masks[key] = condition.mask(self.inputs)
+        return mask
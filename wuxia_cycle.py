@@ -0,0 +1,261 @@
+import time
+
+from wuxia_condition import Cond
+from wuxia_memo import tick_times
+from wuxia_trace import Ev
+from wuxia_timeline_demo import (Fighter, ActionNode, ActionType, ConditionNode, DistanceManager, DuelResult,
+                                 simulate_duel, create_heavy_fighter, create_swift_fighter)
+
+# --- 循环检测 (僵局提前结束) ---
+# 被动的招式图经常陷入周期: 比如双方都在闪避后撤，谁也够不着谁，一直耗到 60 秒时限。
+# 逐帧推进的同时用 Brent 法检测组合局面的重复: 在第 1、2、4、8... 帧存下局面，之后每帧与之比较，
+# 相等即找到周期 P。引擎不读绝对时间，所以此后的走向就是这一个周期的无限重复:
+#   - 一个周期内没人受伤: 直接判为超时平局
+#   - 每个周期伤害固定: 按周期内各帧的伤害顺序逐次扣血 (不再推进状态)，算出哪一帧有人倒下
+# 逐次扣血与逐帧模拟的浮点运算完全相同，结果逐位一致。
+# 招式图里有读取生命值的条件 (MY_HP_LT / ENEMY_HP_LT 或无法分析的 lambda) 时，生命值计入局面，
+# 只能识别生命不变的周期。
+#
+# 双方越退越远时距离每个周期都在变，局面按原值永远不会重复。但引擎对距离只做 “是否小于某个阈值” 的比较
+# (射程 + 突进、射程、击退距离、0.5m 下限)，阈值都不超过 far_distance()。所以没有条件节点读取距离时，
+# 超出这个范围的距离在局面里一律记成 “远”。这样两次局面相同，还要同时满足以下两点才算找到周期:
+#   - 这段周期里每次 update 后的距离都在范围外 (所有比较都落在 “远” 的一边)
+#   - 周期结束时的距离不比开始时近
+# 浮点加减是单调的，往后每个周期的距离都不小于第一个周期的对应帧，比较结果不变，走向就是这个周期的重复。
+
+_HP_CONDITIONS = frozenset((Cond.MY_HP_LT, Cond.ENEMY_HP_LT))
+_DISTANCE_CONDITIONS = frozenset((Cond.DISTANCE_GT, Cond.DISTANCE_LT))
+_FAR = float("inf") # 局面里 “远” 的记法
+_HIT_EVENTS = frozenset((Ev.DAMAGE, Ev.DODGE_IMMUNE, Ev.STUN, Ev.POISE_HOLD)) # take_damage 必发其一，a=伤害
+
+def reads_hp(fighter):
+    """招式图的走向是否可能依赖生命值 (lambda 条件无法分析，按依赖处理)"""
+    for node in fighter.nodes.values():
+        if isinstance(node, ConditionNode):
+            kind = getattr(node.check_func, "kind", None)
+            if kind is None or kind in _HP_CONDITIONS:
+                return True
+    return False
+
+def far_distance(*fighters):
+    """超过这个距离后引擎的所有距离比较都与具体数值无关；有条件节点可能读取距离 (含 lambda) 时返回 None"""
+    limit = 0.5 # 突进/移动后的距离下限
+    for fighter in fighters:
+        for node in fighter.nodes.values():
+            if isinstance(node, ConditionNode):
+                kind = getattr(node.check_func, "kind", None)
+                if kind is None or kind in _DISTANCE_CONDITIONS:
+                    return None
+            else:
+                limit = max(limit, node.atk_range + max(node.dash, 0.0), node.atk_range, node.knockback)
+    return limit
+
+class _HitLog:
+    """挂在 Fighter.trace 上，按帧号记下每次受到的伤害和僵直: (帧号, 受击方, 伤害, 是否僵直)"""
+    def __init__(self):
+        self.tick = 0
+        self.hits = []
+
+    def record(self, t, actor, code, node, a, b, c):
+        if code in _HIT_EVENTS:
+            self.hits.append((self.tick, actor, a, code == Ev.STUN))
+
+def _state_key(p1, p2, distance):
+    node1 = p1.current_action_node
+    node2 = p2.current_action_node
+    return (p1.state, p1.state_timer, p1.stun_duration, p1.current_node_name,
+            id(node1) if node1 is not None else 0, p1.poise_damage_accumulator, p1.stamina,
+            p2.state, p2.state_timer, p2.stun_duration, p2.current_node_name,
+            id(node2) if node2 is not None else 0, p2.poise_damage_accumulator, p2.stamina,
+            distance)
+
+def _state_key_hp(p1, p2, distance):
+    return _state_key(p1, p2, distance) + (p1.hp, p2.hp)
+
+class CycleStats:
+    """循环检测的统计 (可传给多场对决累加)"""
+    def __init__(self):
+        self.duels = 0
+        self.cycles = 0          # 检测到周期的场数
+        self.draws = 0           # 其中最终判为平局的场数
+        self.ticks_simulated = 0 # 实际逐帧推进的帧数
+        self.ticks_skipped = 0   # 靠周期外推省掉的帧数
+
+    def summary(self):
+        total = self.ticks_simulated + self.ticks_skipped
+        skipped = self.ticks_skipped / total if total else 0.0
+        return (f"对局 {self.duels}  检测到周期 {self.cycles} 场 (其中平局 {self.draws})  "
+                f"逐帧 {self.ticks_simulated} 帧  省掉 {self.ticks_skipped} 帧 ({skipped:.1%})")
+
+def _extrapolate(p1, p2, cycle_hits, period, tick, limit):
+    """周期从第 tick 帧起无限重复，按周期内的伤害顺序逐次扣血，返回对局结束时已推进的帧数
+
+    cycle_hits: [(周期内偏移, [(受击方, 伤害, 是否僵直)...])]，偏移递增，同一帧内按发生顺序排列。
+    同一帧里 P1 先行动 (P2 受击的记录在前)；P2 若已被击倒，本帧不再行动，它造成的伤害不计。
+    到时限仍未分出胜负时返回 limit。
+    """
+    fighters = (p1, p2)
+    base = tick
+    while True:
+        for offset, hits in cycle_hits:
+            at = base + offset
+            if at >= limit:
+                return limit
+            for victim, damage, stunned in hits:
+                if victim == 0 and p2.hp <= 0:
+                    break
+                target = fighters[victim]
+                target.hp -= damage
+                target.damage_taken += damage
+                if stunned:
+                    target.stun_count += 1
+            if p1.hp <= 0 or p2.hp <= 0:
+                return at + 1
+        base += period
+
+def simulate_duel_cycles(p1, p2, initial_distance=3.0, dt=0.1, time_limit=60.0, stats=None):
+    """与 simulate_duel 结果逐位一致，但发现局面进入周期后不再逐帧推进
+
+    要求双方关闭 verbose、未挂 CombatTrace (外推的那段不会产生事件)。
+    检测到周期后 DuelResult 的各项都是精确的，但 Fighter 的其余运行时状态停在检测到周期的时刻。
+    """
+    if p1.verbose or p2.verbose or p1.trace is not None or p2.trace is not None:
+        raise ValueError("循环检测模式下不能输出日志或记录事件")
+    key_of = _state_key_hp if reads_hp(p1) or reads_hp(p2) else _state_key
+    times = tick_times(dt, time_limit)
+    limit = len(times) - 1
+    dist_mgr = DistanceManager(initial_distance)
+    log = _HitLog()
+    saved = (p1.trace, p2.trace, p1.trace_id, p2.trace_id)
+    p1.trace = p2.trace = log
+    p1.trace_id, p2.trace_id = 0, 1
+
+    far = far_distance(p1, p2)
+    if far is None:
+        far = _FAR # 距离可能被条件读取: 按原值比较
+
+    def seen_distance():
+        distance = dist_mgr.distance
+        return _FAR if distance > far else distance
+
+    saved_key = key_of(p1, p2, seen_distance())
+    saved_probe = (seen_distance(), p1.state_timer, p2.state_timer)
+    saved_distance = dist_mgr.distance
+    saved_tick = 0
+    saved_hits = 0
+    next_save = 1
+    near_tick = -1 # 最近一次 update 后距离在范围内的帧
+    tick = 0
+    cycle = None
+    try:
+        while p1.hp > 0 and p2.hp > 0 and tick < limit:
+            log.tick = tick
+            t = times[tick]
+            p1.update(dt, p2, t, dist_mgr)
+            if dist_mgr.distance <= far:
+                near_tick = tick
+            p2.update(dt, p1, t, dist_mgr)
+            if dist_mgr.distance <= far:
+                near_tick = tick
+            tick += 1
+            if p1.hp <= 0 or p2.hp <= 0:
+                break
+            # 先比较最常变化的几个字段，全部相等时才构造完整局面 (大多数帧到这里就被排除)
+            distance = seen_distance()
+            if (distance == saved_probe[0] and p1.state_timer == saved_probe[1]
+                    and p2.state_timer == saved_probe[2] and key_of(p1, p2, distance) == saved_key
+                    and (distance != _FAR or (near_tick < saved_tick and dist_mgr.distance >= saved_distance))):
+                cycle = (tick - saved_tick, log.hits[saved_hits:])
+                break
+            if tick == next_save: # Brent 法: 在 2 的幂次帧更新参照局面
+                saved_key, saved_tick, saved_hits = key_of(p1, p2, distance), tick, len(log.hits)
+                saved_probe = (distance, p1.state_timer, p2.state_timer)
+                saved_distance = dist_mgr.distance
+                next_save *= 2
+    finally:
+        p1.trace, p2.trace, p1.trace_id, p2.trace_id = saved
+
+    end = tick
+    if cycle is not None:
+        period, hits = cycle
+        grouped = {}
+        for at, victim, damage, stunned in hits:
+            grouped.setdefault(at - (tick - period), []).append((victim, damage, stunned))
+        if any(damage for hits_at in grouped.values() for _, damage, _ in hits_at):
+            end = _extrapolate(p1, p2, sorted(grouped.items()), period, tick, limit)
+        else:
+            # 周期内没有实际伤害: 一路重复到时限 (零伤害命中仍可能累计僵直次数)
+            cycles, rest = divmod(limit - tick, period)
+            for offset, hits_at in grouped.items():
+                count = cycles + (1 if offset < rest else 0)
+                for victim, _, stunned in hits_at:
+                    if stunned:
+                        (p1, p2)[victim].stun_count += count
+            end = limit
+    if stats is not None:
+        stats.duels += 1
+        stats.ticks_simulated += tick
+        if cycle is not None:
+            stats.cycles += 1
+            stats.ticks_skipped += end - tick
+            if p1.hp > 0 and p2.hp > 0:
+                stats.draws += 1
+
+    if p1.hp <= 0: winner = 2
+    elif p2.hp <= 0: winner = 1
+    else: winner = 0
+    return DuelResult(winner, times[end], p1, p2)
+
+if __name__ == "__main__":
+    from wuxia_batch import duel_distance
+
+    def single_move(name, action_type, **params):
+        fighter = Fighter(name, 200, verbose=False)
+        fighter.add_node(ActionNode("start", action_type, **params))
+        return fighter
+
+    def guard(name, stamina_regen=20.0):
+        fighter = single_move(name, ActionType.DEFEND, windup=0.0, active=1.0, recovery=0.0, power=0, cost=0, atk_range=0, knockback=0, toughness=50)
+        fighter.stamina_regen = stamina_regen
+        return fighter
+
+    def retreat(name):
+        # 原地闪避后撤，从不上前: 距离越拉越远，只有把远处的距离记成 “远” 才会出现重复局面
+        return single_move(name, ActionType.DODGE, atk_range=0, backdash=1.5)
+
+    def poke(name):
+        return single_move(name, ActionType.ATTACK, windup=0.4, active=0.1, recovery=0.4, power=10, cost=5, atk_range=0.8, dash=0.5, knockback=1.0)
+
+    matchups = [
+        (create_heavy_fighter(verbose=False), create_swift_fighter(verbose=False)),
+        # 铁桶阵开局受身耗掉的耐力要在几秒内回满，之后局面才会重复 (回复慢时耐力一直在变，到被磨死都没有周期)
+        (poke("试探"), guard("铁桶阵", stamina_regen=50.0)),
+        (guard("金钟罩"), guard("铁布衫")),
+        (retreat("梯云纵"), retreat("凌波微步")),
+    ]
+    expect_cycles = {"铁桶阵", "铁布衫", "凌波微步"} # 这几组必须检测到周期，否则演示就失去了意义
+    n = 500
+    for p1, p2 in matchups:
+        start = time.perf_counter()
+        plain = []
+        for seed in range(n):
+            p1.reset()
+            p2.reset()
+            r = simulate_duel(p1, p2, duel_distance(seed))
+            plain.append((r.winner, r.duration, r.hp, r.damage_dealt, r.stuns))
+        plain_time = time.perf_counter() - start
+
+        stats = CycleStats()
+        start = time.perf_counter()
+        same = True
+        for seed in range(n):
+            p1.reset()
+            p2.reset()
+            r = simulate_duel_cycles(p1, p2, duel_distance(seed), stats=stats)
+            same = same and plain[seed] == (r.winner, r.duration, r.hp, r.damage_dealt, r.stuns)
+        cycle_time = time.perf_counter() - start
+        print(f"{p1.name} vs {p2.name}: 逐帧 {plain_time:.2f}s  |  循环检测 {cycle_time:.2f}s  "
+              f"(加速 {plain_time / cycle_time:.1f}x, 结果{'一致' if same else '不一致!'})")
+        print(f"  {stats.summary()}")
+        if p2.name in expect_cycles and not stats.cycles:
+            raise SystemExit(f"{p1.name} vs {p2.name} 没有检测到任何周期")
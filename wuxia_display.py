@@ -0,0 +1,202 @@
+import argparse
+import io
+import sys
+import time
+from contextlib import redirect_stdout
+
+from wuxia_trace import NAMES, render_event
+from wuxia_timeline_demo import State, simulate_duel, print_frame, create_heavy_fighter, create_swift_fighter
+
+# --- 逐帧状态显示 ---
+# 原来每 0.1s 打印一次双方状态，一场 60s 的对决就是 1200 行，真正有意思的只是其中几次出招和受击。
+# 这里把模拟和显示拆开: 引擎每帧通过 on_frame 把状态快照 (只是几个数) 放进定长环形缓冲，
+# 事件通过 trace 钩子挂到当前帧上；缓冲满了或对局结束时，渲染器才把需要显示的帧格式化成文字，
+# 攒成一次写入交给输出端。不显示的帧在入缓冲时就被跳过，不做任何字符串格式化。
+#
+# 显示模式:
+#   events: 只显示有事件 (出招、受击、僵直...) 的帧
+#   every:  每 N 帧显示一次状态，有事件的帧也显示
+#   full:   每帧都显示 (与原来的 print_frame 一样)
+
+MODES = ("events", "every", "full")
+
+# 纯阶段切换事件 (后摇开始、收招...) 没有文字，不算作“有事件”
+_SHOWN = frozenset(code for code in NAMES if render_event(code, "", 0.0, 0.0, 0.0) is not None)
+
+class FrameRing:
+    """定长环形缓冲: 满了由调用方先取空再放"""
+    def __init__(self, capacity):
+        if capacity <= 0:
+            raise ValueError("环形缓冲的容量必须为正数")
+        self.slots = [None] * capacity
+        self.capacity = capacity
+        self.head = 0 # 最早一项的位置
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def full(self):
+        return self.size == self.capacity
+
+    def push(self, item):
+        if self.size == self.capacity:
+            raise ValueError("环形缓冲已满")
+        self.slots[(self.head + self.size) % self.capacity] = item
+        self.size += 1
+
+    def drain(self):
+        """按先后顺序取出所有项"""
+        slots, capacity = self.slots, self.capacity
+        for k in range(self.size):
+            i = (self.head + k) % capacity
+            yield slots[i]
+            slots[i] = None
+        self.head = self.size = 0
+
+class Display:
+    """挂在 simulate_duel 上的显示管线
+
+        display = Display(mode="events")
+        simulate_duel(p1, p2, on_frame=display.on_frame, trace=display)
+        display.close()
+
+    sink: None 为标准输出；字符串为文件路径 (由 Display 打开并在 close 时关闭)；也可以是任何有 write 的对象。
+    capacity: 环形缓冲的帧数，满了就渲染并写出一批。
+    """
+    def __init__(self, mode="events", every=10, sink=None, capacity=256):
+        if mode not in MODES:
+            raise ValueError(f"未知的显示模式: {mode} (可选 {', '.join(MODES)})")
+        if every <= 0:
+            raise ValueError("every 必须为正数")
+        self.mode = mode
+        self.every = 1 if mode == "full" else every
+        self.ring = FrameRing(capacity)
+        if sink is None:
+            self.sink, self._owned = sys.stdout, False
+        elif isinstance(sink, str):
+            self.sink, self._owned = open(sink, "w", encoding="utf-8"), True
+        else:
+            self.sink, self._owned = sink, False
+        self.fighters = []  # actor -> 角色名
+        self.frame = 0
+        self.events = []    # 本帧尚未入缓冲的事件
+        self.lines = 0      # 已写出的行数
+
+    # --- trace 钩子 (与 CombatTrace 相同的接口) ---
+
+    def attach(self, *fighters):
+        for fighter in fighters:
+            fighter.trace = self
+            fighter.trace_id = len(self.fighters)
+            self.fighters.append(fighter.name)
+        return self
+
+    @staticmethod
+    def detach(*fighters):
+        for fighter in fighters:
+            fighter.trace = None
+
+    def record(self, t, actor, code, node, a, b, c):
+        if code in _SHOWN:
+            self.events.append((actor, code, node.name if node is not None else None, a, b, c))
+
+    # --- 引擎侧: 只存快照 ---
+
+    def on_frame(self, time_elapsed, p1, p2, dist_mgr):
+        frame = self.frame
+        self.frame += 1
+        events = self.events
+        if events:
+            self.events = []
+        elif frame % self.every or self.mode == "events":
+            return # 这一帧不显示，连快照都不存
+        if self.ring.full():
+            self.flush()
+        self.ring.push((time_elapsed, p1.name, p1.state, p1.stamina, p1.hp,
+                        p2.name, p2.state, p2.stamina, p2.hp, dist_mgr.distance, events))
+
+    # --- 渲染侧 ---
+
+    def _render(self, snapshot):
+        t, name1, state1, sp1, hp1, name2, state2, sp2, hp2, distance, events = snapshot
+        lines = [f"\n[T={t:.1f}s]"]
+        for actor, code, node_name, a, b, c in events:
+            lines.append(f"[{self.fighters[actor]}] {render_event(code, node_name, a, b, c)}")
+        lines.append(f"   {name1}[{State.NAMES[state1]} SP:{sp1:.0f}] HP:{hp1}  ||  "
+                     f"{name2}[{State.NAMES[state2]} SP:{sp2:.0f}] HP:{hp2} || Dist:{distance:.1f}m")
+        return lines
+
+    def flush(self):
+        """把缓冲里的帧渲染出来，一次写给输出端"""
+        if not self.ring:
+            return
+        lines = []
+        for snapshot in self.ring.drain():
+            lines.extend(self._render(snapshot))
+        self.sink.write("\n".join(lines) + "\n")
+        self.lines += len(lines)
+
+    def close(self):
+        self.flush()
+        if self._owned:
+            self.sink.close()
+        else:
+            self.sink.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+def run_duel_display(p1, p2, initial_distance=3.0, mode="events", every=10, sink=None, dt=0.1, time_limit=60.0):
+    """带显示的单场对决 (双方应关闭 verbose，事件由 Display 渲染)"""
+    with Display(mode, every, sink) as display:
+        return simulate_duel(p1, p2, initial_distance, dt, time_limit, on_frame=display.on_frame, trace=display)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="带显示的单场对决")
+    parser.add_argument("--mode", choices=MODES, default="events")
+    parser.add_argument("--every", type=int, default=10, help="every 模式下每多少帧显示一次")
+    parser.add_argument("--out", help="写到文件而不是标准输出")
+    parser.add_argument("--bench", action="store_true", help="比较各模式与逐帧打印的开销")
+    args = parser.parse_args(argv)
+
+    if args.bench:
+        n = 200
+        def timed(label, run):
+            sink = io.StringIO()
+            start = time.perf_counter()
+            for _ in range(n):
+                run(sink)
+            elapsed = (time.perf_counter() - start) / n
+            lines = sink.getvalue().count("\n") // n
+            print(f"{label:<12} {elapsed * 1000:6.2f}ms/场  {lines:>5} 行/场")
+
+        def legacy(sink):
+            p1, p2 = create_heavy_fighter(), create_swift_fighter()
+            with redirect_stdout(sink):
+                simulate_duel(p1, p2, on_frame=print_frame)
+
+        def piped(mode):
+            def run(sink):
+                p1, p2 = create_heavy_fighter(verbose=False), create_swift_fighter(verbose=False)
+                run_duel_display(p1, p2, mode=mode, sink=sink)
+            return run
+
+        timed("逐帧打印", legacy)
+        for mode in MODES:
+            timed(mode, piped(mode))
+        return 0
+
+    p1 = create_heavy_fighter(verbose=False)
+    p2 = create_swift_fighter(verbose=False)
+    result = run_duel_display(p1, p2, mode=args.mode, every=args.every, sink=args.out)
+    names = {1: f"{p1.name} 获胜!", 2: f"{p2.name} 获胜!"}
+    print(f"\n--- 战斗结束 ---\n{names.get(result.winner, '时间到，平局')}")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,333 @@
+import heapq
+import time
+from bisect import bisect_left
+from functools import lru_cache
+
+from wuxia_timeline_demo import (TIME_UNIT, State, ActionNode, DistanceManager, DuelResult, simulate_duel, to_ms,
+                                 create_heavy_fighter, create_swift_fighter)
+from wuxia_batch import duel_distance
+
+# --- 事件驱动时间轴 ---
+# 固定步长循环每 dt 都要调用双方的 update，即使在前摇/后摇/僵直期间什么都不会发生。
+# 这里用优先队列记录每个角色"下一次可能发生状态变化"的帧号 (阶段结束、僵直结束、
+# 移动到位、耐力够用)，中间的帧不再逐帧调用 update，而是直接推进:
+#   - 计时器: 整数毫秒，直接按已经过的帧数乘出来
+#   - 耐力:   只做逐帧的浮点加法并截断到上限，不走 update
+#   - 距离:   只在有人移动/突进/后撤时逐槽位累加双方的位移
+# 到了事件帧再调用真正的 Fighter.update，所有判定逻辑 (命中、打断、受身、挥空) 都复用原实现。
+# 阶段时长和计时器都是整数毫秒，换算成帧数就是一次向上取整的整除，所以在同一个 dt 下与 simulate_duel 逐帧一致；
+# 把 dt 调到 0.001 即可得到 GDD 要求的毫秒级时间轴，而开销只与事件数有关。
+#
+# 只有细步长才划算: 每个事件要做的结算和预测 (耐力、距离、下一次唤醒) 比一次 update 贵好几倍，
+# 而默认的 dt=0.1 下一场只有 130 帧左右，事件数并没有少多少。实测 (赵无极 vs 张无忌) 事件驱动相对固定步长:
+# dt=0.1 约 0.5x (更慢)，0.05 约 0.8x，0.03 约持平，0.02 约 2x，0.01 约 3x，0.001 约 10x。
+# 所以 simulate_duel_events 在 dt 大于 EVENT_DT_MAX 时直接走固定步长的 simulate_duel (结果本来就逐帧一致)，
+# 事件调度只用在细步长上；要强制使用事件调度请直接用 EventScheduler。
+
+EVENT_DT_MAX = 0.02 # 步长不超过它时才用事件调度
+
+MOVE_SPEED = 3.0 # 与 Fighter.update 中的移动速度一致
+MIN_DISTANCE = 0.5
+
+class Clock:
+    """整数毫秒时间轴: 第 n 帧后的 state_timer 为 n * step，time_elapsed 为其换算成的秒"""
+    def __init__(self, dt):
+        self.dt = dt
+        self.step = to_ms(dt)
+        if self.step <= 0:
+            raise ValueError(f"dt 至少为 1 毫秒: {dt}")
+
+    def at(self, n):
+        return n * self.step
+
+    def seconds(self, n):
+        return n * self.step / TIME_UNIT
+
+    def ticks_until(self, value):
+        """计时首次 >= value 毫秒时的帧数 (即逐帧循环 while t < value 的迭代次数)"""
+        return -(-value // self.step)
+
+    def phase_ticks(self, duration):
+        """持续 duration 毫秒的阶段需要几次 update 才会满足 state_timer >= duration (至少 1 次)"""
+        return max(1, self.ticks_until(duration))
+
+# 缓存都有上限: 长时间扫描 dt 和耐力起点时不会无限增长
+CLOCK_CACHE_SIZE = 16
+CURVE_CACHE_SIZE = 4096
+
+@lru_cache(maxsize=CLOCK_CACHE_SIZE)
+def get_clock(dt):
+    return Clock(dt)
+
+class RegenCurve:
+    """从某个耐力值开始逐帧恢复的累加序列: values[n] 即恢复 n 次后的耐力 (与 Fighter.update 浮点一致)
+
+    同一套招式的耐力起点反复出现，所以按起点缓存 (get_regen_curve)，之后的查询不再逐帧累加。
+    """
+    def __init__(self, start, step, max_stamina):
+        self.step = step
+        self.max_stamina = max_stamina
+        self.values = [start]
+        self.full = start >= max_stamina # 已回满，之后不再变化
+
+    def _extend(self, n):
+        values, step, cap = self.values, self.step, self.max_stamina
+        value = values[-1]
+        while len(values) <= n and not self.full:
+            value = value + step
+            if value >= cap:
+                value = cap
+                self.full = True
+            values.append(value)
+
+    def at(self, n):
+        self._extend(n)
+        values = self.values
+        return values[n] if n < len(values) else values[-1]
+
+    def steps_until(self, value):
+        """恢复多少次后耐力首次 >= value (value 不超过上限)"""
+        values = self.values
+        while values[-1] < value:
+            self._extend(len(values) + 64)
+        return bisect_left(values, value)
+
+@lru_cache(maxsize=CURVE_CACHE_SIZE)
+def get_regen_curve(start, step, max_stamina):
+    """按 (起点, 每帧恢复量, 上限) 共享的恢复曲线 (最近用过的 CURVE_CACHE_SIZE 条)"""
+    return RegenCurve(start, step, max_stamina)
+
+class EventScheduler:
+    """用下一事件调度跑一场对决，结果与同 dt 的 simulate_duel 一致"""
+    def __init__(self, p1, p2, initial_distance=3.0, dt=0.1, time_limit=60.0):
+        self.fighters = (p1, p2)
+        self.dt = dt
+        self.clock = get_clock(dt)
+        self.max_ticks = self.clock.ticks_until(to_ms(time_limit))
+        self.dist_mgr = DistanceManager(initial_distance)
+        self.regen_step = (p1.stamina_regen * dt, p2.stamina_regen * dt)
+
+        self.first = [0, 0]        # 当前阶段第一次计时的 update 所在帧
+        self.last_tick = [-1, -1]  # 最近一次真正调用 update 的帧
+        self.stam_tick = [-1, -1]  # 耐力已结算到的帧
+        self.dist_slot = -1        # 距离已结算到的槽位
+        self.version = [0, 0]      # 使过期的事件失效
+        self.queue = []
+        self.events = 0            # 实际调用 update 的次数
+
+    # --- 解析推进 ---
+
+    def _steps(self, fighter):
+        """该角色当前每帧对距离的影响: (接近量, 拉开量)"""
+        if fighter.hp <= 0:
+            return 0.0, 0.0
+        if fighter.state == State.MOVE:
+            return MOVE_SPEED * self.dt, 0.0
+        node = fighter.current_action_node
+        if fighter.state == State.WINDUP and node:
+            step = self.clock.step
+            closing = node.dash * step / node.windup_ms if node.dash > 0 else 0.0
+            opening = node.backdash * step / node.windup_ms if node.backdash > 0 else 0.0
+            return closing, opening
+        return 0.0, 0.0
+
+    def _distance_after(self, distance, lo, hi, steps):
+        """结算槽位 [lo, hi] 内双方的移动 (逐槽位累加，与逐帧循环的浮点误差一致)"""
+        (c0, o0), (c1, o1) = steps
+        if c0 == 0.0 and c1 == 0.0 and o0 == 0.0 and o1 == 0.0:
+            return distance
+        for slot in range(lo, hi + 1):
+            closing, opening = steps[slot & 1]
+            if closing:
+                distance -= closing
+                if distance < MIN_DISTANCE: distance = MIN_DISTANCE
+            if opening:
+                distance += opening
+        return distance
+
+    def _stamina_after(self, side, through_tick):
+        fighter = self.fighters[side]
+        n = through_tick - self.stam_tick[side]
+        if n > 0 and fighter.state in (State.IDLE, State.RECOVERY, State.MOVE):
+            return get_regen_curve(fighter.stamina, self.regen_step[side], fighter.max_stamina).at(n)
+        return fighter.stamina
+
+    def _sync(self, tick, side):
+        """把双方的耐力和共享距离结算到 (tick, side) 槽位之前"""
+        slot = 2 * tick + side
+        steps = (self._steps(self.fighters[0]), self._steps(self.fighters[1]))
+        self.dist_mgr.distance = self._distance_after(self.dist_mgr.distance, self.dist_slot + 1, slot - 1, steps)
+        self.dist_slot = slot - 1
+        for s in (0, 1):
+            through = tick - 1 if s >= side else tick
+            self.fighters[s].stamina = self._stamina_after(s, through)
+            self.stam_tick[s] = max(self.stam_tick[s], through)
+
+    # --- 事件预测 ---
+
+    def _next_wake(self, side, tick, acting):
+        """在 (tick, acting) 槽位处理完后，预测 side 下一次需要真正 update 的帧"""
+        me = self.fighters[side]
+        if me.hp <= 0:
+            return None
+        earliest = tick + 1 if side <= acting else tick
+        state = me.state
+        clock = self.clock
+
+        if state == State.WINDUP:
+            return self.first[side] + clock.phase_ticks(me.current_action_node.windup_ms) - 1
+        if state == State.ACTIVE:
+            return self.first[side] + clock.phase_ticks(me.current_action_node.active_ms) - 1
+        if state == State.RECOVERY:
+            return self.first[side] + clock.phase_ticks(me.current_action_node.recovery_ms) - 1
+        if state == State.STUNNED:
+            # 受身只可能在僵直后的第一次 update 发动 (僵直期间耐力不变、剩余时间只减不增)
+            if self.last_tick[side] < self.first[side]:
+                return self.first[side]
+            return max(earliest, self.first[side] + clock.phase_ticks(me.stun_duration) - 1)
+
+        enemy_opening = self._steps(self.fighters[1 - side])[1]
+        if enemy_opening > 0:
+            return earliest # 对方正在后撤，距离判断每帧都可能翻转
+
+        if state == State.MOVE:
+            return self._predict_arrival(side, tick, acting, earliest)
+
+        # IDLE: 刚进入时下一帧就要思考；已在原地等耐力时算出耐力够用的那一帧
+        node = me.nodes.get(me.current_node_name)
+        if me.state_timer == 0 or self.last_tick[side] < self.first[side] or not isinstance(node, ActionNode):
+            return earliest
+        if node.atk_range > 0 and self.dist_mgr.distance > node.atk_range + node.dash:
+            return earliest # 被拉开到射程外，下一帧就会转入移动
+        return self._predict_stamina(side, node.cost, earliest)
+
+    def _predict_arrival(self, side, tick, acting, earliest):
+        me = self.fighters[side]
+        node = me.current_action_node
+        target = node.atk_range + node.dash
+        steps = (self._steps(self.fighters[0]), self._steps(self.fighters[1]))
+        own_step = MOVE_SPEED * self.dt
+        distance = self.dist_mgr.distance
+        lo = 2 * tick + acting + 1
+
+        # 逐槽位向前推进距离，直到轮到自己行动时这一步能进入射程
+        slot = lo
+        while slot < 2 * self.max_ticks:
+            closing, opening = steps[slot & 1]
+            if slot & 1 == side and distance - own_step <= target:
+                return slot // 2
+            if closing:
+                distance -= closing
+                if distance < MIN_DISTANCE: distance = MIN_DISTANCE
+            if opening:
+                distance += opening
+            slot += 1
+        return None
+
+    def _predict_stamina(self, side, cost, earliest):
+        me = self.fighters[side]
+        step = self.regen_step[side]
+        if cost > me.max_stamina or step <= 0:
+            return None
+        # 第 u 帧 update 结束前共恢复 u - stam_tick 次
+        n = get_regen_curve(me.stamina, step, me.max_stamina).steps_until(cost)
+        return max(earliest, self.stam_tick[side] + n)
+
+    def _schedule(self, side, tick, acting):
+        self.version[side] += 1
+        wake = self._next_wake(side, tick, acting)
+        if wake is not None and wake < self.max_ticks:
+            heapq.heappush(self.queue, (wake, side, self.version[side]))
+
+    # --- 主循环 ---
+
+    def run(self):
+        p1, p2 = self.fighters
+        heapq.heappush(self.queue, (0, 0, 0))
+        heapq.heappush(self.queue, (0, 1, 0))
+        end_tick = self.max_ticks
+
+        while self.queue:
+            tick, side, version = heapq.heappop(self.queue)
+            if version != self.version[side]:
+                continue
+            me, enemy = self.fighters[side], self.fighters[1 - side]
+
+            self._sync(tick, side)
+            me.state_timer = self.clock.at(tick - self.first[side])
+            stuns = enemy.stun_count
+            me.update(self.dt, enemy, self.clock.seconds(tick), self.dist_mgr)
+            self.events += 1
+            self.dist_slot = 2 * tick + side
+            self.stam_tick[side] = tick
+            self.last_tick[side] = tick
+
+            # 本帧进入了新阶段 (计时器被清零)
+            if me.state_timer == 0:
+                self.first[side] = tick + 1
+            # 对手被打入僵直: 若对手本帧还没行动，则本帧就开始计时
+            if enemy.stun_count != stuns:
+                self.first[1 - side] = tick if 1 - side > side else tick + 1
+
+            if p1.hp <= 0 or p2.hp <= 0:
+                end_tick = tick + 1
+                break
+
+            self._schedule(0, tick, side)
+            self._schedule(1, tick, side)
+
+        if p1.hp <= 0: winner = 2
+        elif p2.hp <= 0: winner = 1
+        else: winner = 0
+        return DuelResult(winner, self.clock.seconds(end_tick), p1, p2)
+
+def simulate_duel_events(p1, p2, initial_distance=3.0, dt=0.1, time_limit=60.0):
+    """simulate_duel 的事件驱动版本 (不支持逐帧回调)；dt 大于 EVENT_DT_MAX 时改用固定步长，结果相同"""
+    if dt > EVENT_DT_MAX:
+        return simulate_duel(p1, p2, initial_distance, dt, time_limit)
+    return EventScheduler(p1, p2, initial_distance, dt, time_limit).run()
+
+def compare_with_fixed_step(p1, p2, seeds, distance_jitter=0.5, dt=0.1, time_limit=60.0):
+    """逐场对比事件驱动与固定步长的结果，返回不一致的种子列表"""
+    mismatches = []
+    verbose = (p1.verbose, p2.verbose)
+    p1.verbose = p2.verbose = False
+    try:
+        for seed in seeds:
+            distance = duel_distance(seed, distance_jitter=distance_jitter)
+            p1.reset(); p2.reset()
+            a = simulate_duel(p1, p2, distance, dt, time_limit)
+            p1.reset(); p2.reset()
+            b = EventScheduler(p1, p2, distance, dt, time_limit).run()
+            if (a.winner, a.duration, a.hp, a.stuns) != (b.winner, b.duration, b.hp, b.stuns):
+                mismatches.append(seed)
+    finally:
+        p1.verbose, p2.verbose = verbose
+    return mismatches
+
+if __name__ == "__main__":
+    p1 = create_heavy_fighter(verbose=False)
+    p2 = create_swift_fighter(verbose=False)
+
+    mismatches = compare_with_fixed_step(p1, p2, range(1000))
+    print(f"一致性校验: 1000 场中 {len(mismatches)} 场与固定步长不一致")
+
+    for dt in (0.1, 0.01, 0.001):
+        n = 200 if dt >= 0.01 else 20
+        start = time.perf_counter()
+        for seed in range(n):
+            p1.reset(); p2.reset()
+            simulate_duel(p1, p2, duel_distance(seed), dt)
+        fixed = (time.perf_counter() - start) / n
+
+        events = 0
+        start = time.perf_counter()
+        for seed in range(n):
+            p1.reset(); p2.reset()
+            scheduler = EventScheduler(p1, p2, duel_distance(seed), dt)
+            scheduler.run()
+            events += scheduler.events
+        event = (time.perf_counter() - start) / n
+        print(f"dt={dt}: 固定步长 {fixed * 1000:.2f}ms/场, 事件驱动 {event * 1000:.2f}ms/场 "
+              f"(每场 {events / n:.0f} 次 update, 加速 {fixed / event:.1f}x)"
+              + ("" if dt <= EVENT_DT_MAX else "  -> simulate_duel_events 在此步长下走固定步长"))
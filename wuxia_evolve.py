@@ -0,0 +1,273 @@
+import copy
+import hashlib
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from wuxia_batch import run_batch
+from wuxia_timeline_demo import ActionNode, ConditionNode, ACTION_PARAMS, create_heavy_fighter, create_swift_fighter
+
+# --- 招式图进化搜索 ---
+# 以时间轴模拟器为适应度: 候选招式图分别作为 P1、P2 与参考池中每个角色批量对决，取平均胜率。
+# 变异只改动作节点的数值参数 (按 STEP 取整到网格上) 和连线；交叉按键名逐节点混合两个父代。
+# 适应度按规范化的招式图哈希缓存，同一张图 (哪怕节点改了名) 只模拟一次。
+
+# 可变异参数及其取值范围 (power 不参与，避免搜出单纯堆伤害的解)
+MUTABLE_PARAMS = {
+    "windup": (0.1, 2.0),
+    "toughness": (0.0, 60.0),
+    "cost": (0.0, 60.0),
+    "atk_range": (0.3, 3.0),
+    "dash": (0.0, 2.5),
+    "knockback": (0.0, 3.0),
+}
+STEP = 0.05 # 参数网格，取整后相同的候选能命中缓存
+
+def _quantize(value, low, high):
+    return round(min(max(value, low), high) / STEP) * STEP
+
+# --- 规范化哈希 ---
+
+def _condition_key(check):
+    key = getattr(check, "key", None)
+    return repr(key) if key is not None else repr(check)
+
+def graph_hash(fighter):
+    """招式图的规范化哈希
+
+    从根节点出发按遍历顺序给节点重新编号，只描述可达节点的类型、参数和跳转目标，
+    因此节点名、字典顺序、不可达节点都不影响结果；角色的生命/耐力参数一并计入。
+    动作节点的“没有后续” (next_node_name 为空) 记为 -1: 引擎对它走后摇，而显式写了根节点名会连招取消后摇，
+    两者行为不同，不能归为同一个目标。条件节点的空分支与根节点等价，照常归到根节点。
+    """
+    nodes = fighter.nodes
+    order = {}  # id(节点) -> 规范编号
+    queue = []  # 按编号排列的节点
+
+    def visit(name):
+        if not name or name not in nodes:
+            name = fighter.root_node_name # 空的或无效的跳转都回到根节点
+        node = nodes[name]
+        if id(node) not in order:
+            order[id(node)] = len(queue)
+            queue.append(node)
+        return order[id(node)]
+
+    visit(fighter.root_node_name)
+    parts = [repr((fighter.max_hp, fighter.max_stamina, fighter.stamina_regen))]
+    k = 0
+    while k < len(queue): # 描述节点的同时会把新遇到的跳转目标排到队尾
+        node = queue[k]
+        if isinstance(node, ActionNode):
+            params = tuple(round(getattr(node, attr), 6) for attr in ACTION_PARAMS)
+            nxt = visit(node.next_node_name) if node.next_node_name else -1
+            parts.append(repr(("A", node.action_type, params, nxt)))
+        else:
+            parts.append(repr(("C", _condition_key(node.check_func), visit(node.true_node_name), visit(node.false_node_name))))
+        k += 1
+    return hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()
+
+# --- 变异与交叉 ---
+
+def mutate(fighter, rng, param_rate=0.3, rewire_rate=0.1, scale=0.25):
+    """返回变异后的副本: 每个参数以 param_rate 的概率按比例扰动，每条连线以 rewire_rate 的概率改接"""
+    child = copy.deepcopy(fighter) # deepcopy 保留同一节点挂在多个键名下的别名关系
+    child.flow = None
+    names = list(child.nodes)
+    seen = set()
+    for name in names:
+        node = child.nodes[name]
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        if isinstance(node, ActionNode):
+            for attr, (low, high) in MUTABLE_PARAMS.items():
+                if rng.random() < param_rate:
+                    value = getattr(node, attr)
+                    spread = max(abs(value), high - low) * scale
+                    setattr(node, attr, _quantize(value + rng.gauss(0.0, spread), low, high))
+            if rng.random() < rewire_rate:
+                node.next_node_name = rng.choice(names)
+        elif isinstance(node, ConditionNode) and rng.random() < rewire_rate:
+            if rng.random() < 0.5:
+                node.true_node_name = rng.choice(names)
+            else:
+                node.false_node_name = rng.choice(names)
+    return child
+
+def crossover(a, b, rng):
+    """按键名逐节点混合: 两个父代都有的动作节点，逐参数随机取自 a 或 b；连线沿用 a"""
+    child = copy.deepcopy(a)
+    child.flow = None
+    for name, node in child.nodes.items():
+        other = b.nodes.get(name)
+        if isinstance(node, ActionNode) and isinstance(other, ActionNode):
+            for attr in MUTABLE_PARAMS:
+                if rng.random() < 0.5:
+                    setattr(node, attr, getattr(other, attr))
+    return child
+
+def is_valid(fighter):
+    """能通过编译校验 (没有纯条件环、没有悬空跳转) 的招式图才进入种群"""
+    try:
+        fighter.compile()
+    except ValueError:
+        return False
+    return True
+
+# --- 适应度评估 ---
+
+class FitnessCache:
+    """规范化哈希 -> 适应度 (平均胜率)"""
+    def __init__(self):
+        self.scores = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        score = self.scores.get(key)
+        if score is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return score
+
+    def put(self, key, score):
+        self.scores[key] = score
+
+_worker_pool = None
+
+def _init_worker(reference_pool):
+    global _worker_pool
+    _worker_pool = reference_pool
+
+def _evaluate(candidate, seeds, duel_kwargs):
+    """候选对参考池每个角色各打一轮 P1、一轮 P2，返回平均胜率"""
+    total = 0.0
+    for ref in _worker_pool:
+        opponent = copy.deepcopy(ref)
+        total += run_batch(candidate, opponent, seeds, **duel_kwargs).win_rate(1)
+        total += run_batch(opponent, candidate, seeds, **duel_kwargs).win_rate(2)
+    return total / (2 * len(_worker_pool))
+
+def evaluate_population(candidates, reference_pool, seeds, cache, executor=None, **duel_kwargs):
+    """返回各候选的适应度；缓存中已有的不再模拟，同一批里重复的图只算一次"""
+    keys = [graph_hash(c) for c in candidates]
+    pending = {}
+    for key, candidate in zip(keys, candidates):
+        if key not in pending and cache.get(key) is None:
+            pending[key] = candidate
+    if executor is None:
+        _init_worker(reference_pool)
+        for key, candidate in pending.items():
+            cache.put(key, _evaluate(candidate, seeds, duel_kwargs))
+    else:
+        futures = {key: executor.submit(_evaluate, candidate, seeds, duel_kwargs) for key, candidate in pending.items()}
+        for key, future in futures.items():
+            cache.put(key, future.result())
+    return [cache.scores[key] for key in keys]
+
+class EvolutionResult:
+    def __init__(self, best, fitness, history, cache):
+        self.best = best         # [(适应度, Fighter)]，按适应度从高到低
+        self.fitness = fitness   # 最优个体的适应度
+        self.history = history   # 每代 (最优, 平均) 适应度
+        self.cache = cache
+
+def evolve(seed_flows, reference_pool, generations=20, population=24, seeds=range(50), elite=4,
+           tournament=3, rng_seed=0, max_workers=None, on_generation=None, **duel_kwargs):
+    """以 seed_flows 为初始种群做进化搜索，返回 EvolutionResult
+
+    reference_pool: 参考对手 (Fighter 模板)；max_workers 为 1 时在当前进程内评估。
+    候选和参考角色的条件节点须使用 wuxia_condition.Condition (多进程需要 pickle)。
+    on_generation(gen, best_fitness, mean_fitness, best_fighter) 每代结束时调用。
+    duel_kwargs 透传给 run_batch (initial_distance / distance_jitter / dt / time_limit)。
+    """
+    if not seed_flows:
+        raise ValueError("初始种群不能为空")
+    if generations < 1:
+        raise ValueError(f"generations 至少为 1 (第一代就要评估一次才有排名): {generations}")
+    rng = random.Random(rng_seed)
+    cache = FitnessCache()
+    pop = [copy.deepcopy(f) for f in seed_flows]
+    while len(pop) < population:
+        child = mutate(rng.choice(seed_flows), rng)
+        if is_valid(child):
+            pop.append(child)
+
+    executor = None
+    if max_workers != 1:
+        executor = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(reference_pool,))
+    history = []
+    try:
+        for gen in range(generations):
+            scores = evaluate_population(pop, reference_pool, seeds, cache, executor, **duel_kwargs)
+            ranked = sorted(zip(scores, range(len(pop))), key=lambda s: -s[0])
+            best_score = ranked[0][0]
+            history.append((best_score, sum(scores) / len(scores)))
+            if on_generation is not None:
+                on_generation(gen, best_score, history[-1][1], pop[ranked[0][1]])
+            if gen == generations - 1:
+                break
+
+            def pick():
+                entrants = rng.sample(range(len(pop)), min(tournament, len(pop)))
+                return pop[max(entrants, key=lambda k: scores[k])]
+
+            next_pop = [pop[k] for _, k in ranked[:elite]]
+            while len(next_pop) < population:
+                child = mutate(crossover(pick(), pick(), rng), rng)
+                if is_valid(child):
+                    next_pop.append(child)
+            pop = next_pop
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    best = []
+    seen = set()
+    for score, k in ranked:
+        key = graph_hash(pop[k])
+        if key not in seen:
+            seen.add(key)
+            best.append((score, pop[k]))
+    return EvolutionResult(best, best[0][0], history, cache)
+
+def describe(fighter):
+    """列出各动作节点的可变异参数和连线 (方便设计师对照原招式)"""
+    lines = []
+    seen = set()
+    for name, node in fighter.nodes.items():
+        if id(node) in seen: # 同一节点的别名键只列一次
+            continue
+        seen.add(id(node))
+        if isinstance(node, ActionNode):
+            params = " ".join(f"{attr}={getattr(node, attr):g}" for attr in MUTABLE_PARAMS)
+            lines.append(f"  {name}: {params} -> {node.next_node_name or fighter.root_node_name}")
+        else:
+            lines.append(f"  {name}? 真 -> {node.true_node_name}  假 -> {node.false_node_name}")
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    # 回归校验: 开山斧连回自身 (连招取消后摇) 与没有后续 (走后摇) 是两张不同的图
+    looped = create_heavy_fighter(verbose=False)
+    plain = create_heavy_fighter(verbose=False)
+    plain.nodes["start"].next_node_name = None
+    if graph_hash(looped) == graph_hash(plain):
+        raise SystemExit("graph_hash 没有区分 next=None 与 next=根节点")
+    print("graph_hash 区分 next=None 与 next=根节点: 是")
+
+    reference_pool = [create_heavy_fighter(verbose=False), create_swift_fighter(verbose=False)]
+    seed_flows = [create_swift_fighter("张无忌 (进化)", verbose=False)]
+
+    def progress(gen, best, mean, fighter):
+        print(f"第 {gen + 1:>2} 代: 最优胜率 {best:.1%}  平均 {mean:.1%}")
+
+    start = time.perf_counter()
+    result = evolve(seed_flows, reference_pool, generations=12, population=20, seeds=range(40), on_generation=progress)
+    elapsed = time.perf_counter() - start
+    cache = result.cache
+    print(f"\n用时 {elapsed:.1f}s，模拟了 {len(cache.scores)} 张不同的招式图，缓存命中 {cache.hits} 次")
+    print(f"原始招式对参考池平均胜率: {evaluate_population(seed_flows, reference_pool, range(40), cache)[0]:.1%}")
+    print(f"最优招式 (胜率 {result.fitness:.1%}):")
+    print(describe(result.best[0][1]))
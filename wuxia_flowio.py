@@ -0,0 +1,112 @@
+import json
+
+from wuxia_condition import Condition
+
+# --- 招式图的 JSON 格式 (两套引擎共用) ---
+# 回合制 (wuxia_combat_demo) 和时间轴 (wuxia_timeline_demo) 的招式图写成同一种纯数据:
+#   {"name": 角色名, "hp": 生命, "root": 根节点键名, "nodes": {键名: 节点}}
+#   动作节点: {"type": "action", "name", "action_type": 显示名 ("攻击"), "next", 以及该引擎的数值参数}
+#   条件节点: {"type": "condition", "name", "kind", "param", "true", "false"} (必须是声明式 Condition)
+#   别名:     {"alias": 另一个键名} —— 同一个节点对象挂在多个键名下 (如 "start" 与招式名) 时，
+#             第一个键名写出完整节点，其余键名写成别名，读回后仍是同一个对象。
+# 内容相同但本来就是两个对象的节点读回后也是两个对象 (改其中一个不会牵连另一个)。
+# 两套引擎只在节点类、数值参数和跳转字段名上不同，由 FlowSchema 描述；读写逻辑只有这一份。
+
+class FlowSchema:
+    """一套引擎的招式图结构
+
+    make_fighter(name, hp, root, verbose) 创建空角色；params 为动作节点要存的数值参数；
+    links 为 (后续, 真分支, 假分支) 在节点上的字段名；
+    type_to_name / name_to_type 在引擎的招式类型与显示名之间换算 (name_to_type 还应接受常量名 "ATTACK")。
+    """
+    def __init__(self, make_fighter, action_cls, condition_cls, params, links, type_to_name, name_to_type):
+        self.make_fighter = make_fighter
+        self.action_cls = action_cls
+        self.condition_cls = condition_cls
+        self.params = params
+        self.next_attr, self.true_attr, self.false_attr = links
+        self.type_to_name = type_to_name
+        self.name_to_type = name_to_type
+
+    def action_type(self, value):
+        try:
+            return self.name_to_type(value)
+        except (KeyError, ValueError, TypeError):
+            raise ValueError(f"未知的招式类型: {value}") from None
+
+def flow_to_dict(fighter, schema):
+    """把招式图写成纯数据 (条件节点必须是声明式 Condition)"""
+    nodes = {}
+    first_key = {} # id(节点) -> 第一次出现时的键名
+    for key, node in fighter.nodes.items():
+        if id(node) in first_key:
+            nodes[key] = {"alias": first_key[id(node)]}
+            continue
+        first_key[id(node)] = key
+        if isinstance(node, schema.action_cls):
+            spec = {"type": "action", "name": node.name, "action_type": schema.type_to_name(node.action_type),
+                    "next": getattr(node, schema.next_attr)}
+            spec.update((attr, getattr(node, attr)) for attr in schema.params)
+            nodes[key] = spec
+        elif isinstance(node.check_func, Condition):
+            nodes[key] = {"type": "condition", "name": node.name, "kind": node.check_func.kind, "param": node.check_func.param,
+                          "true": getattr(node, schema.true_attr), "false": getattr(node, schema.false_attr)}
+        else:
+            raise ValueError(f"【{node.name}】的条件是 lambda，无法序列化")
+    return {"name": fighter.name, "hp": fighter.max_hp, "root": getattr(fighter, "root_node_name", "start"), "nodes": nodes}
+
+def flow_from_dict(data, schema, verbose=False):
+    """flow_to_dict 的逆操作 (缺省的 hp 为 200、root 为 "start"，缺省的数值参数取节点类的默认值)"""
+    fighter = schema.make_fighter(data["name"], data.get("hp", 200), data.get("root", "start"), verbose)
+    specs = data["nodes"]
+    built = {}
+    for key, spec in specs.items():
+        if "alias" in spec:
+            continue
+        if spec.get("type") == "action":
+            params = {attr: spec[attr] for attr in schema.params if attr in spec}
+            node = schema.action_cls(spec.get("name", key), schema.action_type(spec["action_type"]), **params)
+            node.set_next(spec.get("next"))
+        elif spec.get("type") == "condition":
+            node = schema.condition_cls(spec.get("name", key), Condition(spec["kind"], spec.get("param", 0.0)))
+            node.set_branches(spec.get("true"), spec.get("false"))
+        else:
+            raise ValueError(f"节点 '{key}' 的类型未知: {spec.get('type')}")
+        built[key] = node
+    for key, spec in specs.items():
+        if "alias" in spec:
+            if spec["alias"] not in built:
+                raise ValueError(f"节点 '{key}' 是别名，但 '{spec['alias']}' 不是一个完整节点")
+            built[key] = built[spec["alias"]]
+        fighter.nodes[key] = built[key] # 保持原来的键名顺序
+    return fighter
+
+def _timeline_schema():
+    from wuxia_timeline_demo import Fighter, ActionNode, ConditionNode, ActionType, ACTION_PARAMS
+
+    def make_fighter(name, hp, root, verbose):
+        return Fighter(name, hp, root_node_name=root, verbose=verbose)
+
+    def name_to_type(value):
+        # 编码、显示名 ("攻击") 或常量名 ("ATTACK")
+        if isinstance(value, int) and 0 <= value < len(ActionType.NAMES):
+            return value
+        if value in ActionType.NAMES:
+            return ActionType.NAMES.index(value)
+        if isinstance(getattr(ActionType, str(value), None), int):
+            return getattr(ActionType, value)
+        raise ValueError(value)
+
+    return FlowSchema(make_fighter, ActionNode, ConditionNode, ACTION_PARAMS,
+                      ("next_node_name", "true_node_name", "false_node_name"),
+                      lambda code: ActionType.NAMES[code], name_to_type)
+
+TIMELINE = _timeline_schema()
+
+if __name__ == "__main__":
+    from wuxia_timeline_demo import create_heavy_fighter, create_swift_fighter
+
+    for fighter in (create_heavy_fighter(verbose=False), create_swift_fighter(verbose=False)):
+        data = flow_to_dict(fighter, TIMELINE)
+        again = flow_to_dict(flow_from_dict(data, TIMELINE), TIMELINE)
+        print(f"{fighter.name}: {len(data['nodes'])} 个键, {len(json.dumps(data, ensure_ascii=False))} 字节, 往返{'一致' if again == data else '不一致'}")
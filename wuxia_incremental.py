@@ -0,0 +1,312 @@
+import time
+from operator import attrgetter
+
+from wuxia_batch import BatchResult, duel_distance, run_batch
+from wuxia_memo import tick_times
+from wuxia_trace import Ev
+from wuxia_timeline_demo import (State, ActionNode, ACTION_PARAMS, DistanceManager, DuelResult, _GUARD_STATES,
+                                 create_heavy_fighter, create_swift_fighter)
+
+# --- 改参数后的增量重算 ---
+# 设计师改了某个动作节点的一个参数后，不必把每场对决从头再跑:
+# 记录每场对决时，同时记下每个节点的每组参数“第一次被读到”的那一帧，并保存那一帧开始时的局面快照。
+# 改参数之前的那段对局完全没读过这个参数，所以与改之后逐位相同，直接从快照接着往下跑即可；
+# 根本没读到这个参数的对局结果原样复用。
+#
+# 参数按引擎实际读取的时机分组:
+#   - toughness: 只在前摇/判定期被打断判定时读取 (对应 STUN / POISE_HOLD 事件)
+#   - power / knockback: 只在出招判定时读取 (对应 ATTACK 事件)
+#   - 其他参数 (前摇、耗耐、射程、突进...): 节点一被选中 (成为当前动作或当前指针) 就算读到
+# 所以改开山斧的韧性时，从第一次有人在它前摇里打中赵无极的那一帧开始重算，而不是从开局。
+#
+# 什么时候不省时间: 参数在开局不久就被读到时，可复用的前缀很短，增量重算和从头跑一样慢
+# (还要多付恢复快照的开销)。例如赵无极 vs 张无忌，开山斧是起手招，改前摇要从第 0 帧重算；
+# 改韧性时第一次被打断也在第一轮交手，仍要重算九成以上的帧。真正省时间的是对局后段才用到的招式
+# (残血才用的收招、特定距离才触发的闪避)。要重算的帧数超过全部帧数的 FULL_RERUN_SHARE 时，
+# edit() 不再恢复快照，直接用 run_batch 把受影响的对局从头重跑 (last_edit 里会注明)，
+# 花费与 run_batch 相同；这些对局只得到汇总结果，逐场结果要等下次修改或 refresh() 时再补上。
+#
+# 快照只在有人站立 (可能选招) 的帧开始时取: 出招/受击时才发现的首次读取记在最近一次选招的快照上，
+# 重算从那里开始，比真正的首次读取早几帧，但结果同样逐位一致。
+
+_RUNTIME = ("hp", "current_node_name", "state", "state_timer", "stun_duration", "current_action_node",
+            "poise_damage_accumulator", "last_hit_time", "stamina", "damage_taken", "stun_count")
+_snapshot = attrgetter(*_RUNTIME)
+
+FULL_RERUN_SHARE = 0.9 # 要重算的帧数占比达到这个值就直接从头重跑受影响的对局
+
+_ATTR_GROUPS = {"toughness": "toughness", "power": "hit", "knockback": "hit"} # 其余参数归入 "node"
+
+def _restore(fighter, snapshot):
+    for name, value in zip(_RUNTIME, snapshot):
+        setattr(fighter, name, value)
+
+class _UseLog:
+    """挂在 Fighter.trace 上，从事件里识别 toughness / power / knockback 的读取"""
+    def __init__(self, fighters):
+        self.fighters = fighters
+        self.fresh = [] # 本帧新出现的 (节点 id, 参数组)
+        self.seen = None
+
+    def record(self, t, actor, code, node, a, b, c):
+        if code == Ev.ATTACK:
+            self._mark(node, "hit")
+        elif code == Ev.STUN or code == Ev.POISE_HOLD:
+            fighter = self.fighters[actor]
+            # 事件在 enter_stunned 之前发出，此时状态和当前动作都还是受击那一刻的
+            if fighter.state in _GUARD_STATES and fighter.current_action_node is not None:
+                self._mark(fighter.current_action_node, "toughness")
+
+    def _mark(self, node, group):
+        key = (id(node), group)
+        if key not in self.seen:
+            self.seen.add(key)
+            self.fresh.append(key)
+
+class DuelRecord:
+    """一场对决的记录: 初始距离、各 (节点, 参数组) 首次读取时的局面快照、结果
+
+    horizon 为 None 表示整场都有记录；否则只有 horizon 帧之前的首次读取是已知的
+    (增量重算时后半段没有重新记录)，horizon 本身是那一帧开始时的快照。
+    stale 为 True 表示这场已被从头重跑、只计入了汇总结果，result 还是重跑之前的 (只用来估计对局长度)。
+    """
+    __slots__ = ("seed", "distance", "first_use", "result", "horizon", "stale")
+
+    def __init__(self, seed, distance):
+        self.seed = seed
+        self.distance = distance
+        self.first_use = {} # (节点 id, 参数组) -> (帧号, P1快照, P2快照, 距离)
+        self.result = None
+        self.horizon = None
+        self.stale = False
+
+class IncrementalBatch:
+    """可增量重算的一批对决
+
+    先 run() 完整跑一遍并记录；之后每次 edit() 只从受影响的帧接着重算受影响的对局。
+    重算的后半段不做记录 (重算本身不比从头跑慢)，下次修改时这部分从分界处整体重算；
+    参数在开局附近就被读到时，增量重算省不了时间，此时回退为从头重跑 (见 FULL_RERUN_SHARE)；
+    空闲时调用 refresh() 可补齐记录。
+    p1/p2 在整个过程中被原地修改参数 (edit 改的就是它们的节点)，请勿在别处同时使用。
+    """
+    def __init__(self, p1, p2, seeds, initial_distance=3.0, distance_jitter=0.5, dt=0.1, time_limit=60.0):
+        self.p1 = p1
+        self.p2 = p2
+        self.seeds = seeds
+        self.initial_distance = initial_distance
+        self.distance_jitter = distance_jitter
+        self.dt = dt
+        self.time_limit = time_limit
+        self.records = []
+        self.rerun = None     # 最近一次从头重跑的汇总结果 (只含 stale 的对局)
+        self.last_edit = None # (重算的场数, 重算的帧数, 从头重跑需要的帧数, 是否回退为从头重跑)
+
+    def run(self):
+        self.p1.compile()
+        self.p2.compile()
+        self.records = []
+        self.rerun = None
+        for seed in self.seeds:
+            record = DuelRecord(seed, duel_distance(seed, self.initial_distance, self.distance_jitter))
+            self.p1.reset()
+            self.p2.reset()
+            self._simulate(record, (0, _snapshot(self.p1), _snapshot(self.p2), record.distance), True)
+            self.records.append(record)
+        return self.result()
+
+    def result(self):
+        batch = BatchResult(self.dt)
+        for record in self.records:
+            if not record.stale:
+                batch.add(record.result)
+        if self.rerun is not None:
+            batch.merge(self.rerun)
+        return batch
+
+    def edit(self, side, node_key, **params):
+        """修改 P{side} 的节点 node_key 的参数 (可同时改多个)，增量重算后返回新的 BatchResult"""
+        fighter = self.p1 if side == 1 else self.p2
+        node = fighter.nodes.get(node_key)
+        if not isinstance(node, ActionNode):
+            raise ValueError(f"{fighter.name} 没有名为 '{node_key}' 的动作节点")
+        for attr in params:
+            if attr not in ACTION_PARAMS:
+                raise ValueError(f"不能增量修改的参数: {attr}")
+        for attr, value in params.items():
+            setattr(node, attr, value)
+        fighter.compile() # 跳转表里按列打包了参数，需要重建
+
+        keys = {(id(node), _ATTR_GROUPS.get(attr, "node")) for attr in params}
+        plan = []
+        for record in self.records:
+            uses = [record.first_use[key] for key in keys if key in record.first_use]
+            if uses:
+                plan.append((record, min(uses, key=lambda use: use[0])))
+            elif record.horizon is not None:
+                plan.append((record, record.horizon)) # 分界之后没有记录，不知道是否读到，只能从分界重算
+            # 否则这场对局从没读到改过的参数 (stale 的对局一定有 horizon，总会重算)
+        # 按改之前的对局长度估计要重算的帧数
+        resumed = sum(self._ticks(record) - start[0] for record, start in plan)
+        full = resumed >= FULL_RERUN_SHARE * sum(self._ticks(record) for record in self.records)
+
+        for record, start in plan:
+            record.first_use = {key: use for key, use in record.first_use.items() if use[0] < start[0]}
+            record.horizon = start
+        if full:
+            # 可复用的前缀太短，恢复快照不划算: 受影响的对局直接交给 run_batch 从开局跑
+            self.rerun = run_batch(self.p1, self.p2, [record.seed for record, _ in plan], self.initial_distance,
+                                   self.distance_jitter, self.dt, self.time_limit)
+            for record, _ in plan:
+                record.stale = True
+            limit = len(tick_times(self.dt, self.time_limit)) - 1
+            ticks = sum(t * count for t, count in self.rerun.ttk_hist.items()) + self.rerun.wins[0] * limit
+            total = ticks + sum(self._ticks(record) for record in self.records if not record.stale)
+        else:
+            ticks = 0
+            for record, start in plan:
+                ticks += self._simulate(record, start, False)
+            self.rerun = None # 上次从头重跑的对局都有 horizon，已全部在这次重算里
+            total = sum(self._ticks(record) for record in self.records)
+        self.last_edit = (len(plan), ticks, total, full)
+        return self.result()
+
+    def _ticks(self, record):
+        # stale 的对局给出的是重跑之前的长度，只作估计
+        return int(round(record.result.duration / self.dt))
+
+    def refresh(self):
+        """补齐增量重算时跳过的记录 (以及从头重跑的逐场结果)，返回推进的帧数"""
+        ticks = 0
+        for record in self.records:
+            if record.horizon is not None:
+                start, record.horizon = record.horizon, None
+                ticks += self._simulate(record, start, True)
+        self.rerun = None
+        return ticks
+
+    def _simulate(self, record, start, recording):
+        """从快照 start 接着跑完这场，更新结果 (recording 时同时记录首次读取)，返回推进的帧数"""
+        p1, p2 = self.p1, self.p2
+        if p1.verbose or p2.verbose or p1.trace is not None or p2.trace is not None:
+            raise ValueError("增量重算模式下不能输出日志或记录事件")
+        tick, snap1, snap2, distance = start
+        _restore(p1, snap1)
+        _restore(p2, snap2)
+        dt = self.dt
+        times = tick_times(dt, self.time_limit)
+        limit = len(times) - 1
+        dist_mgr = DistanceManager(distance)
+        first_tick = tick
+
+        if not recording:
+            while p1.hp > 0 and p2.hp > 0 and tick < limit:
+                t = times[tick]
+                p1.update(dt, p2, t, dist_mgr)
+                p2.update(dt, p1, t, dist_mgr)
+                tick += 1
+        else:
+            first_use = record.first_use
+            log = _UseLog((p1, p2))
+            log.seen = seen = set(first_use)
+            fresh = log.fresh
+            p1.trace = p2.trace = log
+            p1.trace_id, p2.trace_id = 0, 1
+
+            def mark(fighter):
+                # 节点成为当前动作或当前指针，即视为其选招相关参数已被读取
+                for node in (fighter.current_action_node, fighter.nodes.get(fighter.current_node_name)):
+                    if node is not None and (id(node), "node") not in seen:
+                        seen.add((id(node), "node"))
+                        fresh.append((id(node), "node"))
+
+            try:
+                mark(p1)
+                mark(p2)
+                snap = start
+                while p1.hp > 0 and p2.hp > 0 and tick < limit:
+                    idle1 = p1.state == State.IDLE
+                    idle2 = p2.state == State.IDLE
+                    if idle1 or idle2:
+                        # 新节点只会在站立时被选中，快照只在这些帧开始时取；出招/受击时才发现的首次读取
+                        # 记在最近一次选招的快照上 (从更早的帧接着跑，结果同样逐位一致)
+                        snap = (tick, _snapshot(p1), _snapshot(p2), dist_mgr.distance)
+                    t = times[tick]
+                    p1.update(dt, p2, t, dist_mgr)
+                    if idle1:
+                        mark(p1)
+                    p2.update(dt, p1, t, dist_mgr)
+                    if idle2:
+                        mark(p2)
+                    if fresh:
+                        for key in fresh:
+                            first_use[key] = snap
+                        fresh.clear()
+                    tick += 1
+            finally:
+                p1.trace = p2.trace = None
+
+        if p1.hp <= 0: winner = 2
+        elif p2.hp <= 0: winner = 1
+        else: winner = 0
+        record.result = DuelResult(winner, times[tick], p1, p2)
+        record.stale = False
+        return tick - first_tick
+
+if __name__ == "__main__":
+    from wuxia_condition import Condition, Cond
+    from wuxia_timeline_demo import Fighter, ActionType, ConditionNode
+
+    def create_closer_fighter(verbose=False):
+        """张三丰: 刺探为主，对手残血 (< 60) 才用收招 —— 收招的参数要到对局后段才会被读到"""
+        f = Fighter("张三丰", 200, verbose=verbose)
+        f.add_node(ConditionNode("start", Condition(Cond.ENEMY_STATE_WINDUP))).set_branches("dodge", "far")
+        f.add_node(ConditionNode("far", Condition(Cond.DISTANCE_GT, 2.5))).set_branches("dash", "low")
+        f.add_node(ConditionNode("low", Condition(Cond.ENEMY_HP_LT, 60))).set_branches("finish", "jab")
+        f.add_node(ActionNode("dodge", ActionType.DODGE, windup=0.1, active=0.4, recovery=0.2, power=0, cost=20, atk_range=0, knockback=0, backdash=1.5))
+        f.add_node(ActionNode("dash", ActionType.ATTACK, windup=0.4, active=0.1, recovery=0.4, power=20, cost=20, atk_range=1.0, dash=1.5)).set_next("start")
+        f.add_node(ActionNode("finish", ActionType.ATTACK, windup=0.6, active=0.1, recovery=0.6, power=40, cost=30, atk_range=1.2))
+        f.add_node(ActionNode("jab", ActionType.ATTACK, windup=0.2, active=0.1, recovery=0.3, power=10, cost=10, atk_range=1.0, dash=0.3))
+        return f
+
+    def check(batch, label, factories):
+        # 与从头跑一遍的结果对照
+        fresh = [factory(verbose=False) for factory in factories]
+        for fighter, source in zip(fresh, (batch.p1, batch.p2)):
+            for key, node in fighter.nodes.items():
+                if isinstance(node, ActionNode):
+                    for attr in ACTION_PARAMS:
+                        setattr(node, attr, getattr(source.nodes[key], attr))
+        start = time.perf_counter()
+        full = run_batch(fresh[0], fresh[1], batch.seeds)
+        full_time = time.perf_counter() - start
+        same = (full.wins, full.ttk_hist, full.damage_dealt, full.stuns) == (result.wins, result.ttk_hist, result.damage_dealt, result.stuns)
+        duels, ticks, total, full_rerun = batch.last_edit
+        mode = "从头重跑" if full_rerun else "增量"
+        print(f"  {label}: {mode} {edit_time * 1000:.0f}ms (重算 {duels} 场, {ticks}/{total} 帧)  |  从头 {full_time * 1000:.0f}ms  "
+              f"P1 胜率 {result.win_rate(1):.1%}  结果{'一致' if same else '不一致!'}")
+
+    matchups = (
+        ((create_heavy_fighter, create_swift_fighter), (
+            ("开山斧 韧性 25 -> 35", 1, "start", {"toughness": 35.0}),
+            ("太极剑·挑 伤害 15 -> 20", 2, "atk2", {"power": 20}),
+            ("开山斧 前摇 1.0 -> 0.8", 1, "start", {"windup": 0.8}),
+        )),
+        ((create_closer_fighter, create_swift_fighter), (
+            ("收招 伤害 40 -> 50", 1, "finish", {"power": 50}),
+            ("收招 前摇 0.6 -> 0.4", 1, "finish", {"windup": 0.4}),
+            ("梯云纵 后撤 2.0 -> 2.5", 2, "dodge", {"backdash": 2.5}),
+        )),
+    )
+    for factories, edits in matchups:
+        batch = IncrementalBatch(factories[0](verbose=False), factories[1](verbose=False), range(3000))
+        start = time.perf_counter()
+        result = batch.run()
+        print(f"{batch.p1.name} vs {batch.p2.name} 首次完整记录: {time.perf_counter() - start:.2f}s  P1 胜率 {result.win_rate(1):.1%}")
+        for label, side, key, params in edits:
+            start = time.perf_counter()
+            result = batch.edit(side, key, **params)
+            edit_time = time.perf_counter() - start
+            check(batch, label, factories)
+        start = time.perf_counter()
+        ticks = batch.refresh()
+        print(f"  补齐记录: {ticks} 帧 {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,284 @@
+import argparse
+import time
+from fractions import Fraction
+
+import numpy as np
+
+from wuxia_combat_demo import (ActionType, ActionNode, ConditionNode, hit_chance, run_batch,
+                               create_brute_fighter, create_taiji_fighter)
+
+# --- 回合制对决的精确解 (马尔可夫链) ---
+# 回合制引擎里唯一的随机性是攻击节点的那一次 random() < 命中率，而命中率只取决于敌人当前的招式类型。
+# 所以回合开始时的 (P1节点, P1招式类型, P1生命, P2节点, P2招式类型, P2生命) 完全决定了下一回合的分布 ——
+# 对固定的一对招式链，这是一条有限状态马尔可夫链 (伤害是招式的 power，生命只减不增，可达的生命值有限，不必再分桶)。
+#
+# 这里从开局状态出发枚举所有可达状态，把一回合 (先 P1 行动，P2 再读取 P1 的新状态行动) 展开成稀疏转移表，
+# 各角色的单步结算 (命中表、判定结果) 按输入缓存，只算一次。然后逐回合推进概率分布 (即转移矩阵的幂)，
+# 直接得到胜负概率、回合数分布和期望回合数，不用抽样；一次推进可以同时给出多个回合上限下的结果。
+# 抽样 (run_batch) 仍然保留，用来交叉校验。
+#
+# 判定节点照原样调用 check_func，只是传入的是只有 name / max_hp / hp / current_action 的状态视图，
+# 所以条件只能读这几项 (声明式 Condition 和只看生命、招式类型的 lambda 都满足)。
+
+UNBOUNDED_TOL = 1e-12     # 不限回合时，未分胜负的概率低于它就停止推进
+UNBOUNDED_CAP = 100000    # 不限回合时最多推进的回合数
+
+class _View:
+    """判定节点求值用的角色视图"""
+    __slots__ = ("name", "max_hp", "hp", "current_action")
+
+    def __init__(self, fighter):
+        self.name = fighter.name
+        self.max_hp = fighter.max_hp
+        self.hp = fighter.max_hp
+        self.current_action = ActionType.WAIT
+
+class _StepTable:
+    """一名角色的单步结算表
+
+    (节点, 自身招式类型, 自身生命, 敌方招式类型, 敌方生命) -> ((概率, 下一节点, 新招式类型, 造成伤害), ...)
+    """
+    def __init__(self, fighter, enemy, number):
+        self.nodes = fighter.nodes
+        self.number = number
+        self.one = number(1)
+        self.me = _View(fighter)
+        self.enemy = _View(enemy) # 名字、生命上限取自对手
+        self.cache = {}
+
+    def _next(self, name):
+        # 与 Fighter.step 相同: 不存在的节点 (招式链结束) 回到开头
+        return name if name in self.nodes else "start"
+
+    def outcomes(self, key, action, hp, enemy_action, enemy_hp):
+        node = self.nodes[key]
+        if isinstance(node, ActionNode):
+            ident = (key, enemy_action) # 动作节点的结果与双方生命无关
+        else:
+            ident = (key, action, hp, enemy_action, enemy_hp)
+        out = self.cache.get(ident)
+        if out is None:
+            out = self.cache[ident] = self._resolve(node, action, hp, enemy_action, enemy_hp)
+        return out
+
+    def _resolve(self, node, action, hp, enemy_action, enemy_hp):
+        if isinstance(node, ActionNode):
+            nxt = self._next(node.next_node)
+            if node.action_type != ActionType.ATTACK:
+                return ((self.one, nxt, node.action_type, 0),)
+            p = self.number(hit_chance(enemy_action))
+            out = []
+            if p:
+                out.append((p, nxt, node.action_type, node.power))
+            if p != self.one:
+                out.append((self.one - p, nxt, node.action_type, 0))
+            return tuple(out)
+        if isinstance(node, ConditionNode):
+            me, enemy = self.me, self.enemy
+            me.hp, me.current_action = hp, action
+            enemy.hp, enemy.current_action = enemy_hp, enemy_action
+            nxt = node.true_node if node.check_func(me, enemy) else node.false_node
+            return ((self.one, self._next(nxt), action, 0),)
+        raise ValueError(f"【{node.name}】既不是动作节点也不是判定节点，无法展开成马尔可夫链")
+
+class ChainResult:
+    """精确解: wins 与 run_batch 一样按 [平局, P1胜, P2胜] 排列 (这里是概率)
+
+    ended[t] 为对决在第 t 回合结束的概率 (回合上限时仍未分出胜负的那部分也算在最后一回合)。
+    """
+    def __init__(self, wins, ended, max_turns):
+        self.wins = wins
+        self.ended = ended
+        self.max_turns = max_turns
+
+    @property
+    def expected_turns(self):
+        return sum(t * p for t, p in enumerate(self.ended))
+
+    def __repr__(self):
+        draw, p1, p2 = (float(p) for p in self.wins)
+        return f"ChainResult(P1胜 {p1:.4f}, P2胜 {p2:.4f}, 平局 {draw:.4f}, 期望 {float(self.expected_turns):.2f} 回合)"
+
+class TurnChain:
+    """一对招式链的回合制对决转移表 (两名角色都从 reset 后的状态开局)
+
+    exact 为 True 时概率用 Fraction 表示 (命中率按其十进制写法取有理数)，否则用 float64 和 numpy 推进。
+    """
+    def __init__(self, p1, p2, exact=False):
+        self.exact = exact
+        number = (lambda x: Fraction(repr(x))) if exact else float
+        t1, t2 = _StepTable(p1, p2, number), _StepTable(p2, p1, number)
+        start = ("start", ActionType.WAIT, p1.max_hp, "start", ActionType.WAIT, p2.max_hp)
+        states = [start]
+        index = {start: 0}
+        src, dst, prob = [], [], []
+        k = 0
+        while k < len(states):
+            k1, a1, h1, k2, a2, h2 = states[k]
+            if h1 > 0 and h2 > 0:
+                merged = {}
+                for p, n1, b1, d1 in t1.outcomes(k1, a1, h1, a2, h2):
+                    g2 = h2 - d1
+                    if g2 <= 0: # P2 倒下，本回合不再行动
+                        nxt = (n1, b1, h1, k2, a2, g2)
+                        merged[nxt] = merged.get(nxt, 0) + p
+                        continue
+                    for q, n2, b2, d2 in t2.outcomes(k2, a2, g2, b1, h1):
+                        nxt = (n1, b1, h1 - d2, n2, b2, g2)
+                        merged[nxt] = merged.get(nxt, 0) + p * q
+                for nxt, p in merged.items():
+                    j = index.get(nxt)
+                    if j is None:
+                        j = index[nxt] = len(states)
+                        states.append(nxt)
+                    src.append(k)
+                    dst.append(j)
+                    prob.append(p)
+            k += 1
+        self.states = states
+        self.live = [s[2] > 0 and s[5] > 0 for s in states]
+        self.winner = [1 if s[2] > s[5] else 2 if s[5] > s[2] else 0 for s in states]
+        if exact:
+            self.src, self.dst, self.prob = src, dst, prob
+        else:
+            self.src = np.asarray(src, dtype=np.int64)
+            self.dst = np.asarray(dst, dtype=np.int64)
+            self.prob = np.asarray(prob, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.states)
+
+    def solve(self, max_turns=10):
+        """与 simulate_duel(max_turns) 对应的精确结果；max_turns 为 None 时推进到几乎必然分出胜负"""
+        return self.horizons([max_turns])[0]
+
+    def horizons(self, limits):
+        """一次推进，给出多个回合上限下的结果 (按 limits 的顺序返回)"""
+        limits = list(limits)
+        if None in limits:
+            if self.exact:
+                raise ValueError("精确模式必须给出回合上限")
+            if len(limits) > 1:
+                raise ValueError("不限回合时只能单独求解")
+        elif any(t < 0 for t in limits):
+            raise ValueError("回合上限不能为负数")
+        if self.exact:
+            return self._horizons_exact(limits)
+        return self._horizons_float(limits)
+
+    def _horizons_float(self, limits):
+        n = len(self.states)
+        live = np.asarray(self.live, dtype=bool)
+        winner = np.asarray(self.winner, dtype=np.int64)
+        v = np.zeros(n)
+        v[0] = 1.0
+        wins = np.zeros(3)
+        ended = [0.0]
+        snapshots = {}
+        unbounded = limits == [None]
+        stop = UNBOUNDED_CAP if unbounded else max(limits)
+        turn = 0
+        while True:
+            dead = v * ~live
+            if dead.any():
+                wins += np.bincount(winner, weights=dead, minlength=3)
+                ended[-1] += dead.sum()
+                v = v * live
+            remaining = v.sum()
+            if turn in limits:
+                final = wins + np.bincount(winner, weights=v, minlength=3)
+                snapshots[turn] = ChainResult(final.tolist(), ended[:-1] + [ended[-1] + remaining], turn)
+            if unbounded and remaining < UNBOUNDED_TOL:
+                snapshots[None] = ChainResult(wins.tolist(), ended, turn)
+                break
+            if turn >= stop:
+                if unbounded:
+                    raise ValueError(f"推进 {turn} 回合后仍有 {remaining:.3g} 的概率未分胜负，"
+                                     "可能存在不掉血的循环，请给出回合上限")
+                break
+            turn += 1
+            v = np.bincount(self.dst, weights=v[self.src] * self.prob, minlength=n)
+            ended.append(0.0)
+        return [snapshots[t] for t in limits]
+
+    def _horizons_exact(self, limits):
+        live, winner = self.live, self.winner
+        edges = {}
+        for k, j, p in zip(self.src, self.dst, self.prob):
+            edges.setdefault(k, []).append((j, p))
+        v = {0: Fraction(1)}
+        wins = [Fraction(0)] * 3
+        ended = [Fraction(0)]
+        snapshots = {}
+        for turn in range(max(limits) + 1):
+            if turn:
+                nv = {}
+                for k, mass in v.items():
+                    for j, p in edges[k]:
+                        nv[j] = nv.get(j, 0) + mass * p
+                v = nv
+                ended.append(Fraction(0))
+            for k in [k for k in v if not live[k]]:
+                mass = v.pop(k)
+                wins[winner[k]] += mass
+                ended[-1] += mass
+            if turn in limits:
+                final = list(wins)
+                for k, mass in v.items():
+                    final[winner[k]] += mass
+                snapshots[turn] = ChainResult(final, ended[:-1] + [ended[-1] + sum(v.values())], turn)
+        return [snapshots[t] for t in limits]
+
+def sample(p1, p2, seeds, max_turns=10):
+    """抽样对照: 用 run_batch 实际跑这些种子，返回 [平局, P1胜, P2胜] 的频率"""
+    wins = run_batch(p1, p2, seeds, max_turns)
+    n = sum(wins)
+    return [w / n for w in wins]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="回合制对决的精确胜率 (与抽样对照)")
+    parser.add_argument("--turns", type=int, default=10, help="回合上限")
+    parser.add_argument("--samples", type=int, default=20000, help="抽样对照的场数 (0 为不抽样)")
+    parser.add_argument("--exact", action="store_true", help="用分数给出精确概率")
+    args = parser.parse_args(argv)
+
+    p1 = create_brute_fighter(verbose=False)
+    p2 = create_taiji_fighter(verbose=False)
+    print(f"{p1.name} vs {p2.name}")
+
+    start = time.perf_counter()
+    chain = TurnChain(p1, p2, exact=args.exact)
+    built = time.perf_counter() - start
+    start = time.perf_counter()
+    result = chain.solve(args.turns)
+    solved = time.perf_counter() - start
+    print(f"可达状态 {len(chain)} 个  转移 {len(chain.prob)} 条  建表 {built * 1000:.1f}ms  求解 {solved * 1000:.1f}ms")
+    print(f"精确 ({args.turns} 回合上限): {result}")
+    if args.exact:
+        draw, win1, win2 = result.wins
+        print(f"  P1胜 = {win1}\n  P2胜 = {win2}\n  平局 = {draw}\n  期望回合 = {result.expected_turns}")
+
+    if args.samples:
+        start = time.perf_counter()
+        freq = sample(p1, p2, range(args.samples), args.turns)
+        sampled = time.perf_counter() - start
+        print(f"抽样 {args.samples} 场 ({sampled:.2f}s):")
+        for label, f, p in zip(("平局", "P1胜", "P2胜"), freq, result.wins):
+            sigma = (float(p) * (1 - float(p)) / args.samples) ** 0.5
+            z = (f - float(p)) / sigma if sigma else 0.0
+            print(f"  {label}: 抽样 {f:.4f}  精确 {float(p):.4f}  偏差 {z:+.1f}σ")
+
+    if not args.exact:
+        curve = chain.horizons(range(5, 45, 5))
+        print("回合上限与胜率 (一次推进):")
+        for r in curve:
+            draw, win1, win2 = r.wins
+            print(f"  {r.max_turns:>3} 回合: P1胜 {win1:.4f}  P2胜 {win2:.4f}  平局 {draw:.4f}  期望 {r.expected_turns:.2f} 回合")
+        try:
+            print(f"不限回合: {chain.solve(None)}")
+        except ValueError as e:
+            print(f"不限回合: {e}")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,85 @@
+import copy
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from wuxia_batch import BatchResult, run_batch
+from wuxia_timeline_demo import create_heavy_fighter, create_swift_fighter
+
+# --- 多进程对阵矩阵 ---
+# 每个任务只携带 (i, j, 种子块)，招式图在工作进程启动时一次性传入，
+# 避免每个任务都重复 pickle 整张招式图。
+
+_worker_flows = None
+
+def _init_worker(flows):
+    global _worker_flows
+    _worker_flows = flows
+
+def _run_block(i, j, seeds, duel_kwargs):
+    # 每块都拷贝一份，保证自己打自己 (i == j) 时是两个独立的角色
+    p1 = copy.deepcopy(_worker_flows[i])
+    p2 = copy.deepcopy(_worker_flows[j])
+    return i, j, run_batch(p1, p2, seeds, **duel_kwargs)
+
+def split_seeds(seeds, block_size):
+    """把种子序列切成若干块 (range 切片仍是 range，pickle 几乎零成本)"""
+    return [seeds[k:k + block_size] for k in range(0, len(seeds), block_size)]
+
+def iter_matrix(flows, seeds, block_size=2000, max_workers=None, **duel_kwargs):
+    """在进程池中跑 N×N 对阵，每完成一个种子块就 yield (i, j, BatchResult)
+
+    flows: Fighter 模板列表 (必须可 pickle，条件节点请用 wuxia_condition.Condition 而不是 lambda)
+    duel_kwargs: 透传给 run_batch (initial_distance / distance_jitter / dt / time_limit)
+    """
+    blocks = split_seeds(seeds, block_size)
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(flows,)) as pool:
+        futures = [pool.submit(_run_block, i, j, block, duel_kwargs)
+                   for block in blocks
+                   for i in range(len(flows))
+                   for j in range(len(flows))]
+        for future in as_completed(futures):
+            i, j, result = future.result()
+            yield i, j, result
+
+def run_matrix(flows, seeds, block_size=2000, max_workers=None, on_progress=None, **duel_kwargs):
+    """跑完整个矩阵，返回 matrix[i][j] = flows[i] 作为 P1 对 flows[j] 的 BatchResult
+
+    on_progress(i, j, partial, done, total) 在每个种子块完成时调用，partial 为该格子当前的累计结果。
+    """
+    dt = duel_kwargs.get("dt", 0.1)
+    n = len(flows)
+    matrix = [[BatchResult(dt) for _ in range(n)] for _ in range(n)]
+    total = n * n * len(split_seeds(seeds, block_size))
+    done = 0
+    for i, j, result in iter_matrix(flows, seeds, block_size, max_workers, **duel_kwargs):
+        matrix[i][j].merge(result)
+        done += 1
+        if on_progress is not None:
+            on_progress(i, j, matrix[i][j], done, total)
+    return matrix
+
+def format_matrix(flows, matrix):
+    """胜率表: 行为 P1，列为 P2，格内为 P1 胜率 (用编号做表头，避免中文宽度错位)"""
+    n = len(flows)
+    lines = [f"[{k}] {f.name}" for k, f in enumerate(flows)]
+    lines.append("P1\\P2" + "".join(f"{f'[{j}]':>8}" for j in range(n)))
+    for i in range(n):
+        lines.append(f"{f'[{i}]':<6}" + "".join(f"{matrix[i][j].win_rate(1):>8.1%}" for j in range(n)))
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    flows = [create_heavy_fighter(verbose=False), create_swift_fighter(verbose=False)]
+    seeds = range(5000)
+
+    def progress(i, j, partial, done, total):
+        print(f"  [{done}/{total}] {flows[i].name} vs {flows[j].name}: 已完成 {partial.duels} 场, P1 胜率 {partial.win_rate(1):.1%}")
+
+    for workers in sorted({1, os.cpu_count() or 1}):
+        start = time.perf_counter()
+        matrix = run_matrix(flows, seeds, max_workers=workers, on_progress=progress)
+        elapsed = time.perf_counter() - start
+        duels = len(seeds) * len(flows) ** 2
+        print(f"\n{workers} 个进程: {duels} 场用时 {elapsed:.2f}s ({duels / elapsed * 60:,.0f} 场/分钟)")
+    print()
+    print(format_matrix(flows, matrix))
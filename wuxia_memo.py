@@ -0,0 +1,193 @@
+import sys
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from wuxia_trace import Ev
+from wuxia_timeline_demo import TIME_UNIT, DistanceManager, DuelResult, to_ms, create_heavy_fighter, create_swift_fighter
+
+# --- 对局置换表 (transposition cache) ---
+# 时间轴引擎没有随机性，且动作逻辑只依赖双方运行时状态和距离，不依赖绝对时间
+# (last_hit_time 只写不读)。所以同一个局面 (双方招式指针、阶段、计时、耐力、生命、削韧、距离)
+# 往后的走向是确定的: 第一次模拟到分出胜负后，把沿途每个局面的结局记下来，之后任何对局走到
+# 这些局面都直接套用结局，不再逐帧推进。
+#
+# 局面键使用精确的浮点值 (不做量化)，命中时的结果与逐帧模拟逐位一致。
+# 只缓存在时限内分出胜负的结局; 超时平局的结局取决于剩余时间 (终局生命是时限那一帧的状态)，不缓存。
+# 所以置换表只对大多数对局能分出胜负的对阵有用: 以超时告终的对局每场都要逐帧跑完，一帧也省不了。
+# 命中后 DuelResult 的各项 (胜负、用时、生命、伤害、僵直次数) 都是精确的，
+# 但 Fighter 的其余运行时状态停在命中时刻，不是终局状态。
+
+_HIT_EVENTS = frozenset((Ev.DAMAGE, Ev.DODGE_IMMUNE, Ev.STUN, Ev.POISE_HOLD)) # take_damage 必发其一，a=伤害
+
+class _HitLog:
+    """挂在 Fighter.trace 上，只记下每次受到的伤害 (用于精确重放伤害累加)"""
+    def __init__(self):
+        self.hits = ([], [])
+
+    def record(self, t, actor, code, node, a, b, c):
+        if code in _HIT_EVENTS:
+            self.hits[actor].append(a)
+
+def _state_key(p1, p2, dist_mgr):
+    node1 = p1.current_action_node
+    node2 = p2.current_action_node
+    return (p1.hp, p1.state, p1.state_timer, p1.stun_duration, p1.current_node_name,
+            id(node1) if node1 is not None else 0, p1.poise_damage_accumulator, p1.stamina,
+            p2.hp, p2.state, p2.state_timer, p2.stun_duration, p2.current_node_name,
+            id(node2) if node2 is not None else 0, p2.poise_damage_accumulator, p2.stamina,
+            dist_mgr.distance)
+
+# 时间轴缓存有上限: 扫描 dt / 时限时不会为每种组合都留一份
+TICK_TIMES_CACHE_SIZE = 16
+
+@lru_cache(maxsize=TICK_TIMES_CACHE_SIZE)
+def tick_times(dt, time_limit):
+    """与 simulate_duel 相同的整数毫秒时间轴上第 k 帧开始时的时间 (秒)，长度为时限内的帧数 + 1
+    (最后一项即超时平局的用时)；返回的列表是共享的，不要修改"""
+    step = to_ms(dt)
+    if step <= 0:
+        raise ValueError(f"dt 至少为 1 毫秒: {dt}")
+    ticks = -(-to_ms(time_limit) // step)
+    return [k * step / TIME_UNIT for k in range(ticks + 1)]
+
+class TranspositionCache:
+    """局面 -> 结局 的有界 LRU 缓存
+
+    结局为 (剩余帧数, 胜方, P1终局生命, P2终局生命, P1全场受到的各次伤害, 此后的起始下标,
+    P2全场受到的各次伤害, 此后的起始下标, P1此后僵直次数, P2此后僵直次数, 分摊的字节数)。
+    同一场沿途的所有局面共享同一份伤害序列，只各记一个下标，占用随局面数线性增长 (而不是每个局面存一份后缀)。
+    max_bytes 为缓存占用内存的估算上限。
+    一个缓存只服务于一对固定的招式图和 dt (键里的节点用对象 id 表示)，换了对手请换缓存。
+    """
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._bound = None
+
+    def bind(self, p1, p2, dt):
+        """首次使用时记住招式图和 dt，之后换了招式图或 dt 就报错 (节点 id 不再有意义)"""
+        # 同时持有节点字典的引用，保证其中节点的 id 在缓存存续期间不会被复用
+        binding = (p1.nodes, p2.nodes, dt)
+        if self._bound is None:
+            self._bound = binding
+        elif self._bound[0] is not p1.nodes or self._bound[1] is not p2.nodes or self._bound[2] != dt:
+            raise ValueError("置换表已绑定到另一对招式图或另一个 dt")
+
+    def get(self, key):
+        outcome = self.entries.get(key)
+        if outcome is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return outcome
+
+    def put(self, key, outcome):
+        if key in self.entries:
+            return
+        self.entries[key] = outcome
+        self.bytes += self._size(key, outcome)
+        while self.bytes > self.max_bytes and self.entries:
+            old_key, old_outcome = self.entries.popitem(last=False)
+            self.bytes -= self._size(old_key, old_outcome)
+            self.evictions += 1
+
+    @staticmethod
+    def _size(key, outcome):
+        # 估算: 键/值元组本身 + 分摊到本局面的共享伤害序列 + 有序字典的每项开销 (浮点数多为共享对象，不逐个计入)
+        return sys.getsizeof(key) + sys.getsizeof(outcome) + outcome[-1] + 100
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups if lookups else 0.0
+        return f"局面 {len(self.entries)} 个 (约 {self.bytes / 1024 / 1024:.1f} MB)  命中 {self.hits}  未命中 {self.misses}  命中率 {rate:.1%}  淘汰 {self.evictions}"
+
+def simulate_duel_cached(p1, p2, cache, initial_distance=3.0, dt=0.1, time_limit=60.0):
+    """与 simulate_duel 结果逐位一致，但每帧先查置换表，命中就直接套用结局
+
+    要求双方关闭 verbose、未挂 CombatTrace (命中后剩余的事件不会发生)。
+    超时平局的对局不写入置换表 (见模块说明)，这类对局没有加速。
+    """
+    if p1.verbose or p2.verbose or p1.trace is not None or p2.trace is not None:
+        raise ValueError("置换表模式下不能输出日志或记录事件")
+    cache.bind(p1, p2, dt)
+    times = tick_times(dt, time_limit)
+    limit = len(times) - 1
+    dist_mgr = DistanceManager(initial_distance)
+    log = _HitLog()
+    p1.trace = p2.trace = log
+    p1.trace_id, p2.trace_id = 0, 1
+    hits1, hits2 = log.hits
+    path = [] # 本场经过的 (局面, 帧号, 两边已记录的伤害条数, 两边僵直次数)
+    tick = 0
+    outcome = None
+    try:
+        while p1.hp > 0 and p2.hp > 0 and tick < limit:
+            key = _state_key(p1, p2, dist_mgr)
+            cached = cache.get(key)
+            if cached is not None and cached[0] <= limit - tick:
+                outcome = cached
+                break
+            path.append((key, tick, len(hits1), len(hits2), p1.stun_count, p2.stun_count))
+            t = times[tick]
+            p1.update(dt, p2, t, dist_mgr)
+            p2.update(dt, p1, t, dist_mgr)
+            tick += 1
+    finally:
+        p1.trace = p2.trace = None
+
+    if outcome is not None:
+        ticks_left, winner, hp1, hp2, all1, k1, all2, k2, stuns1, stuns2, _ = outcome
+        more1, more2 = all1[k1:], all2[k2:]
+        for damage in more1:
+            p1.damage_taken += damage
+        for damage in more2:
+            p2.damage_taken += damage
+        p1.hp, p2.hp = hp1, hp2
+        p1.stun_count += stuns1
+        p2.stun_count += stuns2
+        hits1.extend(more1)
+        hits2.extend(more2)
+        end = tick + ticks_left
+    else:
+        end = tick
+        if p1.hp <= 0: winner = 2
+        elif p2.hp <= 0: winner = 1
+        else: winner = 0
+
+    if winner and path:
+        all1, all2 = tuple(hits1), tuple(hits2) # 本场的伤害序列只存一份，沿途局面各记起始下标
+        share = (sys.getsizeof(all1) + sys.getsizeof(all2)) // len(path)
+        for key, k, n1, n2, s1, s2 in path:
+            cache.put(key, (end - k, winner, p1.hp, p2.hp, all1, n1, all2, n2,
+                            p1.stun_count - s1, p2.stun_count - s2, share))
+    return DuelResult(winner, times[end], p1, p2)
+
+if __name__ == "__main__":
+    from wuxia_batch import run_batch
+
+    n = 5000
+    for distance_jitter in (0.5, 0.0):
+        p1 = create_heavy_fighter(verbose=False)
+        p2 = create_swift_fighter(verbose=False)
+        start = time.perf_counter()
+        plain = run_batch(p1, p2, range(n), distance_jitter=distance_jitter)
+        plain_time = time.perf_counter() - start
+
+        cache = TranspositionCache()
+        start = time.perf_counter()
+        cached = run_batch(p1, p2, range(n), distance_jitter=distance_jitter, cache=cache)
+        cached_time = time.perf_counter() - start
+
+        same = (plain.wins, plain.ttk_hist, plain.damage_dealt, plain.stuns) == (cached.wins, cached.ttk_hist, cached.damage_dealt, cached.stuns)
+        print(f"初始距离抖动 ±{distance_jitter}m, {n} 场: 逐帧 {plain_time:.2f}s  |  置换表 {cached_time:.2f}s  "
+              f"(加速 {plain_time / cached_time:.1f}x, 结果{'一致' if same else '不一致!'})")
+        print(f"  {cache.stats()}")
@@ -0,0 +1,301 @@
+import argparse
+import time
+from time import perf_counter_ns
+
+from wuxia_timeline_demo import Fighter, CompiledFlow, State, ActionType
+
+# --- 分阶段性能剖析 ---
+# Fighter.update 是一个长函数，按进入时的状态分成 僵直/站立/移动/前摇/判定/后摇 几段，
+# 每段又有若干出口 (受身、起手、挥空、连招取消...)。Profiler 在运行时把 Fighter.update、
+# Fighter.perform_hit_check 和 CompiledFlow.resolve 换成带计数的版本 (选招时用到的条件函数也临时换掉)，统计:
+#   - 每个 (阶段, 分支) 的调用次数 —— 分支由进入/离开时的状态判断，不改动引擎代码
+#   - 可选的抽样计时: 每 sample_every 次 update 计一次时，按比例估算各分支的耗时
+#     (其中选招和出招判定的耗时单独列出，不重复计入所在分支)
+#   - 每次选招求值的条件节点数的分布
+# 关闭时换回原来的方法和条件函数，引擎里没有任何额外判断，开销为零。
+# 只统计当前进程: 用进程池的批量模拟 (wuxia_matrix) 需在子进程里各自开启。
+#
+# 用法:
+#   with Profiler(sample_every=64) as prof:
+#       run_batch(p1, p2, range(2000))
+#   print(prof.report())
+#   prof.write_folded("duel.folded")  # 可交给 flamegraph.pl / speedscope 画火焰图
+
+_S = State
+# (进入时状态, 离开时状态) -> 分支名；僵直 -> 站立 还要看耐力是否扣除 (受身)
+_PATHS = {
+    (_S.STUNNED, _S.STUNNED): "僵直中",
+    (_S.STUNNED, _S.IDLE): "僵直恢复",
+    (_S.IDLE, _S.IDLE): "观望",
+    (_S.IDLE, _S.MOVE): "开始接近",
+    (_S.IDLE, _S.WINDUP): "起手",
+    (_S.MOVE, _S.MOVE): "接近中",
+    (_S.MOVE, _S.WINDUP): "进入射程",
+    (_S.MOVE, _S.IDLE): "耐力不足",
+    (_S.WINDUP, _S.WINDUP): "前摇中",
+    (_S.WINDUP, _S.ACTIVE): "出招",
+    (_S.WINDUP, _S.IDLE): "挥空",
+    (_S.ACTIVE, _S.ACTIVE): "判定中",
+    (_S.ACTIVE, _S.IDLE): "连招取消",
+    (_S.ACTIVE, _S.RECOVERY): "进入后摇",
+    (_S.RECOVERY, _S.RECOVERY): "后摇中",
+    (_S.RECOVERY, _S.IDLE): "收招",
+}
+_UKEMI = "受身"
+
+_original = {}   # 被替换的方法
+_active = None   # 当前开启的 Profiler (同一时间只能有一个)
+
+class Profiler:
+    """Fighter.update 的分支计数 + 抽样计时 + 选招步数分布
+
+    sample_every: 每多少次 update 抽一次计时，0 表示只计数不计时。
+    可以反复 enable()/disable() 累加统计，reset() 清零。
+    """
+    def __init__(self, sample_every=64):
+        if sample_every < 0:
+            raise ValueError("sample_every 不能为负数")
+        self.sample_every = sample_every
+        self.calls = {}        # (阶段, 分支) -> 次数
+        self.sampled_ns = {}   # (阶段, 分支) -> 抽中那些次的自身耗时 (不含选招/出招判定)
+        self.child_ns = {}     # (阶段, 分支, 子项) -> 抽中那些次里子项的耗时
+        self.steps = {}        # 选招经过的条件节点数 -> 次数
+        self.hit_checks = {}   # 招式类型 -> 出招判定次数
+        self._instrumented = {} # 开启期间换过 checks 的 CompiledFlow -> 原来的 checks
+        self.reset()
+
+    def reset(self):
+        # 原地清空: 开启中的计数方法持有的是这些字典本身
+        for table in (self.calls, self.sampled_ns, self.child_ns, self.steps, self.hit_checks):
+            table.clear()
+        self.samples = 0
+        self._countdown = self.sample_every
+        self._child = None     # 抽样中的 update 里，子项累计的耗时 {子项: ns}
+
+    # --- 开关 ---
+
+    def enable(self):
+        global _active
+        if _active is self:
+            return self
+        if _active is not None:
+            raise ValueError("已有另一个 Profiler 在运行")
+        if not _original:
+            _original.update(update=Fighter.update, hit_check=Fighter.perform_hit_check, resolve=CompiledFlow.resolve)
+        Fighter.update = self._wrap_update(_original["update"])
+        Fighter.perform_hit_check = self._wrap_hit_check(_original["hit_check"])
+        CompiledFlow.resolve = self._wrap_resolve(_original["resolve"])
+        _active = self
+        return self
+
+    def disable(self):
+        global _active
+        if _active is not self:
+            return
+        Fighter.update = _original["update"]
+        Fighter.perform_hit_check = _original["hit_check"]
+        CompiledFlow.resolve = _original["resolve"]
+        for flow, checks in self._instrumented.items():
+            flow.checks = checks
+        self._instrumented.clear()
+        _active = None
+
+    def __enter__(self):
+        return self.enable()
+
+    def __exit__(self, *exc):
+        self.disable()
+        return False
+
+    # --- 带计数的方法 ---
+
+    def _wrap_update(self, update):
+        calls, sampled_ns, child_ns = self.calls, self.sampled_ns, self.child_ns
+        paths, stunned, idle = _PATHS, State.STUNNED, State.IDLE
+        names = State.NAMES
+        profiler = self
+
+        def counted_update(fighter, dt, enemy, current_time, dist_mgr):
+            if fighter.hp <= 0:
+                return
+            before = fighter.state
+            stamina = fighter.stamina
+            profiler._countdown -= 1
+            if profiler._countdown == 0:
+                profiler._countdown = profiler.sample_every
+                profiler._child = child = {}
+                start = perf_counter_ns()
+                update(fighter, dt, enemy, current_time, dist_mgr)
+                elapsed = perf_counter_ns() - start
+                profiler._child = None
+            else:
+                child = None
+                update(fighter, dt, enemy, current_time, dist_mgr)
+            after = fighter.state
+            if before == stunned and after == idle and fighter.stamina < stamina:
+                path = _UKEMI
+            else:
+                path = paths.get((before, after)) or f"{names[before]}->{names[after]}"
+            key = (names[before], path)
+            calls[key] = calls.get(key, 0) + 1
+            if child is not None:
+                profiler.samples += 1
+                for name, ns in child.items():
+                    elapsed -= ns
+                    sub = key + (name,)
+                    child_ns[sub] = child_ns.get(sub, 0) + ns
+                sampled_ns[key] = sampled_ns.get(key, 0) + elapsed
+
+        return counted_update
+
+    def _wrap_hit_check(self, hit_check):
+        hit_checks = self.hit_checks
+        profiler = self
+
+        def counted_hit_check(fighter, node, enemy, current_time, dist_mgr):
+            kind = ActionType.NAMES[node.action_type]
+            hit_checks[kind] = hit_checks.get(kind, 0) + 1
+            child = profiler._child
+            if child is None:
+                return hit_check(fighter, node, enemy, current_time, dist_mgr)
+            start = perf_counter_ns()
+            hit_check(fighter, node, enemy, current_time, dist_mgr)
+            child["perform_hit_check"] = child.get("perform_hit_check", 0) + perf_counter_ns() - start
+
+        return counted_hit_check
+
+    def _wrap_resolve(self, resolve):
+        # 不复制 resolve 的循环: 把各条件节点的 check 换成带计数的版本，调用原来的 resolve，
+        # 数出这次选招求值了几个条件 (共享结果的条件在同一次选招里只求值一次，也只计一次)
+        steps_hist = self.steps
+        instrumented = self._instrumented
+        profiler = self
+        counter = [0]
+
+        def count(check):
+            def counted_check(fighter, enemy, distance):
+                counter[0] += 1
+                return check(fighter, enemy, distance)
+            return counted_check
+
+        def counted_resolve(flow, fighter, enemy, distance=None):
+            if flow not in instrumented:
+                instrumented[flow] = flow.checks
+                flow.checks = [None if check is None else count(check) for check in flow.checks]
+            counter[0] = 0
+            child = profiler._child
+            if child is None:
+                action = resolve(flow, fighter, enemy, distance)
+            else:
+                start = perf_counter_ns()
+                action = resolve(flow, fighter, enemy, distance)
+                child["resolve"] = child.get("resolve", 0) + perf_counter_ns() - start
+            steps = counter[0]
+            steps_hist[steps] = steps_hist.get(steps, 0) + 1
+            return action
+
+        return counted_resolve
+
+    # --- 导出 ---
+
+    def estimated_ns(self):
+        """按抽样比例估算的耗时 {(阶段, 分支[, 子项]): ns}，未开启计时时为空"""
+        scale = self.sample_every
+        estimate = {key: ns * scale for key, ns in self.sampled_ns.items()}
+        estimate.update((key, ns * scale) for key, ns in self.child_ns.items())
+        return estimate
+
+    def as_dict(self):
+        """可直接 json.dump 的统计结果"""
+        return {
+            "sample_every": self.sample_every,
+            "samples": self.samples,
+            "calls": [{"phase": phase, "path": path, "count": n} for (phase, path), n in sorted(self.calls.items())],
+            "estimated_ns": [{"stack": list(key), "ns": ns} for key, ns in sorted(self.estimated_ns().items())],
+            "resolve_steps": {str(k): n for k, n in sorted(self.steps.items())},
+            "hit_checks": dict(self.hit_checks),
+        }
+
+    def folded(self):
+        """火焰图的折叠栈格式 ("帧;帧;帧 数值" 每行一条)，数值为估算的纳秒；未计时则用调用次数"""
+        lines = []
+        if self.sample_every and self.samples:
+            for key, ns in sorted(self.estimated_ns().items()):
+                lines.append(f"Fighter.update;{';'.join(key)} {ns}")
+        else:
+            for (phase, path), n in sorted(self.calls.items()):
+                lines.append(f"Fighter.update;{phase};{path} {n}")
+        return lines
+
+    def write_folded(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(self.folded()) + "\n")
+
+    def report(self):
+        total = sum(self.calls.values())
+        if not total:
+            return "没有记录到 Fighter.update 调用"
+        estimate = self.estimated_ns()
+        timed = bool(self.sample_every and self.samples)
+        lines = [f"Fighter.update 共 {total} 次" + (f" (每 {self.sample_every} 次抽样计时，共 {self.samples} 次)" if timed else "")]
+        header = f"  {'阶段':<6}{'分支':<8}{'次数':>10}{'占比':>8}"
+        if timed:
+            header += f"{'自身耗时':>12}{'ns/次':>8}"
+        lines.append(header)
+        for (phase, path), n in sorted(self.calls.items(), key=lambda item: -item[1]):
+            line = f"  {phase:<6}{path:<8}{n:>10}{n / total:>8.1%}"
+            if timed:
+                ns = estimate.get((phase, path), 0)
+                line += f"{ns / 1e6:>10.1f}ms{ns / n:>8.0f}"
+            lines.append(line)
+            if timed:
+                for key, child in sorted(estimate.items()):
+                    if len(key) == 3 and key[:2] == (phase, path):
+                        lines.append(f"  {'':<6}  └ {key[2]:<18}{child / 1e6:>20.1f}ms{child / n:>8.0f}")
+        if self.steps:
+            resolves = sum(self.steps.values())
+            mean = sum(k * n for k, n in self.steps.items()) / resolves
+            hist = "  ".join(f"{k}步:{n}" for k, n in sorted(self.steps.items()))
+            lines.append(f"选招 {resolves} 次，平均 {mean:.2f} 步  |  {hist}")
+        if self.hit_checks:
+            lines.append("出招判定: " + "  ".join(f"{kind} {n}" for kind, n in self.hit_checks.items()))
+        return "\n".join(lines)
+
+def main(argv=None):
+    from wuxia_batch import run_batch
+    from wuxia_bench import create_chain_fighter
+    from wuxia_timeline_demo import create_heavy_fighter, create_swift_fighter
+
+    parser = argparse.ArgumentParser(description="按阶段剖析 Fighter.update")
+    parser.add_argument("--duels", type=int, default=2000)
+    parser.add_argument("--sample", type=int, default=64, help="每多少次 update 抽样计时一次 (0 只计数)")
+    parser.add_argument("--chain", type=int, default=0, help="P2 换成这么多层条件节点的判断链 (看选招步数)")
+    parser.add_argument("--folded", help="把火焰图折叠栈写到这个文件")
+    args = parser.parse_args(argv)
+
+    p1 = create_heavy_fighter(verbose=False)
+    p2 = create_chain_fighter(args.chain) if args.chain else create_swift_fighter(verbose=False)
+    seeds = range(args.duels)
+
+    def timed(label):
+        start = time.perf_counter()
+        result = run_batch(p1, p2, seeds)
+        seconds = time.perf_counter() - start
+        print(f"{label}: {seconds:.2f}s")
+        return result, seconds
+
+    plain, plain_time = timed("未开启")
+    prof = Profiler(sample_every=args.sample)
+    with prof:
+        profiled, profiled_time = timed(f"开启 (抽样 1/{args.sample})" if args.sample else "开启 (只计数)")
+    after, _ = timed("关闭后")
+    same = (plain.wins, plain.ttk_hist) == (profiled.wins, profiled.ttk_hist) == (after.wins, after.ttk_hist)
+    print(f"开启时慢 {profiled_time / plain_time:.1f}x，结果{'一致' if same else '不一致!'}\n")
+    print(prof.report())
+    if args.folded:
+        prof.write_folded(args.folded)
+        print(f"\n折叠栈已写入 {args.folded}")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,307 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import wuxia_flowio
+from wuxia_batch import BatchResult, run_batch
+from wuxia_timeline_demo import create_heavy_fighter, create_swift_fighter
+from wuxia_tres import parse_tres, flow_spec_from_sections, build_fighter
+
+# --- 本地对决服务 ---
+# 给 Godot 编辑器 (MeridianEditor) 和网页看板用的本地服务，只监听 127.0.0.1，完全离线。
+# 协议是 TCP 上的 JSON Lines: 每行一个 JSON 请求，服务端按行回 JSON 消息，消息里带回请求的 id。
+# Godot 的 StreamPeerTCP 按行读写即可，不需要 HTTP 栈。
+#
+#   {"id": 1, "op": "flow", "name": "p2", "flow": {...}}        注册招式图 (flow_to_dict 的格式，见 wuxia_flowio)
+#   {"id": 2, "op": "flow", "name": "p2", "tres": "<.tres 文本>"} 或直接上传 MeridianFlow 资源
+#   {"id": 3, "op": "duel", "p1": "heavy", "p2": "p2", "seeds": 5000}
+#       -> {"id": 3, "type": "progress", "done": 2000, "total": 5000, "p1_win_rate": ...} (每完成一块)
+#       -> {"id": 3, "type": "result", ...}
+#   {"id": 4, "op": "ping"} -> {"id": 4, "type": "pong"}
+# 出错时回 {"id": ..., "type": "error", "message": "..."}。
+#
+# 对决请求按种子切块放进有界队列: 队列满时不再读取该连接的后续请求 (TCP 自然反压给客户端)。
+# 调度器每次从队列里取出若干块，凑满 batch_seeds 个种子再整体交给一个工作进程，
+# 小请求 (几十场) 因此会和别的小请求合并，省掉逐个跨进程调度的开销。
+
+# --- 招式图的 JSON 格式 ---
+# 与回合制回放共用 wuxia_flowio 的格式 (数值参数为 ACTION_PARAMS)
+
+def flow_to_dict(fighter):
+    """把时间轴角色的招式图写成纯数据 (条件节点必须是声明式 Condition)"""
+    return wuxia_flowio.flow_to_dict(fighter, wuxia_flowio.TIMELINE)
+
+def flow_from_dict(data, verbose=False):
+    """flow_to_dict 的逆操作；编译并校验后返回 Fighter"""
+    fighter = wuxia_flowio.flow_from_dict(data, wuxia_flowio.TIMELINE, verbose)
+    fighter.compile()
+    return fighter
+
+# --- 工作进程 ---
+
+def _run_unit(unit):
+    """在工作进程里跑一组 (p1, p2, 种子, 参数) 块，返回各块的 BatchResult"""
+    return [run_batch(p1, p2, seeds, **kwargs) for p1, p2, seeds, kwargs in unit]
+
+def _summary(result):
+    return {
+        "duels": result.duels,
+        "wins": result.wins,
+        "p1_win_rate": result.win_rate(1),
+        "p2_win_rate": result.win_rate(2),
+        "draw_rate": result.draw_rate,
+        "mean_ttk": result.mean_ttk(),
+        "ttk_p10": result.ttk_quantile(0.1),
+        "ttk_p50": result.ttk_quantile(0.5),
+        "ttk_p90": result.ttk_quantile(0.9),
+        "damage_per_duel": [d / result.duels for d in result.damage_dealt] if result.duels else [0.0, 0.0],
+        "stuns_per_duel": [s / result.duels for s in result.stuns] if result.duels else [0.0, 0.0],
+    }
+
+# --- 服务 ---
+
+_DUEL_OPTIONS = ("initial_distance", "distance_jitter", "dt", "time_limit")
+
+class _Job:
+    """一个对决请求: 累计各块结果，逐块回报进度"""
+    def __init__(self, request_id, total, dt, send):
+        self.id = request_id
+        self.total = total
+        self.result = BatchResult(dt)
+        self.pending = 0
+        self.send = send
+
+class DuelServer:
+    """本地对决服务
+
+    max_workers: 工作进程数；queue_size: 排队的种子块上限 (满了就反压)；
+    chunk_seeds: 单个请求切块的大小；batch_seeds: 一次交给工作进程的种子数上限 (小块在此合并)。
+    """
+    def __init__(self, host="127.0.0.1", port=8765, max_workers=None, queue_size=64, chunk_seeds=1000, batch_seeds=2000):
+        self.host = host
+        self.port = port
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.chunk_seeds = chunk_seeds
+        self.batch_seeds = batch_seeds
+        self.flows = {"heavy": create_heavy_fighter(verbose=False), "swift": create_swift_fighter(verbose=False)}
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.pool = None
+        self.server = None
+        self._dispatcher = None
+        self._slots = asyncio.Semaphore(self.max_workers * 2) # 同时在工作进程里的批次数
+        self._connections = set()
+        self._collectors = set() # 在途批次的收尾任务 (事件循环只持有弱引用，这里保住它们)
+        self.stats = {"requests": 0, "units": 0, "chunks": 0}
+
+    async def start(self):
+        self.pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        self._dispatcher = asyncio.create_task(self._dispatch())
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1] # port=0 时取系统分配的端口
+        return self
+
+    async def close(self):
+        self.server.close()
+        tasks = list(self._connections) + list(self._collectors) + [self._dispatcher]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.server.wait_closed()
+        self.pool.shutdown(cancel_futures=True)
+
+    async def serve_forever(self):
+        async with self.server:
+            await self.server.serve_forever()
+
+    # --- 连接 ---
+
+    async def _handle(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        lock = asyncio.Lock()
+
+        async def send(message):
+            async with lock:
+                writer.write(json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n")
+                await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                request_id = None
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("请求必须是 JSON 对象")
+                    request_id = request.get("id")
+                    await self._request(request, send)
+                except (ValueError, KeyError, TypeError) as e:
+                    await send({"id": request_id, "type": "error", "message": f"{type(e).__name__}: {e}"})
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def _request(self, request, send):
+        op = request.get("op")
+        request_id = request.get("id")
+        self.stats["requests"] += 1
+        if op == "ping":
+            await send({"id": request_id, "type": "pong"})
+        elif op == "flow":
+            if "tres" in request:
+                spec = flow_spec_from_sections(parse_tres(request["tres"]), request["name"])
+                fighter = build_fighter(spec, hp=request.get("hp", 200))
+            else:
+                fighter = flow_from_dict(request["flow"])
+            self.flows[request["name"]] = fighter
+            await send({"id": request_id, "type": "flow", "name": request["name"], "nodes": list(fighter.nodes),
+                        "unreachable": fighter.flow.unreachable})
+        elif op == "flows":
+            await send({"id": request_id, "type": "flows", "flows": {name: flow_to_dict(f) for name, f in self.flows.items()}})
+        elif op == "duel":
+            await self._submit_duel(request, send)
+        else:
+            raise ValueError(f"未知的操作: {op}")
+
+    async def _submit_duel(self, request, send):
+        for side in ("p1", "p2"):
+            if request[side] not in self.flows:
+                raise ValueError(f"未注册的招式图: {request[side]}")
+        seeds = request.get("seeds", 1000)
+        seeds = range(*seeds) if isinstance(seeds, list) else range(seeds)
+        kwargs = {k: request[k] for k in _DUEL_OPTIONS if k in request}
+        p1, p2 = self.flows[request["p1"]], self.flows[request["p2"]]
+        chunks = [seeds[k:k + self.chunk_seeds] for k in range(0, len(seeds), self.chunk_seeds)]
+        job = _Job(request.get("id"), len(seeds), kwargs.get("dt", 0.1), send)
+        job.pending = len(chunks)
+        await send({"id": job.id, "type": "accepted", "total": job.total, "chunks": len(chunks)})
+        if not chunks:
+            await send(dict(_summary(job.result), id=job.id, type="result"))
+        for chunk in chunks:
+            await self.queue.put((job, p1, p2, chunk, kwargs)) # 队列满时在这里等待 = 反压
+
+    # --- 调度 ---
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self.queue.get()]
+            size = len(items[0][3])
+            while size < self.batch_seeds and not self.queue.empty():
+                item = self.queue.get_nowait()
+                items.append(item)
+                size += len(item[3])
+            await self._slots.acquire()
+            unit = [(p1, p2, chunk, kwargs) for _, p1, p2, chunk, kwargs in items]
+            future = loop.run_in_executor(self.pool, _run_unit, unit)
+            self.stats["units"] += 1
+            self.stats["chunks"] += len(items)
+            collector = asyncio.create_task(self._collect(future, [item[0] for item in items]))
+            self._collectors.add(collector)
+            collector.add_done_callback(self._collectors.discard)
+
+    async def _collect(self, future, jobs):
+        try:
+            try:
+                results = await future
+            except Exception as e:
+                for job in jobs:
+                    job.pending -= 1
+                for job in set(jobs):
+                    await self._send(job, {"id": job.id, "type": "error", "message": f"{type(e).__name__}: {e}"})
+                return
+            for job, result in zip(jobs, results):
+                job.result.merge(result)
+                job.pending -= 1
+                if job.pending:
+                    await self._send(job, {"id": job.id, "type": "progress", "done": job.result.duels, "total": job.total,
+                                           "p1_win_rate": job.result.win_rate(1)})
+                else:
+                    await self._send(job, dict(_summary(job.result), id=job.id, type="result"))
+        finally:
+            self._slots.release()
+
+    @staticmethod
+    async def _send(job, message):
+        # 客户端断开后 writer 可能抛出各种异常 (ConnectionError、已关闭的传输上的 RuntimeError 等)，
+        # 都只影响这一个请求: 结果丢弃，计数照常推进
+        try:
+            await job.send(message)
+        except Exception:
+            pass
+
+# --- 客户端 (脚本/调试用) ---
+
+async def request_stream(host, port, requests):
+    """发送若干请求，逐条产出服务端消息，直到每个请求都收到最终回复 (result/flow/pong/flows/error)"""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        open_ids = set()
+        for request in requests:
+            open_ids.add(request["id"])
+            writer.write(json.dumps(request, ensure_ascii=False).encode("utf-8") + b"\n")
+        await writer.drain()
+        while open_ids:
+            line = await reader.readline()
+            if not line:
+                break
+            message = json.loads(line)
+            if message["type"] not in ("accepted", "progress"):
+                open_ids.discard(message["id"])
+            yield message
+    finally:
+        writer.close()
+
+async def _demo(port):
+    server = await DuelServer(port=port).start()
+    print(f"服务已启动: {server.host}:{server.port}")
+    custom = flow_to_dict(create_swift_fighter("张无忌 (改)", verbose=False))
+    custom["nodes"]["太极剑·刺"]["windup"] = 0.25 # "start" 是它的别名，一起生效
+    requests = [
+        {"id": 1, "op": "flow", "name": "swift2", "flow": custom},
+        {"id": 2, "op": "duel", "p1": "heavy", "p2": "swift", "seeds": 6000},
+        {"id": 3, "op": "duel", "p1": "heavy", "p2": "swift2", "seeds": 300},
+        {"id": 4, "op": "duel", "p1": "swift2", "p2": "swift", "seeds": 200},
+        {"id": 5, "op": "duel", "p1": "heavy", "p2": "nobody"},
+    ]
+    async for message in request_stream(server.host, server.port, requests):
+        if message["type"] == "result":
+            print(f"  #{message['id']} 结果: {message['duels']} 场, P1 胜率 {message['p1_win_rate']:.1%}, "
+                  f"P2 胜率 {message['p2_win_rate']:.1%}, 平均击杀 {message['mean_ttk'] or 0:.2f}s")
+        else:
+            print(f"  #{message['id']} {message}")
+    print(f"服务统计: {server.stats}")
+    await server.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本地对决服务 (JSON Lines over TCP，仅监听 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--demo", action="store_true", help="启动服务并用内置客户端演示一轮请求")
+    args = parser.parse_args(argv)
+    if args.demo:
+        asyncio.run(_demo(args.port))
+        return 0
+
+    async def serve():
+        server = await DuelServer(port=args.port, max_workers=args.workers).start()
+        print(f"对决服务监听 {server.host}:{server.port} ({server.max_workers} 个工作进程)")
+        await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,272 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from wuxia_batch import duel_distance
+from wuxia_timeline_demo import simulate_duel, to_ms, create_heavy_fighter, create_swift_fighter
+
+# --- 列式结果库 (内存映射) ---
+# 一个目录即一个库: 每张表的每一列是一个定长小端二进制文件 (<表>.<列>.col)，meta.json 记录表结构、
+# 已提交的行数和对阵名表。写入只追加: 先把缓冲的行追加到各列文件末尾，再原子地改写 meta.json 里的行数，
+# 读取方只看已提交的行 (写到一半崩溃时，多出来的尾巴下次打开写入器时截掉)。
+# 读取用 numpy.memmap 直接映射列文件，按对阵/种子筛选只会读到用到的那几列的页，不必整库载入，也不必重跑模拟。
+#
+# 表:
+#   duels:  每场一行 —— 对阵编号、种子、胜方、用时(毫秒)、双方终局生命、双方造成伤害、双方被僵直次数，
+#           以及该场逐帧状态在 frames 表里的起始行和帧数 (没有记录逐帧状态时为 -1 / 0)
+#   frames: 可选的逐帧状态 —— 双方生命、耐力、状态编码，以及双方距离 (每帧结束时)
+
+MAGIC = "WXST"
+VERSION = 1
+
+TABLES = {
+    "duels": (("matchup", "<u4"), ("seed", "<i8"), ("winner", "<i1"), ("duration_ms", "<i4"),
+              ("hp1", "<f8"), ("hp2", "<f8"), ("damage1", "<f8"), ("damage2", "<f8"),
+              ("stuns1", "<i4"), ("stuns2", "<i4"), ("frame_start", "<i8"), ("frame_count", "<i4")),
+    "frames": (("hp1", "<f8"), ("hp2", "<f8"), ("stamina1", "<f8"), ("stamina2", "<f8"),
+               ("state1", "<u1"), ("state2", "<u1"), ("distance", "<f8")),
+}
+
+def _column_path(root, table, column):
+    return os.path.join(root, f"{table}.{column}.col")
+
+def _read_meta(root):
+    with open(os.path.join(root, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("magic") != MAGIC:
+        raise ValueError(f"{root} 不是对局结果库")
+    if meta.get("version") != VERSION:
+        raise ValueError(f"不支持的结果库版本: {meta.get('version')}")
+    return meta
+
+class StoreWriter:
+    """只追加的写入器 (同一个库同时只能有一个写入器)
+
+    flush_rows: 缓冲到这么多场就写盘并提交一次；close() 或离开 with 时提交剩余的行。
+    """
+    def __init__(self, root, flush_rows=4096):
+        self.root = root
+        self.flush_rows = flush_rows
+        os.makedirs(root, exist_ok=True)
+        if os.path.exists(os.path.join(root, "meta.json")):
+            self.meta = _read_meta(root)
+        else:
+            self.meta = {"magic": MAGIC, "version": VERSION, "matchups": [],
+                         "tables": {name: {"rows": 0, "columns": [list(c) for c in columns]} for name, columns in TABLES.items()}}
+        self._matchup_ids = {tuple(m): k for k, m in enumerate(self.meta["matchups"])}
+        self._files = {}
+        self._buffers = {}
+        for table, columns in TABLES.items():
+            rows = self.meta["tables"][table]["rows"]
+            for column, dtype in columns:
+                f = open(_column_path(root, table, column), "ab")
+                f.truncate(rows * np.dtype(dtype).itemsize) # 丢掉上次没提交的尾巴
+                self._files[(table, column)] = f
+                self._buffers[(table, column)] = []
+        self._pending = {table: 0 for table in TABLES}
+        self._commit()
+
+    def matchup(self, p1_name, p2_name):
+        """对阵编号 (按首次出现的顺序分配)"""
+        key = (p1_name, p2_name)
+        k = self._matchup_ids.get(key)
+        if k is None:
+            k = self._matchup_ids[key] = len(self.meta["matchups"])
+            self.meta["matchups"].append(list(key))
+        return k
+
+    def _rows(self, table):
+        return self.meta["tables"][table]["rows"] + self._pending[table]
+
+    def add_duel(self, matchup, seed, result, frames=None):
+        """追加一场结果；frames 为 FrameRecorder 时同时追加其记录的逐帧状态"""
+        buffers = self._buffers
+        if frames is not None and frames.count:
+            start, count = self._rows("frames"), frames.count
+            for column, _ in TABLES["frames"]:
+                buffers[("frames", column)].extend(getattr(frames, column))
+            self._pending["frames"] += count
+        else:
+            start, count = -1, 0
+        row = (matchup, seed, result.winner, to_ms(result.duration), result.hp[0], result.hp[1],
+               result.damage_dealt[0], result.damage_dealt[1], result.stuns[0], result.stuns[1], start, count)
+        for (column, _), value in zip(TABLES["duels"], row):
+            buffers[("duels", column)].append(value)
+        self._pending["duels"] += 1
+        if self._pending["duels"] >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+        """写出缓冲的行并提交"""
+        for (table, column), values in self._buffers.items():
+            if values:
+                dtype = dict(TABLES[table])[column]
+                f = self._files[(table, column)]
+                f.write(np.asarray(values, dtype=dtype).tobytes())
+                f.flush()
+                values.clear()
+        for table in TABLES:
+            self.meta["tables"][table]["rows"] += self._pending[table]
+            self._pending[table] = 0
+        self._commit()
+
+    def _commit(self):
+        path = os.path.join(self.root, "meta.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path) # 原子替换: 读取方要么看到旧行数，要么看到新行数
+
+    def close(self):
+        self.flush()
+        for f in self._files.values():
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+class FrameRecorder:
+    """on_frame 回调: 记下每帧结束时双方的生命、耐力、状态和距离"""
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.hp1, self.hp2, self.stamina1, self.stamina2 = [], [], [], []
+        self.state1, self.state2, self.distance = [], [], []
+        self.count = 0
+
+    def __call__(self, time_elapsed, p1, p2, dist_mgr):
+        self.hp1.append(p1.hp)
+        self.hp2.append(p2.hp)
+        self.stamina1.append(p1.stamina)
+        self.stamina2.append(p2.stamina)
+        self.state1.append(p1.state)
+        self.state2.append(p2.state)
+        self.distance.append(dist_mgr.distance)
+        self.count += 1
+
+def record_batch(writer, p1, p2, seeds, frames=None, initial_distance=3.0, distance_jitter=0.5, dt=0.1, time_limit=60.0):
+    """与 run_batch 相同的对决，逐场追加到 writer；frames(seed) 为真的那些场同时记录逐帧状态"""
+    matchup = writer.matchup(p1.name, p2.name)
+    p1.compile()
+    p2.compile()
+    recorder = FrameRecorder()
+    verbose = (p1.verbose, p2.verbose)
+    p1.verbose = p2.verbose = False
+    try:
+        for seed in seeds:
+            p1.reset()
+            p2.reset()
+            distance = duel_distance(seed, initial_distance, distance_jitter)
+            if frames is not None and frames(seed):
+                recorder.clear()
+                result = simulate_duel(p1, p2, distance, dt, time_limit, on_frame=recorder)
+                writer.add_duel(matchup, seed, result, recorder)
+            else:
+                writer.add_duel(matchup, seed, simulate_duel(p1, p2, distance, dt, time_limit))
+    finally:
+        p1.verbose, p2.verbose = verbose
+    return writer
+
+class Store:
+    """只读打开一个结果库: 每列都是 numpy.memmap (零拷贝)，只包含打开时已提交的行"""
+    def __init__(self, root):
+        self.root = root
+        self.meta = _read_meta(root)
+        self.matchups = [tuple(m) for m in self.meta["matchups"]]
+        self.duels = self._map("duels")
+        self.frames = self._map("frames")
+
+    def _map(self, table):
+        rows = self.meta["tables"][table]["rows"]
+        columns = {}
+        for column, dtype in self.meta["tables"][table]["columns"]:
+            if rows:
+                columns[column] = np.memmap(_column_path(self.root, table, column), dtype=dtype, mode="r", shape=(rows,))
+            else:
+                columns[column] = np.empty(0, dtype=dtype)
+        return columns
+
+    def __len__(self):
+        return self.meta["tables"]["duels"]["rows"]
+
+    def matchup_id(self, p1_name, p2_name):
+        try:
+            return self.matchups.index((p1_name, p2_name))
+        except ValueError:
+            raise ValueError(f"结果库里没有 {p1_name} vs {p2_name} 的对阵") from None
+
+    def select(self, matchup=None, seeds=None):
+        """符合条件的行号: matchup 为对阵编号或 (P1名, P2名)，seeds 为 range 或种子序列"""
+        mask = np.ones(len(self), dtype=bool)
+        if matchup is not None:
+            if isinstance(matchup, tuple):
+                matchup = self.matchup_id(*matchup)
+            mask &= self.duels["matchup"] == matchup
+        if seeds is not None:
+            seed = self.duels["seed"]
+            if isinstance(seeds, range) and seeds.step == 1:
+                mask &= (seed >= seeds.start) & (seed < seeds.stop)
+            else:
+                mask &= np.isin(seed, np.fromiter(seeds, dtype=np.int64))
+        return np.flatnonzero(mask)
+
+    def column(self, name, rows=None):
+        """duels 表的一列 (rows 给出时只取这些行)"""
+        values = self.duels[name]
+        return values if rows is None else values[rows]
+
+    def frames_of(self, row):
+        """第 row 场的逐帧状态 {列名: 视图}，没有记录时返回 None"""
+        count = int(self.duels["frame_count"][row])
+        if not count:
+            return None
+        start = int(self.duels["frame_start"][row])
+        return {name: values[start:start + count] for name, values in self.frames.items()}
+
+if __name__ == "__main__":
+    heavy = create_heavy_fighter(verbose=False)
+    swift = create_swift_fighter(verbose=False)
+    mirror = create_swift_fighter(verbose=False) # 自己打自己也要两个独立的角色
+    root = tempfile.mkdtemp(prefix="wuxia_store_")
+    n = 20000
+    try:
+        start = time.perf_counter()
+        with StoreWriter(root) as writer:
+            record_batch(writer, heavy, swift, range(n), frames=lambda seed: seed % 100 == 0)
+            record_batch(writer, swift, mirror, range(n), frames=lambda seed: seed % 100 == 0)
+        elapsed = time.perf_counter() - start
+        size = sum(os.path.getsize(os.path.join(root, f)) for f in os.listdir(root))
+        print(f"写入 {2 * n} 场 (其中 {2 * n // 100} 场带逐帧状态): {elapsed:.2f}s  库大小 {size / 1024:.0f} KB")
+
+        store = Store(root)
+        start = time.perf_counter()
+        for p1_name, p2_name in store.matchups:
+            rows = store.select((p1_name, p2_name))
+            winner = store.column("winner", rows)
+            duration = store.column("duration_ms", rows)
+            print(f"  {p1_name} vs {p2_name}: {len(rows)} 场  P1 胜率 {np.mean(winner == 1):.1%}  "
+                  f"平均用时 {duration.mean() / 1000:.2f}s")
+        rows = store.select(store.matchup_id(swift.name, swift.name), range(5000, 6000))
+        print(f"  按种子切片 [5000, 6000): {len(rows)} 场  P1 胜率 {np.mean(store.column('winner', rows) == 1):.1%}")
+        print(f"查询用时 {(time.perf_counter() - start) * 1000:.1f}ms")
+
+        # 回放: 库里的逐帧状态与重新模拟逐位一致
+        row = int(store.select(store.matchup_id(swift.name, swift.name), [300])[0])
+        frames = store.frames_of(row)
+        swift.reset()
+        mirror.reset()
+        recorder = FrameRecorder()
+        simulate_duel(swift, mirror, duel_distance(300), on_frame=recorder)
+        same = all(np.array_equal(frames[name], np.asarray(getattr(recorder, name), dtype=frames[name].dtype)) for name in frames)
+        print(f"种子 300 的 {len(frames['hp1'])} 帧回放与重新模拟: {'一致' if same else '不一致!'}")
+        del store, frames # 释放映射后才能删除目录 (Windows)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
@@ -0,0 +1,313 @@
+import copy
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from fractions import Fraction
+
+from wuxia_batch import duel_distance
+from wuxia_matrix import split_seeds
+from wuxia_trace import Ev
+from wuxia_timeline_demo import simulate_duel, to_ms, create_heavy_fighter, create_swift_fighter
+
+# --- 流式汇总 (内存有界) ---
+# 百万场级别的扫描不能把逐场结果存进列表。这里每场对决结束就把结果折进汇总量里，之后丢掉:
+#   - Moments:       计数、和、平方和、最值 -> 均值/方差。和用精确算术 (整数或 Fraction) 累加，
+#                    所以分块汇总再合并与一次跑完逐位相同，与合并顺序无关
+#   - QuantileSketch: 对数分桶的分位数草图 (相对误差 alpha)，桶数只取决于数值范围，合并即桶计数相加
+#   - 每个动作节点的 打断/被打断/受身/挥空 次数 (从事件钩子计数，节点按 (P1/P2, 招式名) 区分)
+# 占用的内存与对局数无关 (整数和只随对局数按对数增长几个字节)。
+
+class Moments:
+    """一维数据的流式矩: 精确的和与平方和，可合并"""
+    __slots__ = ("n", "total", "total_sq", "min", "max")
+
+    def __init__(self):
+        self.n = 0
+        self.total = 0     # int，遇到非整数值时自动变为 Fraction
+        self.total_sq = 0
+        self.min = None
+        self.max = None
+
+    def add(self, x):
+        v = int(x) if x == int(x) else Fraction(x) # 伤害、毫秒绝大多数是整数，走整数加法
+        self.n += 1
+        self.total += v
+        self.total_sq += v * v
+        if self.min is None or x < self.min: self.min = x
+        if self.max is None or x > self.max: self.max = x
+
+    def merge(self, other):
+        self.n += other.n
+        self.total += other.total
+        self.total_sq += other.total_sq
+        if other.min is not None and (self.min is None or other.min < self.min): self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max): self.max = other.max
+        return self
+
+    def mean(self):
+        return float(Fraction(self.total) / self.n) if self.n else None
+
+    def variance(self):
+        """样本方差 (精确算出后再取浮点)"""
+        if self.n < 2:
+            return None
+        total = Fraction(self.total)
+        return float((self.total_sq - total * total / self.n) / (self.n - 1))
+
+    def std(self):
+        var = self.variance()
+        return math.sqrt(var) if var is not None else None
+
+class QuantileSketch:
+    """对数分桶的分位数草图 (DDSketch 的做法): 返回值与真实分位数的相对误差不超过 alpha
+
+    正数 x 落在第 ceil(log_gamma(x)) 个桶，gamma = (1 + alpha) / (1 - alpha)；非正数单独计数。
+    同一 alpha 的草图合并只是桶计数相加，结果与一次性构造完全相同。
+    """
+    def __init__(self, alpha=0.01):
+        if not 0 < alpha < 1:
+            raise ValueError(f"alpha 必须在 (0, 1) 之间: {alpha}")
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, x, count=1):
+        self.count += count
+        if x <= 0:
+            self.zeros += count
+            return
+        k = math.ceil(math.log(x) / self._log_gamma)
+        self.buckets[k] = self.buckets.get(k, 0) + count
+
+    def merge(self, other):
+        if other.alpha != self.alpha:
+            raise ValueError(f"草图精度不一致: {self.alpha} != {other.alpha}")
+        self.count += other.count
+        self.zeros += other.zeros
+        for k, c in other.buckets.items():
+            self.buckets[k] = self.buckets.get(k, 0) + c
+        return self
+
+    def quantile(self, q):
+        """第 q 分位数的估计值，没有数据时返回 None"""
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if seen > rank:
+            return 0.0
+        for k in sorted(self.buckets):
+            seen += self.buckets[k]
+            if seen > rank:
+                return 2 * self.gamma ** k / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+NODE_COUNTERS = ("打断", "被打断", "受身", "挥空")
+_NO_NODE = "(无招式)" # 站立时被打入僵直
+
+class MatchupStats:
+    """一个对阵 (P1 vs P2) 的流式汇总"""
+    def __init__(self, alpha=0.01):
+        self.duels = 0
+        self.wins = [0, 0, 0]                      # [平局, P1胜, P2胜]
+        self.duration_ms = Moments()               # 每场用时 (毫秒)
+        self.damage = (Moments(), Moments())       # 双方每场造成的伤害
+        self.ttk = QuantileSketch(alpha)           # 分出胜负的用时 (秒)
+        self.nodes = {}                            # (0/1, 招式名) -> [打断, 被打断, 受身, 挥空]
+
+    def add(self, result):
+        self.duels += 1
+        self.wins[result.winner] += 1
+        self.duration_ms.add(to_ms(result.duration))
+        self.damage[0].add(result.damage_dealt[0])
+        self.damage[1].add(result.damage_dealt[1])
+        if result.winner:
+            self.ttk.add(result.duration)
+
+    def merge(self, other):
+        self.duels += other.duels
+        for i in range(3):
+            self.wins[i] += other.wins[i]
+        self.duration_ms.merge(other.duration_ms)
+        self.damage[0].merge(other.damage[0])
+        self.damage[1].merge(other.damage[1])
+        self.ttk.merge(other.ttk)
+        for key, counts in other.nodes.items():
+            mine = self.nodes.setdefault(key, [0] * len(NODE_COUNTERS))
+            for i, c in enumerate(counts):
+                mine[i] += c
+        return self
+
+    def win_rate(self, player):
+        return self.wins[player] / self.duels if self.duels else 0.0
+
+    def summary(self, p1_name="P1", p2_name="P2"):
+        names = (p1_name, p2_name)
+        lines = [f"对局数: {self.duels}  |  {p1_name} 胜率 {self.win_rate(1):.1%}  {p2_name} 胜率 {self.win_rate(2):.1%}  "
+                 f"平局 {self.wins[0] / self.duels if self.duels else 0.0:.1%}"]
+        if self.duels:
+            d = self.duration_ms
+            lines.append(f"用时: 均值 {d.mean() / 1000:.2f}s  标准差 {(d.std() or 0.0) / 1000:.2f}s  "
+                         f"范围 {d.min / 1000:.1f}~{d.max / 1000:.1f}s")
+            for side in (0, 1):
+                m = self.damage[side]
+                lines.append(f"{names[side]} 场均伤害 {m.mean():.1f} (标准差 {m.std() or 0.0:.1f})")
+        if self.ttk.count:
+            lines.append(f"击杀时间: P10 {self.ttk.quantile(0.1):.2f}s  中位 {self.ttk.quantile(0.5):.2f}s  "
+                         f"P90 {self.ttk.quantile(0.9):.2f}s  (相对误差 ≤{self.ttk.alpha:.0%})")
+        for (side, node), counts in sorted(self.nodes.items()):
+            detail = "  ".join(f"{label} {c}" for label, c in zip(NODE_COUNTERS, counts) if c)
+            if detail:
+                lines.append(f"  {names[side]}【{node}】 {detail}")
+        return "\n".join(lines)
+
+class _NodeCounter:
+    """挂在 Fighter.trace 上，把事件计到对应的动作节点"""
+    def __init__(self, fighters, nodes):
+        self.fighters = fighters
+        self.nodes = nodes
+        self.stunned = [_NO_NODE, _NO_NODE] # 各方最近一次被打断时的招式 (受身记在它头上)
+
+    def _bump(self, side, name, k):
+        counts = self.nodes.get((side, name))
+        if counts is None:
+            counts = self.nodes[(side, name)] = [0] * len(NODE_COUNTERS)
+        counts[k] += 1
+
+    def record(self, t, actor, code, node, a, b, c):
+        if code == Ev.INTERRUPT:
+            self._bump(actor, node.name, 0)
+        elif code == Ev.STUN:
+            # 事件在 enter_stunned 之前发出，此时当前动作还是被打断的那一招
+            current = self.fighters[actor].current_action_node
+            name = current.name if current is not None else _NO_NODE
+            self.stunned[actor] = name
+            self._bump(actor, name, 1)
+        elif code == Ev.UKEMI:
+            self._bump(actor, self.stunned[actor], 2)
+        elif code == Ev.WHIFF:
+            self._bump(actor, node.name, 3)
+
+class StreamAggregator:
+    """按对阵键汇总的 MatchupStats 集合，可合并 (也可 pickle，传回主进程)"""
+    def __init__(self, alpha=0.01):
+        self.alpha = alpha
+        self.matchups = {}
+
+    def stats(self, key):
+        stats = self.matchups.get(key)
+        if stats is None:
+            stats = self.matchups[key] = MatchupStats(self.alpha)
+        return stats
+
+    def merge(self, other):
+        for key, stats in other.matchups.items():
+            self.stats(key).merge(stats)
+        return self
+
+    def __getitem__(self, key):
+        return self.matchups[key]
+
+def stream_batch(p1, p2, seeds, aggregator=None, key=None, initial_distance=3.0, distance_jitter=0.5, dt=0.1,
+                 time_limit=60.0, node_stats=True):
+    """与 run_batch 相同的对决，结果逐场折进 aggregator[key] (默认键为 (P1名, P2名))，返回 aggregator
+
+    node_stats: 为 False 时不挂事件钩子，不统计各招式的打断/受身/挥空 (更快)。
+    """
+    if aggregator is None:
+        aggregator = StreamAggregator()
+    stats = aggregator.stats(key if key is not None else (p1.name, p2.name))
+    p1.compile()
+    p2.compile()
+    saved = (p1.verbose, p2.verbose, p1.trace, p2.trace, p1.trace_id, p2.trace_id)
+    p1.verbose = p2.verbose = False
+    if node_stats:
+        p1.trace = p2.trace = _NodeCounter((p1, p2), stats.nodes)
+        p1.trace_id, p2.trace_id = 0, 1
+    try:
+        for seed in seeds:
+            p1.reset()
+            p2.reset()
+            stats.add(simulate_duel(p1, p2, duel_distance(seed, initial_distance, distance_jitter), dt, time_limit))
+    finally:
+        p1.verbose, p2.verbose, p1.trace, p2.trace, p1.trace_id, p2.trace_id = saved
+    return aggregator
+
+# --- 多进程 ---
+
+_worker_flows = None
+
+def _init_worker(flows):
+    global _worker_flows
+    _worker_flows = flows
+
+def _stream_block(i, j, seeds, alpha, duel_kwargs):
+    p1 = copy.deepcopy(_worker_flows[i])
+    p2 = copy.deepcopy(_worker_flows[j])
+    return stream_batch(p1, p2, seeds, StreamAggregator(alpha), (i, j), **duel_kwargs)
+
+def stream_matrix(flows, seeds, block_size=5000, max_workers=None, alpha=0.01, **duel_kwargs):
+    """在进程池中跑 N×N 对阵，每块在工作进程里汇总后传回合并，返回以 (i, j) 为键的 StreamAggregator"""
+    total = StreamAggregator(alpha)
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(flows,)) as pool:
+        futures = [pool.submit(_stream_block, i, j, block, alpha, duel_kwargs)
+                   for block in split_seeds(seeds, block_size)
+                   for i in range(len(flows))
+                   for j in range(len(flows))]
+        for future in as_completed(futures):
+            total.merge(future.result())
+    return total
+
+def _footprint(obj, seen=None):
+    """对象图的大致字节数 (只用于演示内存不随对局数增长)"""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_footprint(k, seen) + _footprint(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(_footprint(v, seen) for v in obj)
+    elif hasattr(obj, "__dict__"):
+        size += _footprint(vars(obj), seen)
+    elif hasattr(obj, "__slots__"):
+        size += sum(_footprint(getattr(obj, s), seen) for s in obj.__slots__)
+    return size
+
+if __name__ == "__main__":
+    p1 = create_heavy_fighter(verbose=False)
+    p2 = create_swift_fighter(verbose=False)
+
+    aggregator = StreamAggregator()
+    done = 0
+    for n in (1000, 10000, 40000):
+        start = time.perf_counter()
+        stream_batch(p1, p2, range(done, n), aggregator)
+        done = n
+        print(f"已汇总 {n} 场 (+{time.perf_counter() - start:.2f}s)，汇总占用约 {_footprint(aggregator) / 1024:.1f} KB")
+    print(aggregator[(p1.name, p2.name)].summary(p1.name, p2.name))
+
+    flows = [p1, p2]
+    seeds = range(10000)
+    start = time.perf_counter()
+    parallel = stream_matrix(flows, seeds, block_size=2500, max_workers=os.cpu_count())
+    print(f"\n2x2 对阵 x {len(seeds)} 场，{os.cpu_count()} 进程: {time.perf_counter() - start:.2f}s")
+    sequential = StreamAggregator()
+    for i in range(2):
+        for j in range(2):
+            stream_batch(copy.deepcopy(flows[i]), copy.deepcopy(flows[j]), seeds, sequential, (i, j))
+    same = all(
+        (a.wins, a.duration_ms.total, a.duration_ms.total_sq, a.damage[0].total_sq, a.damage[1].total,
+         a.ttk.buckets, a.nodes) ==
+        (b.wins, b.duration_ms.total, b.duration_ms.total_sq, b.damage[0].total_sq, b.damage[1].total,
+         b.ttk.buckets, b.nodes)
+        and a.duration_ms.mean() == b.duration_ms.mean() and a.damage[1].variance() == b.damage[1].variance()
+        for a, b in ((parallel[key], sequential[key]) for key in sequential.matchups))
+    print(f"分块并行合并与单进程顺序汇总: {'逐位一致' if same else '不一致!'}")
+    print(parallel[(1, 1)].summary(f"{p2.name}(P1)", f"{p2.name}(P2)"))
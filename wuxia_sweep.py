@@ -0,0 +1,317 @@
+import argparse
+import copy
+import csv
+import hashlib
+import itertools
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from wuxia_batch import BatchResult, run_batch
+from wuxia_evolve import graph_hash
+from wuxia_timeline_demo import ActionNode, ACTION_PARAMS, create_heavy_fighter, create_swift_fighter
+
+# --- 参数扫描网格 ---
+# 给出一对基础招式图和若干条参数轴 (哪一方、哪个动作节点、哪个参数、取哪些值)，
+# 按笛卡尔积 (或拉丁超立方抽样) 生成网格点；每个点把参数改到基础招式图的副本上，与 run_batch 相同地批量对决。
+# 网格点在进程池里并行跑，招式图在工作进程启动时一次性传入，每个任务只携带该点的参数值。
+#
+# 每个点的结果按 “改完参数后双方招式图的规范化哈希 + 种子 + 对决参数” 缓存 (可存成 JSON Lines 文件)，
+# 所以扩大取值范围后重跑只模拟新增的点；不同的轴改出同一张图也只算一次。
+# 结果表每个点一行 (各轴取值 + 胜率、平局率、平均击杀时间...)，可写成 CSV 或按两条轴转成热力图矩阵。
+
+DUEL_DEFAULTS = {"initial_distance": 3.0, "distance_jitter": 0.5, "dt": 0.1, "time_limit": 60.0}
+METRICS = ("p1_win", "p2_win", "draw", "mean_ttk", "damage1", "damage2", "stuns1", "stuns2", "duels")
+NDIGITS = 6 # 轴取值统一取整到这么多位小数，浮点误差不影响缓存命中
+# 缓存键的版本: graph_hash 或结果的含义变了就加一，旧缓存文件里的条目自然不再命中。
+# 2: graph_hash 区分 “动作节点没有后续 (后摇)” 与 “显式接回根节点” (此前两者哈希相同)
+CACHE_SCHEMA = 2
+
+class Axis:
+    """一条参数轴: P{side} 的动作节点 node (键名) 的参数 attr 依次取 values"""
+    def __init__(self, side, node, attr, values):
+        if side not in (1, 2):
+            raise ValueError(f"side 只能是 1 或 2: {side}")
+        if attr not in ACTION_PARAMS:
+            raise ValueError(f"不能扫描的参数: {attr} (可选 {', '.join(ACTION_PARAMS)})")
+        values = [round(float(v), NDIGITS) for v in values]
+        if not values:
+            raise ValueError(f"参数轴 {attr} 没有取值")
+        self.side = side
+        self.node = node
+        self.attr = attr
+        self.values = values
+
+    @classmethod
+    def span(cls, side, node, attr, low, high, num):
+        """low 到 high (含两端) 等距取 num 个值"""
+        if num < 2:
+            return cls(side, node, attr, [low])
+        return cls(side, node, attr, [low + (high - low) * k / (num - 1) for k in range(num)])
+
+    @property
+    def label(self):
+        return f"P{self.side}.{self.node}.{self.attr}"
+
+    def target(self, p1, p2):
+        fighter = p1 if self.side == 1 else p2
+        node = fighter.nodes.get(self.node)
+        if not isinstance(node, ActionNode):
+            raise ValueError(f"{fighter.name} 没有名为 '{self.node}' 的动作节点")
+        return node
+
+    def __repr__(self):
+        return f"Axis({self.label}, {self.values})"
+
+# --- 网格 ---
+
+def cartesian(axes):
+    """所有轴取值的笛卡尔积 (第一条轴变化最慢)"""
+    return list(itertools.product(*(axis.values for axis in axes)))
+
+def latin_hypercube(axes, n, rng_seed=0):
+    """拉丁超立方抽样: 每条轴在 [最小值, 最大值] 上等分成 n 层，每层恰好取一个点，各轴的层次序随机打乱"""
+    if n <= 0:
+        raise ValueError("抽样点数必须为正数")
+    rng = random.Random(rng_seed)
+    columns = []
+    for axis in axes:
+        low, high = min(axis.values), max(axis.values)
+        strata = list(range(n))
+        rng.shuffle(strata)
+        columns.append([round(low + (high - low) * (k + rng.random()) / n, NDIGITS) for k in strata])
+    return list(zip(*columns))
+
+def apply_point(p1, p2, axes, values):
+    """返回按网格点改过参数的两个副本 (基础招式图不变)"""
+    q1, q2 = copy.deepcopy(p1), copy.deepcopy(p2) # deepcopy 保留同一节点挂在多个键名下的别名关系
+    for axis, value in zip(axes, values):
+        setattr(axis.target(q1, q2), axis.attr, value)
+    q1.flow = q2.flow = None
+    return q1, q2
+
+# --- 结果缓存 ---
+
+def _result_to_dict(result):
+    return {"dt": result.dt, "duels": result.duels, "wins": result.wins,
+            "ttk_hist": {str(k): v for k, v in result.ttk_hist.items()},
+            "damage_dealt": result.damage_dealt, "stuns": result.stuns}
+
+def _result_from_dict(data):
+    result = BatchResult(data["dt"])
+    result.duels = data["duels"]
+    result.wins = list(data["wins"])
+    result.ttk_hist = {int(k): v for k, v in data["ttk_hist"].items()}
+    result.damage_dealt = list(data["damage_dealt"])
+    result.stuns = list(data["stuns"])
+    return result
+
+def point_key(p1, p2, seeds, duel_kwargs):
+    """一个网格点的缓存键 (p1/p2 为已改好参数的招式图)"""
+    seeds = seeds if isinstance(seeds, range) else tuple(seeds)
+    settings = tuple(sorted({**DUEL_DEFAULTS, **duel_kwargs}.items()))
+    ident = repr((CACHE_SCHEMA, graph_hash(p1), graph_hash(p2), seeds, settings))
+    return hashlib.sha1(ident.encode("utf-8")).hexdigest()
+
+class SweepCache:
+    """网格点缓存键 -> BatchResult
+
+    path 给出时从该 JSON Lines 文件载入已有结果，新结果逐行追加写入 (中途中断也不丢已算完的点)。
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.results = {}
+        self.hits = 0
+        self.misses = 0
+        if path is not None and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.results[entry["key"]] = _result_from_dict(entry["result"])
+
+    def __len__(self):
+        return len(self.results)
+
+    def get(self, key):
+        result = self.results.get(key)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def put(self, key, result):
+        self.results[key] = result
+        if self.path is not None:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "result": _result_to_dict(result)}) + "\n")
+
+# --- 并行执行 ---
+
+_worker_base = None
+
+def _init_worker(p1, p2, axes):
+    global _worker_base
+    _worker_base = (p1, p2, axes)
+
+def _run_point(index, values, seeds, duel_kwargs):
+    p1, p2, axes = _worker_base
+    q1, q2 = apply_point(p1, p2, axes, values)
+    return index, run_batch(q1, q2, seeds, **duel_kwargs)
+
+class SweepTable:
+    """扫描结果: 每个网格点一行 (各轴取值, BatchResult)"""
+    def __init__(self, axes, points, results):
+        self.axes = axes
+        self.points = points
+        self.results = results
+
+    def __len__(self):
+        return len(self.points)
+
+    @staticmethod
+    def metric(result, name):
+        if name == "p1_win":
+            return result.win_rate(1)
+        if name == "p2_win":
+            return result.win_rate(2)
+        if name == "draw":
+            return result.draw_rate
+        if name == "mean_ttk":
+            return result.mean_ttk()
+        if name in ("damage1", "damage2"):
+            return result.damage_dealt[int(name[-1]) - 1] / result.duels if result.duels else 0.0
+        if name in ("stuns1", "stuns2"):
+            return result.stuns[int(name[-1]) - 1] / result.duels if result.duels else 0.0
+        if name == "duels":
+            return result.duels
+        raise ValueError(f"未知的指标: {name} (可选 {', '.join(METRICS)})")
+
+    def rows(self, metrics=METRICS):
+        """[轴标签..., 指标...] 表头 + 每个点一行"""
+        yield [axis.label for axis in self.axes] + list(metrics)
+        for values, result in zip(self.points, self.results):
+            yield list(values) + [self.metric(result, name) for name in metrics]
+
+    def write_csv(self, path, metrics=METRICS):
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            csv.writer(f).writerows(self.rows(metrics))
+
+    def pivot(self, x, y, metric="p1_win"):
+        """按两条轴 (轴下标) 排成热力图矩阵: 返回 (x 取值, y 取值, grid)，grid[行=y][列=x]
+
+        其余轴取值不同的点取平均 (网格不完整时缺的格子为 None)。
+        """
+        xs = sorted({values[x] for values in self.points})
+        ys = sorted({values[y] for values in self.points})
+        sums = {}
+        for values, result in zip(self.points, self.results):
+            cell = sums.setdefault((values[x], values[y]), [0.0, 0])
+            value = self.metric(result, metric)
+            if value is not None:
+                cell[0] += value
+                cell[1] += 1
+        grid = [[None if (vx, vy) not in sums or not sums[(vx, vy)][1] else sums[(vx, vy)][0] / sums[(vx, vy)][1]
+                 for vx in xs] for vy in ys]
+        return xs, ys, grid
+
+    def format_heatmap(self, x=0, y=1, metric="p1_win"):
+        """文字热力图: 行为 y 轴取值，列为 x 轴取值"""
+        xs, ys, grid = self.pivot(x, y, metric)
+        fmt = (lambda v: f"{v:>8.1%}") if metric in ("p1_win", "p2_win", "draw") else (lambda v: f"{v:>8.2f}")
+        lines = [f"{metric}: 行 = {self.axes[y].label}，列 = {self.axes[x].label}",
+                 f"{'':>8}" + "".join(f"{vx:>8g}" for vx in xs)]
+        for vy, row in zip(ys, grid):
+            lines.append(f"{vy:>8g}" + "".join(f"{'-':>8}" if v is None else fmt(v) for v in row))
+        return "\n".join(lines)
+
+def run_sweep(p1, p2, axes, points, seeds, cache=None, max_workers=None, on_point=None, **duel_kwargs):
+    """在网格点上批量对决，返回 SweepTable (行的顺序与 points 一致)
+
+    points: cartesian(axes) 或 latin_hypercube(axes, n) 的结果 (每个点是与 axes 对应的取值元组)。
+    cache: SweepCache，已有结果的点不再模拟；max_workers 为 1 时在当前进程内运行。
+    招式图的条件节点须使用 wuxia_condition.Condition (多进程需要 pickle)。
+    on_point(values, result, done, total) 在每个新模拟的点完成时调用。
+    duel_kwargs 透传给 run_batch (initial_distance / distance_jitter / dt / time_limit)。
+    """
+    for axis in axes:
+        axis.target(p1, p2) # 先校验轴，别等到工作进程里才报错
+    if cache is None:
+        cache = SweepCache()
+    points = [tuple(round(float(v), NDIGITS) for v in values) for values in points]
+    results = [None] * len(points)
+    pending = {} # 缓存键 -> 用到它的行号 (不同的点可能改出同一张图)
+    for index, values in enumerate(points):
+        key = point_key(*apply_point(p1, p2, axes, values), seeds, duel_kwargs)
+        if key in pending:
+            pending[key].append(index)
+            continue
+        result = cache.get(key)
+        if result is None:
+            pending[key] = [index]
+        else:
+            results[index] = result
+
+    done, total = 0, len(pending)
+    keys = {rows[0]: key for key, rows in pending.items()}
+    def finish(index, result):
+        nonlocal done
+        key = keys[index]
+        cache.put(key, result)
+        for row in pending[key]:
+            results[row] = result
+        done += 1
+        if on_point is not None:
+            on_point(points[index], result, done, total)
+
+    if max_workers == 1:
+        _init_worker(p1, p2, axes)
+        for index in keys:
+            finish(*_run_point(index, points[index], seeds, duel_kwargs))
+    elif keys:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(p1, p2, axes)) as pool:
+            futures = [pool.submit(_run_point, index, points[index], seeds, duel_kwargs) for index in keys]
+            for future in as_completed(futures):
+                finish(*future.result())
+    return SweepTable(axes, points, results)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="开山斧前摇 × 韧性 的胜率扫描")
+    parser.add_argument("--seeds", type=int, default=200, help="每个网格点的对决场数")
+    parser.add_argument("--workers", type=int, default=None, help="进程数 (1 为不开进程池)")
+    parser.add_argument("--cache", help="缓存文件 (JSON Lines)，重跑时复用已算过的点")
+    parser.add_argument("--csv", help="把结果表写成 CSV")
+    parser.add_argument("--lhs", type=int, default=0, help="改用拉丁超立方抽样的点数")
+    args = parser.parse_args(argv)
+
+    heavy = create_heavy_fighter(verbose=False)
+    swift = create_swift_fighter(verbose=False)
+    seeds = range(args.seeds)
+    cache = SweepCache(args.cache)
+
+    def run(axes, label):
+        points = latin_hypercube(axes, args.lhs) if args.lhs else cartesian(axes)
+        hits, misses = cache.hits, cache.misses
+        start = time.perf_counter()
+        table = run_sweep(heavy, swift, axes, points, seeds, cache, args.workers)
+        elapsed = time.perf_counter() - start
+        print(f"{label}: {len(points)} 个点，模拟 {cache.misses - misses} 个，缓存命中 {cache.hits - hits} 个，用时 {elapsed:.2f}s")
+        return table
+
+    toughness = Axis.span(1, "开山斧", "toughness", 10.0, 40.0, 4)
+    table = run([Axis.span(1, "开山斧", "windup", 0.6, 1.4, 5), toughness], "前摇 0.6~1.4")
+    # 扩大前摇范围: 与上一次重合的点直接取缓存
+    table = run([Axis.span(1, "开山斧", "windup", 0.6, 1.8, 7), toughness], "前摇 0.6~1.8")
+    if not args.lhs:
+        print()
+        print(table.format_heatmap(0, 1, "p1_win"))
+    if args.csv:
+        table.write_csv(args.csv)
+        print(f"结果表已写入 {args.csv}")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
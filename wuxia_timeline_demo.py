@@ -1,30 +1,65 @@
 import time
 import random
+from array import array
+
+from wuxia_trace import Ev, render_event
 
 # --- 核心常量 ---
 
+# 状态和招式类型都用小整数编码 (比较是整数比较，也能直接当数组下标)，显示时查 NAMES
+
 class State:
-    IDLE = "站立"      # 寻找下一个招式
-    MOVE = "移动"      # 接近敌人
-    WINDUP = "前摇"    # 蓄力/起手（脆弱期，受击会被打断）
-    ACTIVE = "判定"    # 伤害/效果生效期
-    RECOVERY = "后摇"  # 收招（如果有连招可取消）
-    STUNNED = "僵直"   # 被打断/受击后的硬直状态
+    IDLE = 0      # 寻找下一个招式
+    MOVE = 1      # 接近敌人
+    WINDUP = 2    # 蓄力/起手（脆弱期，受击会被打断）
+    ACTIVE = 3    # 伤害/效果生效期
+    RECOVERY = 4  # 收招（如果有连招可取消）
+    STUNNED = 5   # 被打断/受击后的硬直状态
+    NAMES = ("站立", "移动", "前摇", "判定", "后摇", "僵直")
 
 class ActionType:
-    ATTACK = "攻击"
-    DEFEND = "格挡"
-    DODGE = "闪避"
-    WAIT = "观望"
+    ATTACK = 0
+    DEFEND = 1
+    DODGE = 2
+    WAIT = 3
+    NAMES = ("攻击", "格挡", "闪避", "观望")
+
+# --- 时间基准 ---
+# 所有时长都按整数毫秒计: 阶段计时、僵直时长、对局时间都是整数，阶段切换是精确的整数比较。
+# 若用浮点逐帧累加 0.1，0.3s 的前摇可能要 3 帧也可能要 4 帧 (取决于累加误差)；换成整数后恒为 3 帧，
+# 标量、批量、向量、事件驱动各引擎的结果逐位一致，局面也能直接按相等性做哈希。
+# 招式时长在赋值时就量化成毫秒 (windup_ms 等)，dt 在每帧换算 (须为 1ms 的整数倍才不会被舍入)。
+
+TIME_UNIT = 1000          # 每秒的时间单位数 (毫秒)
+STUN_MS_PER_DAMAGE = 50   # 每点伤害造成的僵直 (0.05s)
+UKEMI_WINDOW_MS = 300     # 僵直剩余超过这么久才能受身
+
+def to_ms(seconds):
+    """秒 -> 整数毫秒 (四舍五入)"""
+    return int(seconds * TIME_UNIT + 0.5)
+
+# 热路径上的状态集合 (预先建好，避免每帧临时构造列表)
+_REGEN_STATES = frozenset((State.IDLE, State.RECOVERY, State.MOVE))  # 会恢复耐力
+_GUARD_STATES = frozenset((State.WINDUP, State.ACTIVE))              # 有霸体保护
+_OPENING_STATES = frozenset((State.WINDUP, State.RECOVERY))          # 受击会被打断
 
 # --- 节点系统 (行为树/链表) ---
 
 class Node:
+    __slots__ = ("name",)
+
     def __init__(self, name):
         self.name = name
 
 class ActionNode(Node):
-    """【动】节点：包含具体的时间轴参数"""
+    """【动】节点：包含具体的时间轴参数
+
+    windup / active / recovery 以秒读写，赋值时量化成整数毫秒存在 *_ms 里 (引擎只读 *_ms)，
+    读回的是量化后的值。
+    """
+    __slots__ = ("action_type", "windup_ms", "active_ms", "recovery_ms", "power", "toughness", "cost",
+                 "atk_range", "dash", "knockback", "backdash", "next_node_name")
+
     def __init__(self, name, action_type, windup=0.3, active=0.1, recovery=0.5, power=10, toughness=0.0, cost=10.0, atk_range=1.0, dash=0.0, knockback=0.5, backdash=0.0):
         super().__init__(name)
         self.action_type = action_type
@@ -49,8 +84,38 @@ class ActionNode(Node):
         self.next_node_name = node_name
         return self
 
+    @property
+    def windup(self):
+        return self.windup_ms / TIME_UNIT
+
+    @windup.setter
+    def windup(self, seconds):
+        self.windup_ms = to_ms(seconds)
+
+    @property
+    def active(self):
+        return self.active_ms / TIME_UNIT
+
+    @active.setter
+    def active(self, seconds):
+        self.active_ms = to_ms(seconds)
+
+    @property
+    def recovery(self):
+        return self.recovery_ms / TIME_UNIT
+
+    @recovery.setter
+    def recovery(self, seconds):
+        self.recovery_ms = to_ms(seconds)
+
 class ConditionNode(Node):
-    """【判】节点：瞬时逻辑判断，不消耗时间"""
+    """【判】节点：瞬时逻辑判断，不消耗时间
+
+    check_func 可以是 lambda me, enemy: bool，也可以是 wuxia_condition.Condition
+    (声明式条件，可 pickle、可批量求值，额外读取双方距离)。
+    """
+    __slots__ = ("check_func", "true_node_name", "false_node_name")
+
     def __init__(self, name, check_func):
         super().__init__(name)
         self.check_func = check_func
@@ -62,51 +127,230 @@ class ConditionNode(Node):
         self.false_node_name = false_name
         return self
 
+# --- 招式图编译 ---
+
+ACTION_PARAMS = ("windup", "active", "recovery", "power", "toughness", "cost", "atk_range", "dash", "knockback", "backdash")
+
+class CompiledFlow:
+    """把 Fighter.nodes 编译成按整数下标索引的跳转表
+
+    每个键名占一个槽位 (同一节点可以挂在多个键名下)，跳转目标预先解析成槽位下标，
+    空的 next/true/false 直接指向根节点。动作节点的时间/距离参数按列打包成数组。
+    条件统一编译成 f(me, enemy, distance)；声明式条件中 key 相同的在同一次解析内只求值一次。
+    编译时校验: 缺少根节点、指向不存在的节点名、只由条件节点构成的环 (运行时会撞上 100 步保护)
+    都会抛出 ValueError；从根节点不可达的节点记录在 unreachable 中。
+    """
+    def __init__(self, fighter):
+        nodes = fighter.nodes
+        if fighter.root_node_name not in nodes:
+            raise ValueError(f"{fighter.name} 缺少根节点 '{fighter.root_node_name}'")
+
+        self.names = list(nodes)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.root = self.index[fighter.root_node_name]
+
+        def target(owner, name):
+            if not name:
+                return self.root # 没有后续: 回到根节点
+            if name not in self.index:
+                raise ValueError(f"{fighter.name} 的节点【{owner.name}】指向不存在的节点 '{name}'")
+            return self.index[name]
+
+        n = len(self.names)
+        self.actions = [None] * n  # 动作节点槽位 -> ActionNode，条件节点为 None
+        self.checks = [None] * n   # 条件节点槽位 -> f(me, enemy, distance)
+        self.memo_slot = [-1] * n  # 与其他条件节点共享结果时的缓存下标
+        memo_keys = {}
+        self.next = [self.root] * n
+        self.true = [self.root] * n
+        self.false = [self.root] * n
+        for i, name in enumerate(self.names):
+            node = nodes[name]
+            if isinstance(node, ActionNode):
+                self.actions[i] = node
+                self.next[i] = target(node, node.next_node_name)
+            elif isinstance(node, ConditionNode):
+                self.checks[i] = _compile_check(node.check_func)
+                key = getattr(node.check_func, "key", None)
+                if key is not None:
+                    memo_keys.setdefault(key, []).append(i)
+                self.true[i] = target(node, node.true_node_name)
+                self.false[i] = target(node, node.false_node_name)
+            else:
+                raise ValueError(f"{fighter.name} 的节点【{name}】类型未知: {type(node).__name__}")
+
+        # 只有被多个条件节点共享的 key 才需要缓存
+        self.memo_size = 0
+        for slots in memo_keys.values():
+            if len(slots) > 1:
+                for i in slots:
+                    self.memo_slot[i] = self.memo_size
+                self.memo_size += 1
+
+        for attr in ACTION_PARAMS:
+            setattr(self, attr, array("d", (getattr(a, attr) if a else 0.0 for a in self.actions)))
+
+        self._check_condition_cycles(fighter)
+        self.unreachable = self._find_unreachable(nodes)
+
+    def _check_condition_cycles(self, fighter):
+        # 只沿条件节点的 true/false 边做 DFS，遇到回边即为纯条件环
+        WHITE, GREY, BLACK = 0, 1, 2
+        color = [WHITE] * len(self.names)
+        for start in range(len(self.names)):
+            if color[start] != WHITE or self.checks[start] is None:
+                continue
+            stack = [(start, iter((self.true[start], self.false[start])))]
+            color[start] = GREY
+            while stack:
+                i, targets = stack[-1]
+                j = next(targets, None)
+                if j is None:
+                    color[i] = BLACK
+                    stack.pop()
+                elif self.checks[j] is None or color[j] == BLACK:
+                    continue
+                elif color[j] == GREY:
+                    cycle = [self.names[k] for k, _ in stack[[k for k, _ in stack].index(j):]]
+                    raise ValueError(f"{fighter.name} 的条件节点构成死循环: {' -> '.join(cycle + [self.names[j]])}")
+                else:
+                    color[j] = GREY
+                    stack.append((j, iter((self.true[j], self.false[j]))))
+
+    def _find_unreachable(self, nodes):
+        # 按节点对象判断可达性 (同一节点的别名键不算不可达)；僵直后总会回到根节点
+        seen = {self.root}
+        stack = [self.root]
+        while stack:
+            i = stack.pop()
+            targets = (self.next[i],) if self.checks[i] is None else (self.true[i], self.false[i])
+            for j in targets:
+                if j not in seen:
+                    seen.add(j)
+                    stack.append(j)
+        reached = {id(nodes[self.names[i]]) for i in seen}
+        return [name for name in self.names if id(nodes[name]) not in reached]
+
+    def resolve(self, fighter, enemy, distance=None):
+        """与 Fighter.get_next_action_node 等价，但只沿整数下标跳转 (编译时已排除纯条件环)"""
+        i = self.index.get(fighter.current_node_name, self.root)
+        actions, checks, true, false = self.actions, self.checks, self.true, self.false
+        memo = None
+        while actions[i] is None:
+            slot = self.memo_slot[i]
+            if slot < 0:
+                result = checks[i](fighter, enemy, distance)
+            else:
+                if memo is None:
+                    memo = [None] * self.memo_size
+                result = memo[slot]
+                if result is None:
+                    result = memo[slot] = checks[i](fighter, enemy, distance)
+            i = true[i] if result else false[i]
+        fighter.current_node_name = self.names[i]
+        return actions[i]
+
+def _compile_check(check):
+    """把 check_func 统一成 f(me, enemy, distance)"""
+    if hasattr(check, "compile"):
+        return check.compile()
+    return lambda me, enemy, distance: check(me, enemy)
+
+def compile_flow(fighter):
+    return CompiledFlow(fighter)
+
 # --- 角色类 ---
 
 class Fighter:
-    def __init__(self, name, hp, root_node_name="start"):
+    # 批量模拟时同时存活的角色可能有几十万个，用 __slots__ 省掉每个实例的 __dict__
+    __slots__ = ("name", "max_hp", "verbose", "nodes", "root_node_name", "flow",
+                 "max_stamina", "stamina_regen", "trace", "trace_id",
+                 "hp", "current_node_name", "state", "state_timer", "stun_duration", "current_action_node",
+                 "poise_damage_accumulator", "last_hit_time", "stamina", "damage_taken", "stun_count")
+
+    def __init__(self, name, hp, root_node_name="start", verbose=True):
         self.name = name
         self.max_hp = hp
-        self.hp = hp
+        self.verbose = verbose # 关闭后不输出任何日志 (批量模拟用)
         
         # 行为树/图存储
         self.nodes = {} 
         self.root_node_name = root_node_name
+        self.flow = None # compile() 后的跳转表，招式图改动后需重新编译
+        
+        # 耐力系统
+        self.max_stamina = 100.0
+        self.stamina_regen = 20.0 # 每秒恢复
+        
+        # 战斗统计
+        self.trace = None # CombatTrace，为 None 时不记录任何事件
+        self.trace_id = 0
+
+        self.reset()
+
+    def reset(self):
+        """重置所有运行时状态，招式图保持不变 (同一角色可反复开打)"""
+        self.hp = self.max_hp
         
         # 运行时状态
-        self.current_node_name = root_node_name
+        self.current_node_name = self.root_node_name
         self.state = State.IDLE
-        self.state_timer = 0.0     # 当前状态已持续时间
+        self.state_timer = 0       # 当前状态已持续时间 (毫秒)
+        self.stun_duration = 0     # 本次僵直时长 (毫秒)
         self.current_action_node = None # 当前正在执行的动作节点引用
         
         # 韧性系统
         self.poise_damage_accumulator = 0.0 # 累积受到的削韧值
         self.last_hit_time = -999.0 # 上次受击时间
         
-        # 耐力系统
-        self.max_stamina = 100.0
-        self.stamina = 100.0
-        self.stamina_regen = 20.0 # 每秒恢复
+        self.stamina = self.max_stamina
         
         # 战斗统计
-        self.log_buffer = []
+        self.damage_taken = 0 # 累计承受伤害
+        self.stun_count = 0   # 被打入僵直的次数
+
+    def __getstate__(self):
+        # 编译出的跳转表含闭包，不参与 pickle (到了子进程再重新编译)
+        state = {slot: getattr(self, slot) for slot in self.__slots__}
+        state["flow"] = None
+        return state
+
+    def __setstate__(self, state):
+        for slot, value in state.items():
+            setattr(self, slot, value)
 
     def log(self, msg):
-        print(f"[{self.name}] {msg}")
+        if self.verbose:
+            print(f"[{self.name}] {msg}")
+
+    def emit(self, code, t, node=None, a=0.0, b=0.0, c=0.0):
+        """记录一条结构化事件；文字只在 verbose 时才渲染"""
+        if self.trace is not None:
+            self.trace.record(t, self.trace_id, code, node, a, b, c)
+        if self.verbose:
+            text = render_event(code, node.name if node else None, a, b, c)
+            if text is not None:
+                print(f"[{self.name}] {text}")
 
     def add_node(self, node):
         self.nodes[node.name] = node
+        self.flow = None
         return node
 
+    def compile(self):
+        """把招式图编译成跳转表 (同时校验招式图)，之后 get_next_action_node 走整数下标"""
+        self.flow = compile_flow(self)
+        return self.flow
+
     def take_damage(self, damage, current_time, is_interrupt=False):
         self.hp -= damage
+        self.damage_taken += damage
         self.last_hit_time = current_time
         
         if is_interrupt:
             # 特殊检查：闪避动作不可被打断
             if self.current_action_node and self.current_action_node.action_type == ActionType.DODGE:
-                 self.log(f"被击中! (伤害 {damage}) -> 闪避中，免疫打断!")
+                 self.emit(Ev.DODGE_IMMUNE, current_time, a=damage)
                  return
 
             # 累积削韧值
@@ -117,33 +361,36 @@ class Fighter:
             if self.current_action_node:
                 # 只有在 WINDUP 和 ACTIVE 阶段才有霸体保护
                 # 后摇(RECOVERY)阶段视为失去架势，韧性为0，极易被破防
-                if self.state in [State.WINDUP, State.ACTIVE]:
+                if self.state in _GUARD_STATES:
                      toughness_value = self.current_action_node.toughness
             
             # 破防判定
             if self.poise_damage_accumulator > toughness_value:
-                # 2. 硬直计算：使用【当前伤害】
-                actual_stun = damage * 0.05
+                # 2. 硬直计算：使用【当前伤害】 (毫秒)
+                actual_stun = int(damage * STUN_MS_PER_DAMAGE + 0.5)
                 
-                self.log(f"被击中! (伤害 {damage}, 累积削韧 {self.poise_damage_accumulator} > 韧性 {toughness_value}) -> 招式被打断! 陷入僵直 {actual_stun:.2f}s!")
+                self.emit(Ev.STUN, current_time, a=damage, b=self.poise_damage_accumulator, c=toughness_value)
                 self.enter_stunned(actual_stun)
                 self.poise_damage_accumulator = 0.0 # 被打断后，削韧值清零（重置架势）
             else:
-                self.log(f"被击中! (伤害 {damage}, 累积削韧 {self.poise_damage_accumulator} <= 韧性 {toughness_value}) -> 霸体抗住!")
+                self.emit(Ev.POISE_HOLD, current_time, a=damage, b=self.poise_damage_accumulator, c=toughness_value)
         else:
-            self.log(f"被击中! (伤害 {damage})")
+            self.emit(Ev.DAMAGE, current_time, a=damage)
             # 如果不是打断（比如在后摇或僵直时被打），可能只是扣血
 
     def enter_stunned(self, duration):
         self.state = State.STUNNED
-        self.state_timer = 0.0
+        self.state_timer = 0
         self.stun_duration = duration
+        self.stun_count += 1
         self.current_action_node = None # 清除当前动作
         # 重点：被打断后，思维重置，下次醒来从根节点重新开始
         self.current_node_name = self.root_node_name
 
-    def get_next_action_node(self, enemy):
+    def get_next_action_node(self, enemy, distance=None):
         """递归执行逻辑节点，直到找到一个动作节点，或者没有节点为止"""
+        if self.flow is not None:
+            return self.flow.resolve(self, enemy, distance)
         steps = 0
         while steps < 100: # 防止无限循环
             if self.current_node_name not in self.nodes:
@@ -156,7 +403,8 @@ class Fighter:
             
             elif isinstance(node, ConditionNode):
                 # 瞬时执行逻辑判断
-                result = node.check_func(self, enemy)
+                check = node.check_func
+                result = check(self, enemy, distance) if hasattr(check, "compile") else check(self, enemy)
                 # self.log(f"思考: {node.name}? -> {result}")
                 self.current_node_name = node.true_node_name if result else node.false_node_name
             
@@ -167,12 +415,13 @@ class Fighter:
         """帧更新"""
         if self.hp <= 0: return
 
-        self.state_timer += dt
+        step = int(dt * TIME_UNIT + 0.5) # 本帧的毫秒数
+        self.state_timer += step
         
         # 韧性恢复逻辑... (省略)
 
         # 耐力恢复逻辑
-        if self.state in [State.IDLE, State.RECOVERY, State.MOVE]:
+        if self.state in _REGEN_STATES:
              self.stamina = min(self.max_stamina, self.stamina + self.stamina_regen * dt)
 
         # --- 1. 僵直状态 ---
@@ -182,22 +431,22 @@ class Fighter:
             remaining_stun = self.stun_duration - self.state_timer
             ukemi_cost = 40.0
             
-            if remaining_stun > 0.3 and self.stamina >= ukemi_cost:
+            if remaining_stun > UKEMI_WINDOW_MS and self.stamina >= ukemi_cost:
                 self.stamina -= ukemi_cost
                 self.state = State.IDLE
                 self.state_timer = 0
-                self.log(f"发动【受身】! 消耗 {ukemi_cost} 耐力，解除僵直!")
+                self.emit(Ev.UKEMI, current_time, a=ukemi_cost)
                 return
 
             if self.state_timer >= self.stun_duration:
                 self.state = State.IDLE
                 self.state_timer = 0
-                self.log("从僵直中恢复")
+                self.emit(Ev.STUN_RECOVER, current_time)
             return
 
         # --- 2. 空闲状态 (思考下一招) ---
         if self.state == State.IDLE:
-            next_action = self.get_next_action_node(enemy)
+            next_action = self.get_next_action_node(enemy, dist_mgr.distance)
             if next_action:
                 # 检查距离
                 # 如果 atk_range <= 0，视为原地技能/无限距离，不需要移动
@@ -207,7 +456,7 @@ class Fighter:
                     self.current_action_node = next_action # 记住想用的招式
                     self.state = State.MOVE
                     self.state_timer = 0
-                    self.log(f"距离过远 ({dist_mgr.distance:.1f}m > {effective_range:.1f}m)，开始接近...")
+                    self.emit(Ev.MOVE_START, current_time, next_action, dist_mgr.distance, effective_range)
                     return
 
                 # 距离合适，检查耐力
@@ -217,7 +466,7 @@ class Fighter:
                     self.state = State.WINDUP
                     self.state_timer = 0
                     self.poise_damage_accumulator = 0.0 # 新动作开始，重置架势/削韧值
-                    self.log(f"起手: 【{next_action.name}】 (前摇 {next_action.windup}s, 突进 {next_action.dash}m)")
+                    self.emit(Ev.WINDUP, current_time, next_action, next_action.windup, next_action.dash)
                 else:
                     # 耐力不足，休息
                     pass
@@ -241,9 +490,10 @@ class Fighter:
                     self.state = State.WINDUP
                     self.state_timer = 0
                     self.poise_damage_accumulator = 0.0 # 新动作开始，重置架势
-                    self.log(f"进入射程 ({dist_mgr.distance:.1f}m)! 起手: 【{node.name}】")
+                    self.emit(Ev.IN_RANGE, current_time, node, dist_mgr.distance)
                 else:
                     self.state = State.IDLE # 耐力不够，转回IDLE喘息
+                    self.emit(Ev.EXHAUSTED, current_time, node)
             
             # 距离最小限制
             if dist_mgr.distance < 0.5: dist_mgr.distance = 0.5
@@ -256,9 +506,9 @@ class Fighter:
             # [阶段 A: 前摇 WINDUP]
             if self.state == State.WINDUP:
                 # 前摇突进
+                # 每帧位移 = 总距离 * 本帧毫秒 / 前摇毫秒 (各引擎按同一顺序计算)
                 if node.dash > 0:
-                    dash_speed = node.dash / node.windup
-                    dist_mgr.distance -= dash_speed * dt
+                    dist_mgr.distance -= node.dash * step / node.windup_ms
                     if dist_mgr.distance < 0.5: dist_mgr.distance = 0.5
                 
                 # 闪避后撤 (在 ACTIVE 阶段执行比较合理，或者在 WINDUP 末尾瞬间完成？)
@@ -266,17 +516,16 @@ class Fighter:
                 # 既然是 Timeline，我们可以在 WINDUP 期间平滑后撤，也可以在 ACTIVE 瞬间拉开。
                 # 考虑到“闪避”是躲技能，应该尽早拉开。我们放在 WINDUP 期间平滑后撤。
                 if node.backdash > 0:
-                    backdash_speed = node.backdash / node.windup
-                    dist_mgr.distance += backdash_speed * dt
+                    dist_mgr.distance += node.backdash * step / node.windup_ms
                     # self.log(f"后撤中... 距离 {dist_mgr.distance:.1f}")
 
-                if self.state_timer >= node.windup:
+                if self.state_timer >= node.windup_ms:
                     # 前摇结束，进入判定帧
                     # **关键机制：闪避判定**
                     # 如果此时距离 > 攻击距离，说明对方跑了，招式挥空
                     # 注意：对于原地技能(atk_range<=0)，不进行挥空判定
                     if node.atk_range > 0 and dist_mgr.distance > node.atk_range:
-                        self.log(f"【{node.name}】 距离不够 ({dist_mgr.distance:.1f}m > {node.atk_range}m)，挥空! 自动中断!")
+                        self.emit(Ev.WHIFF, current_time, node, dist_mgr.distance, node.atk_range)
                         # 挥空惩罚：进入后摇，或者直接结束（按用户要求：自动中断无僵直 -> 转IDLE）
                         # 用户原话：“招式自动中断（当然这种主动中断不会陷入僵直）”
                         self.state = State.IDLE
@@ -290,12 +539,12 @@ class Fighter:
 
             # [阶段 B: 判定 ACTIVE]
             elif self.state == State.ACTIVE:
-                if self.state_timer >= node.active:
+                if self.state_timer >= node.active_ms:
                     # 判定结束，进入后摇
                     # **连招取消后摇机制**: 
                     # 如果当前节点有后续连接，直接跳过后摇 (或者大幅缩短)
                     if node.next_node_name:
-                         self.log(f"动作完成 -> 连招取消后摇!")
+                         self.emit(Ev.COMBO_CANCEL, current_time, node)
                          self.state = State.IDLE
                          self.state_timer = 0
                          self.current_node_name = node.next_node_name # 推进指针
@@ -304,21 +553,22 @@ class Fighter:
                     else:
                         self.state = State.RECOVERY
                         self.state_timer = 0
+                        self.emit(Ev.RECOVERY_START, current_time, node)
 
             # [阶段 C: 后摇 RECOVERY]
             elif self.state == State.RECOVERY:
-                if self.state_timer >= node.recovery:
+                if self.state_timer >= node.recovery_ms:
                     self.state = State.IDLE
                     self.state_timer = 0
                     # 动作彻底结束，推进到下一节点（如果是None就会在IDLE里重置回root）
                     self.current_node_name = node.next_node_name
                     # 动作切换，韧性重置
                     self.poise_damage_accumulator = 0.0
-                    # self.log("动作结束，韧性条重置")
+                    self.emit(Ev.ACTION_END, current_time, node)
 
     def perform_hit_check(self, node, enemy, current_time, dist_mgr):
         """在 ACTIVE 帧触发的瞬间调用"""
-        self.log(f"【{node.name}】 出招!")
+        self.emit(Ev.ATTACK, current_time, node)
         
         if node.action_type == ActionType.ATTACK:
             # 命中判定
@@ -328,13 +578,13 @@ class Fighter:
             # 1. 对方在闪避?
             if enemy.state == State.ACTIVE and enemy.current_action_node.action_type == ActionType.DODGE:
                 hit = False
-                self.log(">> 攻击被对方闪避!")
+                self.emit(Ev.DODGED, current_time, node)
             
             # 2. 对方在格挡?
             elif enemy.state == State.ACTIVE and enemy.current_action_node.action_type == ActionType.DEFEND:
                 damage = int(node.power * 0.2) # 格挡减伤
                 enemy.take_damage(damage, current_time, is_interrupt=False) # 格挡不会被打断
-                self.log(f">> 攻击被格挡，造成 {damage} 点伤害")
+                self.emit(Ev.BLOCKED, current_time, node, damage)
                 # 格挡也要计算击退，虽然可能减半
                 # 同样应用新的击退逻辑：推到 knockback * 0.5 的位置
                 block_knockback = node.knockback * 0.5
@@ -345,9 +595,9 @@ class Fighter:
             if hit:
                 # 3. 关键机制：打断判定 (Interrupt)
                 # 如果敌人处于 前摇(WINDUP) 或 后摇(RECOVERY)，会被打断
-                if enemy.state in [State.WINDUP, State.RECOVERY]:
+                if enemy.state in _OPENING_STATES:
                     is_interrupt = True
-                    self.log(">> 抓住了对方的破绽! 打断!")
+                    self.emit(Ev.INTERRUPT, current_time, node)
                 
                 enemy.take_damage(node.power, current_time, is_interrupt)
                 
@@ -365,24 +615,66 @@ class DistanceManager:
     def __init__(self, initial_distance):
         self.distance = initial_distance
 
-def run_timeline_simulation():
-    # 初始化
-    dist_mgr = DistanceManager(initial_distance=3.0) # 初始距离3米
-    
-    # 设定: 赵无极用重剑，前摇长，伤害高
-    p1 = Fighter("赵无极", 200)
-    # 设定: 张无忌用快剑，前摇短，伤害低，容易打断别人
-    p2 = Fighter("张无忌", 200)
+class DuelResult:
+    """单场对决的结果 (winner: 1/2 为获胜方，0 为平局)"""
+    def __init__(self, winner, duration, p1, p2):
+        self.winner = winner
+        self.duration = duration
+        self.hp = (p1.hp, p2.hp)
+        self.damage_dealt = (p2.damage_taken, p1.damage_taken) # 各自造成的伤害
+        self.stuns = (p1.stun_count, p2.stun_count)            # 各自被打入僵直的次数
+
+def simulate_duel(p1, p2, initial_distance=3.0, dt=0.1, time_limit=60.0, on_frame=None, trace=None):
+    """运行一场对决并返回 DuelResult
+
+    on_frame(time_elapsed, p1, p2, dist_mgr) 在每帧结束时调用，为 None 时不做任何输出。
+    trace: wuxia_trace.CombatTrace，给出时本场的结构化事件都记录到其中。
+    """
+    step = to_ms(dt)
+    if step <= 0:
+        raise ValueError(f"dt 至少为 1 毫秒: {dt}")
+    limit = to_ms(time_limit)
+    dist_mgr = DistanceManager(initial_distance)
+    elapsed = 0 # 已过去的毫秒数 (整数累加，没有浮点漂移)
+    if trace is not None:
+        trace.attach(p1, p2)
+
+    try:
+        while p1.hp > 0 and p2.hp > 0 and elapsed < limit:
+            time_elapsed = elapsed / TIME_UNIT
+            # 双方更新状态
+            p1.update(dt, p2, time_elapsed, dist_mgr)
+            p2.update(dt, p1, time_elapsed, dist_mgr)
+            
+            if on_frame is not None:
+                on_frame(time_elapsed, p1, p2, dist_mgr)
+            
+            elapsed += step
+    finally:
+        if trace is not None:
+            trace.detach(p1, p2)
 
-    # === P1 赵无极: 蓄力重击流 (增加韧性) ===
+    if p1.hp <= 0: winner = 2
+    elif p2.hp <= 0: winner = 1
+    else: winner = 0
+    return DuelResult(winner, elapsed / TIME_UNIT, p1, p2)
+
+# --- 预设流派 ---
+
+def create_heavy_fighter(name="赵无极", hp=200, verbose=True):
+    """赵无极: 蓄力重击流 (开山斧循环)"""
+    p1 = Fighter(name, hp, verbose=verbose)
     # 逻辑: 只有一招 "开山斧"，前摇1.0秒，伤害50
     # 这是一个非常危险的招式，但拥有高韧性 (25.0)，能抗住约25点伤害（相当于抗住1次轻攻击，第2次破防）
     # 攻击距离: 1.5m, 突进: 0.5m (总有效距离 2.0m), 击退: 2.0m
     heavy_atk = ActionNode("开山斧", ActionType.ATTACK, windup=1.0, active=0.2, recovery=1.0, power=50, toughness=25.0, cost=30.0, atk_range=1.5, dash=0.5, knockback=2.0)
     p1.add_node(heavy_atk).set_next("start") # 循环
     p1.nodes["start"] = heavy_atk
+    return p1
 
-    # === P2 张无忌: 敏捷连击流 ===
+def create_swift_fighter(name="张无忌", hp=200, verbose=True):
+    """张无忌: 敏捷连击流 (刺 -> 挑 -> 梯云纵)"""
+    p2 = Fighter(name, hp, verbose=verbose)
     # 逻辑: 快速刺击 (前摇0.3s) -> 快速刺击 -> 闪避
     # 攻击距离: 0.8m, 突进: 1.0m (总有效距离 1.8m), 击退: 0.2m
     light_atk1 = ActionNode("太极剑·刺", ActionType.ATTACK, windup=0.3, active=0.1, recovery=0.3, power=15, cost=15.0, atk_range=0.8, dash=1.0, knockback=0.2)
@@ -398,31 +690,39 @@ def run_timeline_simulation():
     p2.nodes["start"] = light_atk1
     p2.nodes["atk2"] = light_atk2
     p2.nodes["dodge"] = dodge
+    return p2
+
+def print_frame(time_elapsed, p1, p2, dist_mgr):
+    """逐帧打印双方状态"""
+    # 生成当前帧的状态信息
+    current_status_msg = f"   {p1.name}[{State.NAMES[p1.state]} SP:{p1.stamina:.0f}] HP:{p1.hp}  ||  {p2.name}[{State.NAMES[p2.state]} SP:{p2.stamina:.0f}] HP:{p2.hp} || Dist:{dist_mgr.distance:.1f}m"
+    
+    print(f"\n[T={time_elapsed:.1f}s]")
+    print(current_status_msg)
+    
+    # time.sleep(0.01)
+
+def run_timeline_simulation(mode="events", every=10, sink=None):
+    """显示一场对决；mode/every/sink 见 wuxia_display.Display (full 即原来的逐帧打印)"""
+    from wuxia_display import Display # 显示管线依赖本模块，在这里才导入
+
+    # 设定: 赵无极用重剑，前摇长，伤害高 (事件由显示管线渲染，角色本身不打印)
+    p1 = create_heavy_fighter(verbose=False)
+    # 设定: 张无忌用快剑，前摇短，伤害低，容易打断别人
+    p2 = create_swift_fighter(verbose=False)
+
+    initial_distance = 3.0 # 初始距离3米
 
     # === 开始模拟 ===
     print(f"--- 战斗开始: {p1.name} (重剑) VS {p2.name} (快剑) ---")
-    print(f"初始距离: {dist_mgr.distance}m")
+    print(f"初始距离: {initial_distance}m")
     
-    dt = 0.1 # 时间步长 0.1秒
-    time_elapsed = 0.0
-
-    while p1.hp > 0 and p2.hp > 0 and time_elapsed < 60.0: # 限时60秒
-        # 双方更新状态
-        p1.update(dt, p2, time_elapsed, dist_mgr)
-        p2.update(dt, p1, time_elapsed, dist_mgr)
-        
-        # 生成当前帧的状态信息
-        current_status_msg = f"   {p1.name}[{p1.state} SP:{p1.stamina:.0f}] HP:{p1.hp}  ||  {p2.name}[{p2.state} SP:{p2.stamina:.0f}] HP:{p2.hp} || Dist:{dist_mgr.distance:.1f}m"
-        
-        print(f"\n[T={time_elapsed:.1f}s]")
-        print(current_status_msg)
-        
-        # time.sleep(0.01)
-        time_elapsed += dt
+    with Display(mode, every, sink) as display:
+        result = simulate_duel(p1, p2, initial_distance, dt=0.1, time_limit=60.0, on_frame=display.on_frame, trace=display)
 
     print("\n--- 战斗结束 ---")
-    if p1.hp <= 0: print(f"{p2.name} 获胜!")
-    elif p2.hp <= 0: print(f"{p1.name} 获胜!")
+    if result.winner == 2: print(f"{p2.name} 获胜!")
+    elif result.winner == 1: print(f"{p1.name} 获胜!")
     else: print("时间到，平局")
 
 if __name__ == "__main__":
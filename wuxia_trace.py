@@ -0,0 +1,229 @@
+import struct
+import sys
+from array import array
+
+# --- 结构化战斗事件 ---
+# Fighter 只记录 (时间, 角色, 事件码, 招式, 数值a, 数值b, 数值c) 这样的定长记录，
+# 不拼字符串；需要看文字时再由 render_event 按原来的措辞渲染。
+# 没有挂 CombatTrace 且 verbose 关闭时，一次事件只是一次方法调用加两次判空。
+
+class Ev:
+    DAMAGE = 1          # 受到伤害 (a=伤害)
+    DODGE_IMMUNE = 2    # 闪避中被击中，免疫打断 (a=伤害)
+    STUN = 3            # 破防，陷入僵直 (a=伤害, b=累积削韧, c=韧性)
+    POISE_HOLD = 4      # 霸体抗住 (a=伤害, b=累积削韧, c=韧性)
+    UKEMI = 5           # 受身解除僵直 (a=耐力消耗)
+    STUN_RECOVER = 6    # 从僵直中恢复
+    MOVE_START = 7      # 距离过远开始接近 (a=距离, b=有效射程)
+    WINDUP = 8          # 原地起手 (a=前摇, b=突进)
+    IN_RANGE = 9        # 移动进入射程并起手 (a=距离)
+    WHIFF = 10          # 距离不够挥空 (a=距离, b=攻击距离)
+    ATTACK = 11         # 进入判定帧出招
+    DODGED = 12         # 攻击被闪避
+    BLOCKED = 13        # 攻击被格挡 (a=伤害)
+    INTERRUPT = 14      # 打断对方破绽
+    COMBO_CANCEL = 15   # 连招取消后摇
+    RECOVERY_START = 16 # 判定结束进入后摇
+    ACTION_END = 17     # 后摇结束回到站立
+    EXHAUSTED = 18      # 到达射程但耐力不足，转回站立
+    # 回合制引擎 (wuxia_combat_demo)，时间为回合数
+    TURN_HIT = 19       # 攻击命中 (a=伤害)
+    TURN_MISS = 20      # 攻击被化解/未命中
+    TURN_GUARD = 21     # 架起防御
+    TURN_STANCE = 22    # 其他招式 (a=招式类型在 ActionType.NAMES 中的下标)
+    TURN_THINK = 23     # 判定节点求值 (a=1 为是，0 为否)
+
+_BIG_ENDIAN = sys.byteorder == "big" # 文件里的列一律按小端存放
+
+NAMES = {code: name for name, code in vars(Ev).items() if not name.startswith("_")}
+
+def _int_like(x):
+    return int(x) if x == int(x) else x
+
+_TURN_CODES = frozenset({Ev.TURN_HIT, Ev.TURN_MISS, Ev.TURN_GUARD, Ev.TURN_STANCE, Ev.TURN_THINK})
+
+def _action_name(index):
+    from wuxia_timeline_demo import ActionType # 两套引擎的招式类型显示名相同、顺序一致
+    return ActionType.NAMES[int(index)]
+
+def _stun_seconds(damage):
+    """与 Fighter.take_damage 相同的僵直时长 (秒)"""
+    from wuxia_timeline_demo import TIME_UNIT, STUN_MS_PER_DAMAGE # 引擎模块导入本模块，在这里才导入
+    return int(damage * STUN_MS_PER_DAMAGE + 0.5) / TIME_UNIT
+
+_TEXT = {
+    Ev.DAMAGE: lambda n, a, b, c: f"被击中! (伤害 {_int_like(a)})",
+    Ev.DODGE_IMMUNE: lambda n, a, b, c: f"被击中! (伤害 {_int_like(a)}) -> 闪避中，免疫打断!",
+    Ev.STUN: lambda n, a, b, c: f"被击中! (伤害 {_int_like(a)}, 累积削韧 {b} > 韧性 {c}) -> 招式被打断! 陷入僵直 {_stun_seconds(a):.2f}s!",
+    Ev.POISE_HOLD: lambda n, a, b, c: f"被击中! (伤害 {_int_like(a)}, 累积削韧 {b} <= 韧性 {c}) -> 霸体抗住!",
+    Ev.UKEMI: lambda n, a, b, c: f"发动【受身】! 消耗 {a} 耐力，解除僵直!",
+    Ev.STUN_RECOVER: lambda n, a, b, c: "从僵直中恢复",
+    Ev.MOVE_START: lambda n, a, b, c: f"距离过远 ({a:.1f}m > {b:.1f}m)，开始接近...",
+    Ev.WINDUP: lambda n, a, b, c: f"起手: 【{n}】 (前摇 {a}s, 突进 {b}m)",
+    Ev.IN_RANGE: lambda n, a, b, c: f"进入射程 ({a:.1f}m)! 起手: 【{n}】",
+    Ev.WHIFF: lambda n, a, b, c: f"【{n}】 距离不够 ({a:.1f}m > {b}m)，挥空! 自动中断!",
+    Ev.ATTACK: lambda n, a, b, c: f"【{n}】 出招!",
+    Ev.DODGED: lambda n, a, b, c: ">> 攻击被对方闪避!",
+    Ev.BLOCKED: lambda n, a, b, c: f">> 攻击被格挡，造成 {_int_like(a)} 点伤害",
+    Ev.INTERRUPT: lambda n, a, b, c: ">> 抓住了对方的破绽! 打断!",
+    Ev.COMBO_CANCEL: lambda n, a, b, c: "动作完成 -> 连招取消后摇!",
+    Ev.TURN_HIT: lambda n, a, b, c: f"【{n}】 命中! 造成 {_int_like(a)} 点伤害",
+    Ev.TURN_MISS: lambda n, a, b, c: f"【{n}】 被化解/未命中!",
+    Ev.TURN_GUARD: lambda n, a, b, c: "架起防御姿态",
+    Ev.TURN_STANCE: lambda n, a, b, c: f"正在 {_action_name(a)}",
+    Ev.TURN_THINK: lambda n, a, b, c: f"思考: {n}? -> {'是' if a else '否'}",
+}
+
+def render_event(code, node_name, a, b, c):
+    """把一条事件渲染成日志文字；纯阶段切换事件没有文字，返回 None"""
+    text = _TEXT.get(code)
+    return text(node_name, a, b, c) if text else None
+
+class CombatTrace:
+    """列式事件缓冲 (每列一个 array)，可写成二进制文件供离线分析"""
+    MAGIC = b"WXTR"
+    VERSION = 2 # 2: actor 由有符号字节改为 32 位整数 (群战里角色远多于 127 个)
+    COLUMNS = (("time", "d"), ("actor", "i"), ("code", "B"), ("node", "i"), ("a", "d"), ("b", "d"), ("c", "d"))
+    _OLD_COLUMNS = {1: (("time", "d"), ("actor", "b"), ("code", "B"), ("node", "i"), ("a", "d"), ("b", "d"), ("c", "d"))}
+
+    def __init__(self):
+        for name, typecode in self.COLUMNS:
+            setattr(self, name, array(typecode))
+        self.fighters = []   # actor -> 角色名
+        self.node_names = [] # node -> 招式名
+        self._node_ids = {}
+
+    def __len__(self):
+        return len(self.time)
+
+    def attach(self, *fighters):
+        """把若干 Fighter 挂到本缓冲上 (actor 编号按传入顺序)"""
+        for fighter in fighters:
+            fighter.trace = self
+            fighter.trace_id = len(self.fighters)
+            self.fighters.append(fighter.name)
+        return self
+
+    @staticmethod
+    def detach(*fighters):
+        for fighter in fighters:
+            fighter.trace = None
+
+    def record(self, t, actor, code, node, a, b, c):
+        if node is None:
+            node_id = -1
+        else:
+            node_id = self._node_ids.get(id(node))
+            if node_id is None:
+                node_id = self._node_ids[id(node)] = len(self.node_names)
+                self.node_names.append(node.name)
+        self.time.append(t)
+        self.actor.append(actor)
+        self.code.append(code)
+        self.node.append(node_id)
+        self.a.append(a)
+        self.b.append(b)
+        self.c.append(c)
+
+    def records(self):
+        """逐条产出 (时间, 角色名, 事件码, 招式名, a, b, c)"""
+        for k in range(len(self.time)):
+            node = self.node[k]
+            yield (self.time[k], self.fighters[self.actor[k]], self.code[k],
+                   self.node_names[node] if node >= 0 else None, self.a[k], self.b[k], self.c[k])
+
+    def render(self):
+        """按需渲染成与 verbose 输出相同的日志行"""
+        for t, name, code, node_name, a, b, c in self.records():
+            text = render_event(code, node_name, a, b, c)
+            if text is not None:
+                when = f"[回合 {int(t)}]" if code in _TURN_CODES else f"[T={t:.1f}s]"
+                yield f"{when} [{name}] {text}"
+
+    def counts(self):
+        """各类事件的次数 {事件名: 次数}"""
+        result = {}
+        for code in self.code:
+            result[NAMES[code]] = result.get(NAMES[code], 0) + 1
+        return result
+
+    # --- 二进制格式 ---
+    # 文件头: MAGIC, VERSION(u16), 记录数(u32)，随后是角色名表与招式名表 (u16 条数 + 每条 u16 长度的 UTF-8)，
+    # 最后按 COLUMNS 顺序依次存放每一列的原始数组 (小端)。
+
+    def write(self, path):
+        with open(path, "wb") as f:
+            f.write(self.MAGIC + struct.pack("<HI", self.VERSION, len(self)))
+            for names in (self.fighters, self.node_names):
+                f.write(struct.pack("<H", len(names)))
+                for name in names:
+                    data = name.encode("utf-8")
+                    f.write(struct.pack("<H", len(data)) + data)
+            for name, _ in self.COLUMNS:
+                column = getattr(self, name)
+                if _BIG_ENDIAN:
+                    column = array(column.typecode, column)
+                    column.byteswap()
+                f.write(column.tobytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        if data[:4] != cls.MAGIC:
+            raise ValueError(f"{path} 不是战斗事件文件")
+        version, n = struct.unpack_from("<HI", data, 4)
+        if version == cls.VERSION:
+            columns = cls.COLUMNS
+        elif version in cls._OLD_COLUMNS:
+            columns = cls._OLD_COLUMNS[version] # 旧文件照常读取，载入后按当前列类型存放
+        else:
+            raise ValueError(f"不支持的事件文件版本: {version}")
+        offset = 10
+        trace = cls()
+        for names in (trace.fighters, trace.node_names):
+            (count,) = struct.unpack_from("<H", data, offset)
+            offset += 2
+            for _ in range(count):
+                (size,) = struct.unpack_from("<H", data, offset)
+                names.append(data[offset + 2:offset + 2 + size].decode("utf-8"))
+                offset += 2 + size
+        for (name, typecode), (_, current) in zip(columns, cls.COLUMNS):
+            column = array(typecode)
+            size = n * column.itemsize
+            column.frombytes(data[offset:offset + size])
+            if _BIG_ENDIAN:
+                column.byteswap()
+            setattr(trace, name, column if typecode == current else array(current, column))
+            offset += size
+        return trace
+
+if __name__ == "__main__":
+    import os
+    import shutil
+    import tempfile
+    from wuxia_timeline_demo import simulate_duel, create_heavy_fighter, create_swift_fighter
+
+    p1 = create_heavy_fighter(verbose=False)
+    p2 = create_swift_fighter(verbose=False)
+    trace = CombatTrace()
+    simulate_duel(p1, p2, trace=trace)
+    root = tempfile.mkdtemp(prefix="wuxia_trace_")
+    try:
+        path = os.path.join(root, "duel.wxtr")
+        trace.write(path)
+        loaded = CombatTrace.load(path)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    print(f"{len(loaded)} 条事件: {loaded.counts()}")
+    for line in loaded.render():
+        print(line)
+
+    # 回合制引擎写进同一种事件流
+    from wuxia_combat_demo import simulate_duel as simulate_turns, create_brute_fighter, create_taiji_fighter
+
+    turns = CombatTrace()
+    simulate_turns(create_brute_fighter(verbose=False), create_taiji_fighter(verbose=False), seed=1, trace=turns)
+    print(f"\n回合制 {len(turns)} 条事件: {turns.counts()}")
+    for line in turns.render():
+        print(line)
@@ -0,0 +1,343 @@
+import hashlib
+import os
+import re
+import time
+
+from wuxia_timeline_demo import Fighter, ActionNode, ConditionNode, ActionType, simulate_duel
+from wuxia_condition import Condition, Cond
+
+# --- Godot .tres 招式流加载 ---
+# 设计师在 Godot 编辑器里编辑的 MeridianFlow (.tres 文本资源) 直接转成 Python 的 Fighter 招式图。
+# 解析器只依赖标准库，覆盖 .tres 里会出现的值: 字符串、数字、布尔/null、构造器 (Vector2(...)、
+# ExtResource("id")、SubResource("id"))、带类型的数组 Array[T]([...]) 以及 [] / {}。
+
+class Ref:
+    """ExtResource("id") / SubResource("id") 引用"""
+    __slots__ = ("kind", "id")
+
+    def __init__(self, kind, id):
+        self.kind = kind
+        self.id = id
+
+    def __eq__(self, other):
+        return isinstance(other, Ref) and (self.kind, self.id) == (other.kind, other.id)
+
+    def __hash__(self):
+        return hash((self.kind, self.id))
+
+    def __repr__(self):
+        return f'{self.kind}("{self.id}")'
+
+class Call:
+    """其他构造器，如 Vector2(0, 0)"""
+    __slots__ = ("name", "args")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __repr__(self):
+        return f"{self.name}({', '.join(map(repr, self.args))})"
+
+class Section:
+    """一个 [tag key=value ...] 段及其下的属性"""
+    def __init__(self, tag, attrs):
+        self.tag = tag
+        self.attrs = attrs
+        self.props = {}
+
+class TresParseError(ValueError):
+    pass
+
+_TOKEN = re.compile(r"""
+    (?P<ws>[ \t\r\n]+|;[^\n]*)
+  | (?P<string>[&^]?"(?:[^"\\]|\\.)*")
+  | (?P<number>[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?(?![\w]))
+  | (?P<ident>[A-Za-z_][\w/:.]*)
+  | (?P<punct>[\[\](){},=:])
+""", re.VERBOSE)
+
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", '"': '"', "\\": "\\"}
+_CONSTANTS = {"true": True, "false": False, "null": None, "inf": float("inf"), "nan": float("nan")}
+
+def _unescape(body):
+    return re.sub(r"\\(.)", lambda m: _ESCAPES.get(m.group(1), m.group(1)), body)
+
+class _Parser:
+    def __init__(self, text):
+        self.tokens = []
+        pos = 0
+        line = 1
+        while pos < len(text):
+            m = _TOKEN.match(text, pos)
+            if m is None:
+                raise TresParseError(f"第 {line} 行无法识别的字符: {text[pos]!r}")
+            kind = m.lastgroup
+            if kind != "ws":
+                self.tokens.append((kind, m.group(), line))
+            line += m.group().count("\n")
+            pos = m.end()
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None, -1)
+
+    def take(self, expected=None):
+        token = self.peek()
+        if token[0] is None:
+            raise TresParseError("文件意外结束")
+        if expected is not None and token[1] != expected:
+            raise TresParseError(f"第 {token[2]} 行期望 {expected!r}，实际为 {token[1]!r}")
+        self.pos += 1
+        return token
+
+    def sections(self):
+        result = []
+        while self.peek()[0] is not None:
+            kind, text, line = self.peek()
+            if text == "[":
+                self.take()
+                tag = self.take()[1]
+                attrs = {}
+                while self.peek()[1] != "]":
+                    key = self.take()[1]
+                    self.take("=")
+                    attrs[key] = self.value()
+                self.take("]")
+                result.append(Section(tag, attrs))
+            elif kind in ("ident", "string"):
+                if not result:
+                    raise TresParseError(f"第 {line} 行的属性不属于任何段")
+                key = self.take()[1]
+                if kind == "string":
+                    key = _unescape(key[1:-1])
+                self.take("=")
+                result[-1].props[key] = self.value()
+            else:
+                raise TresParseError(f"第 {line} 行意外的 {text!r}")
+        return result
+
+    def value(self):
+        kind, text, line = self.take()
+        if kind == "string":
+            return _unescape(text[text.index('"') + 1:-1])
+        if kind == "number":
+            return float(text) if any(c in text for c in ".eE") else int(text)
+        if kind == "ident":
+            if text in _CONSTANTS:
+                return _CONSTANTS[text]
+            if self.peek()[1] == "[": # Array[T](...) 之类的带类型容器，类型本身忽略
+                self.take("[")
+                if self.peek()[0] == "ident" and self.tokens[self.pos + 1][1] == "]":
+                    self.take()
+                else:
+                    self.value()
+                self.take("]")
+            if self.peek()[1] != "(":
+                raise TresParseError(f"第 {line} 行无法识别的值: {text}")
+            args = self.sequence("(", ")")
+            if text in ("ExtResource", "SubResource"):
+                return Ref(text, args[0])
+            if text.startswith("Array") or text.startswith("Packed"):
+                return args[0] if text.startswith("Array") and args else list(args)
+            return Call(text, args)
+        if text == "[":
+            self.pos -= 1
+            return self.sequence("[", "]")
+        if text == "{":
+            result = {}
+            while self.peek()[1] != "}":
+                key = self.value()
+                self.take(":")
+                result[key] = self.value()
+                if self.peek()[1] == ",":
+                    self.take()
+            self.take("}")
+            return result
+        raise TresParseError(f"第 {line} 行意外的 {text!r}")
+
+    def sequence(self, open_, close):
+        self.take(open_)
+        items = []
+        while self.peek()[1] != close:
+            items.append(self.value())
+            if self.peek()[1] == ",":
+                self.take()
+        self.take(close)
+        return items
+
+def parse_tres(text):
+    """把 .tres 文本解析成 Section 列表"""
+    return _Parser(text).sections()
+
+# --- MeridianFlow -> 招式图规格 ---
+
+# GDScript 中各节点类 @export 的默认值 (.tres 只保存与默认值不同的属性)
+_BASE_DEFAULTS = {"id": "", "node_name": "Action", "next_node": None, "windup": 0.3, "active": 0.1, "recovery": 0.5, "cost": 10.0}
+_SCRIPT_DEFAULTS = {
+    "AttackActionNode": {"power": 10.0, "toughness": 0.0, "atk_range": 1.0, "dash": 0.0, "knockback": 0.5},
+    "DefendActionNode": {"power": 10.0, "toughness": 10.0},
+    "DodgeActionNode": {"backdash": 2.0},
+    "WaitActionNode": {"windup": 0.0, "active": 0.5, "recovery": 0.0, "cost": 0.0,
+                       "condition": 0, "param": 0.0, "next_node_fail": None},
+}
+_SCRIPT_TYPES = {"AttackActionNode": ActionType.ATTACK, "DefendActionNode": ActionType.DEFEND,
+                 "DodgeActionNode": ActionType.DODGE, "WaitActionNode": ActionType.WAIT}
+# WaitActionNode.Condition 的枚举顺序
+_WAIT_CONDITIONS = (Cond.ALWAYS_TRUE, Cond.DISTANCE_GT, Cond.DISTANCE_LT, Cond.MY_HP_LT, Cond.MY_STAMINA_LT,
+                    Cond.ENEMY_HP_LT, Cond.ENEMY_STAMINA_LT, Cond.ENEMY_STATE_WINDUP)
+
+class FlowSpec:
+    """解析后的 MeridianFlow: 招式名 + 根节点 id + 各节点的属性 (纯数据，可缓存、可 pickle)"""
+    def __init__(self, name, root, nodes):
+        self.name = name
+        self.root = root
+        self.nodes = nodes # [(id, 脚本类名, 属性字典)]，顺序与 MeridianFlow.nodes 一致
+
+def flow_spec_from_sections(sections, source="<tres>"):
+    scripts = {}
+    subs = {}
+    resource = None
+    for section in sections:
+        if section.tag == "ext_resource" and section.attrs.get("type") == "Script":
+            path = section.attrs.get("path", "")
+            scripts[section.attrs["id"]] = os.path.splitext(os.path.basename(path))[0]
+        elif section.tag == "sub_resource":
+            subs[section.attrs["id"]] = section.props
+        elif section.tag == "resource":
+            resource = section.props
+    if resource is None:
+        raise ValueError(f"{source} 缺少 [resource] 段")
+
+    def script_of(props):
+        ref = props.get("script")
+        return scripts.get(ref.id) if isinstance(ref, Ref) else None
+
+    if script_of(resource) != "MeridianFlow":
+        raise ValueError(f"{source} 不是 MeridianFlow 资源")
+
+    def node_id(ref):
+        # 节点引用可能是 SubResource，也可能直接写成节点 id 字符串
+        if isinstance(ref, Ref):
+            if ref.id not in subs:
+                raise ValueError(f"{source} 引用了不存在的子资源 {ref}")
+            return subs[ref.id].get("id", "")
+        return ref or None
+
+    nodes = []
+    for ref in resource.get("nodes", []):
+        props = subs.get(ref.id) if isinstance(ref, Ref) else None
+        if props is None:
+            raise ValueError(f"{source} 的 nodes 中有无法解析的条目 {ref!r}")
+        script = script_of(props)
+        if script not in _SCRIPT_DEFAULTS:
+            raise ValueError(f"{source} 中不支持的节点脚本: {script}")
+        values = dict(_BASE_DEFAULTS, **_SCRIPT_DEFAULTS[script])
+        values.update((k, v) for k, v in props.items() if k in values)
+        if not values["id"]:
+            continue # 与 MeridianFlow.get_nodes_as_dict 一致，没有 id 的节点不可寻址
+        values["next_node"] = node_id(values["next_node"])
+        if script == "WaitActionNode":
+            values["next_node_fail"] = node_id(values["next_node_fail"])
+        nodes.append((values["id"], script, values))
+    if not nodes:
+        raise ValueError(f"{source} 没有任何可用节点")
+
+    # 起始节点: starting_node，未设置时取列表中的第一个
+    root = node_id(resource.get("starting_node")) or nodes[0][0]
+    return FlowSpec(resource.get("flow_name", "New Flow"), root, nodes)
+
+WAIT_SUFFIX = "?" # 观望节点拆成 [等待动作 id] -> [条件节点 id?]
+
+def build_fighter(spec, hp=200, name=None, verbose=False):
+    """由 FlowSpec 构造 Fighter
+
+    观望 (Wait) 节点在 Godot 里是“等待 active 秒后判定一次”，这里拆成一个 WAIT 类型的动作节点
+    (原地、无伤害，判定期即等待时间) 加一个声明式条件节点；分支为空或指回自己时回到等待动作继续观望。
+    Godot 里观望期间回耐、目标动作耐力不足时拒绝跳转，这两点 Python 引擎没有建模。
+    """
+    fighter = Fighter(name or spec.name, hp, root_node_name=spec.root, verbose=verbose)
+    for node_id, script, v in spec.nodes:
+        if script == "WaitActionNode":
+            kind = _WAIT_CONDITIONS[v["condition"]]
+            check = node_id + WAIT_SUFFIX
+            wait = ActionNode(v["node_name"], ActionType.WAIT, windup=v["windup"], active=v["active"], recovery=v["recovery"],
+                              power=0, cost=v["cost"], atk_range=0, knockback=0)
+            wait.set_next(check)
+            branch = lambda target: node_id if target in (None, node_id) else target
+            cond = ConditionNode(check, Condition(kind, v["param"])).set_branches(branch(v["next_node"]), branch(v["next_node_fail"]))
+            fighter.nodes[node_id] = wait
+            fighter.nodes[check] = cond
+            continue
+        node = ActionNode(v["node_name"], _SCRIPT_TYPES[script], windup=v["windup"], active=v["active"], recovery=v["recovery"],
+                          power=v.get("power", 0), toughness=v.get("toughness", 0.0), cost=v["cost"],
+                          atk_range=v.get("atk_range", 0), dash=v.get("dash", 0.0), knockback=v.get("knockback", 0),
+                          backdash=v.get("backdash", 0.0))
+        node.set_next(v["next_node"])
+        fighter.nodes[node_id] = node
+    fighter.compile() # 顺便校验招式图
+    return fighter
+
+# --- 缓存 ---
+
+class FlowCache:
+    """按路径缓存解析结果: mtime/大小没变直接复用，变了再比内容哈希，哈希相同也不重新解析"""
+    def __init__(self):
+        self.entries = {} # 绝对路径 -> (mtime_ns, size, sha1, FlowSpec)
+        self.parsed = 0   # 实际解析的次数 (用于观察命中率)
+
+    def spec(self, path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        entry = self.entries.get(path)
+        if entry is not None and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+            return entry[3]
+        with open(path, "rb") as f:
+            data = f.read()
+        digest = hashlib.sha1(data).hexdigest()
+        if entry is not None and entry[2] == digest:
+            spec = entry[3]
+        else:
+            spec = flow_spec_from_sections(parse_tres(data.decode("utf-8")), path)
+            self.parsed += 1
+        self.entries[path] = (stat.st_mtime_ns, stat.st_size, digest, spec)
+        return spec
+
+    def clear(self):
+        self.entries.clear()
+
+_default_cache = FlowCache()
+
+def load_flow(path, hp=200, name=None, verbose=False, cache=_default_cache):
+    """加载 MeridianFlow .tres 为 Fighter (每次返回新的 Fighter，解析结果走缓存；cache=None 时不缓存)"""
+    if cache is None:
+        with open(path, encoding="utf-8") as f:
+            spec = flow_spec_from_sections(parse_tres(f.read()), path)
+    else:
+        spec = cache.spec(path)
+    return build_fighter(spec, hp, name, verbose)
+
+def load_flows(paths, hp=200, cache=_default_cache):
+    return [load_flow(path, hp, cache=cache) for path in paths]
+
+if __name__ == "__main__":
+    flow_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "DivineMechanism", "resources", "skill_flows")
+    paths = [os.path.join(flow_dir, "p1_flow.tres"), os.path.join(flow_dir, "p2_flow.tres")]
+
+    p1, p2 = load_flows(paths)
+    for fighter in (p1, p2):
+        print(f"{fighter.name}: 根节点 {fighter.root_node_name}，节点 {list(fighter.nodes)}")
+    result = simulate_duel(p1, p2)
+    print(f"对决结果: winner={result.winner} 用时 {result.duration:.1f}s HP {result.hp}")
+
+    n = 2000
+    cache = FlowCache()
+    start = time.perf_counter()
+    for _ in range(n):
+        load_flows(paths, cache=None)
+    cold = (time.perf_counter() - start) / n
+    start = time.perf_counter()
+    for _ in range(n):
+        load_flows(paths, cache=cache)
+    warm = (time.perf_counter() - start) / n
+    print(f"加载两套招式: 每次解析 {cold * 1e6:.0f}us  |  缓存 {warm * 1e6:.0f}us (实际解析 {cache.parsed} 次)")
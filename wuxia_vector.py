@@ -0,0 +1,398 @@
+import time
+
+import numpy as np
+
+from wuxia_timeline_demo import (TIME_UNIT, STUN_MS_PER_DAMAGE, UKEMI_WINDOW_MS, ActionNode, ActionType, compile_flow,
+                                 to_ms, create_heavy_fighter, create_swift_fighter, simulate_duel)
+from wuxia_condition import Condition, MaskCache, MaskInputs
+from wuxia_batch import BatchResult, duel_distance, run_batch
+
+# --- 向量化战斗内核 ---
+# 成千上万场相互独立的对决以"结构数组"形式存放，每帧用带掩码的 NumPy 运算同步推进。
+# 逻辑与 Fighter.update 逐分支对应，浮点运算顺序也保持一致，因此结果与标量引擎逐位相同。
+#
+# 实测加速 (下方 __main__，重剑 vs 快剑，各取 3 次中最快的一次): 单核 Intel Xeon 虚拟机、
+# Python 3.11 / NumPy 2.4 上为 16~24 倍，随机器负载浮动，并不总能达到 20 倍。
+# 加速比只对大批量 (数万场以上) 成立: 每帧的开销与场数无关的部分 (Python 分支、掩码分配) 在小批量时占大头。
+
+# 状态编码 (与 State 的声明顺序一致)
+IDLE, MOVE, WINDUP, ACTIVE, RECOVERY, STUNNED = range(6)
+
+# 动作类型编码
+ACTION_CODES = {ActionType.ATTACK: 0, ActionType.DEFEND: 1, ActionType.DODGE: 2, ActionType.WAIT: 3}
+ATTACK, DEFEND, DODGE, WAIT = range(4)
+
+MOVE_SPEED = 3.0  # 与 Fighter.update 中的移动速度一致
+MIN_DISTANCE = 0.5
+UKEMI_COST = 40.0
+NO_LIMIT = np.iinfo(np.int64).max # IDLE/MOVE 没有阶段时长
+
+# 按 (状态编码 + 1) 查表: 哪些状态会恢复耐力 (下标 0 对应已结束的对局)
+_REGEN_STATES = np.array([False, True, True, False, False, True, False])
+
+class FlowTable:
+    """把 Fighter 的招式图编译成按整数下标索引的参数数组 (条件节点只支持声明式 Condition)"""
+    def __init__(self, fighter, dt):
+        compile_flow(fighter) # 校验招式图 (悬空节点名、纯条件环)
+        unique = []
+        index_of = {}
+        for node in fighter.nodes.values():
+            if not isinstance(node, ActionNode) and not isinstance(node.check_func, Condition):
+                raise ValueError(f"向量内核只支持声明式条件，【{node.name}】的 check_func 不是 Condition")
+            if id(node) not in index_of:
+                index_of[id(node)] = len(unique)
+                unique.append(node)
+
+        # 名字 -> 下标 (同一个节点可以挂在多个键名下)
+        name_index = {name: index_of[id(node)] for name, node in fighter.nodes.items()}
+
+        self.nodes = unique
+        self.root = name_index[fighter.root_node_name]
+        self.max_hp = float(fighter.max_hp)
+        self.max_stamina = fighter.max_stamina
+        self.regen_step = fighter.stamina_regen * dt
+        step = to_ms(dt)
+
+        actions = [n if isinstance(n, ActionNode) else None for n in unique]
+
+        def column(attr):
+            return np.array([float(getattr(n, attr)) if n else 0.0 for n in actions])
+
+        def column_ms(attr):
+            return np.array([getattr(n, attr) if n else 0 for n in actions], dtype=np.int64)
+
+        # 阶段时长为整数毫秒，与 Fighter 的计时器一样做精确比较
+        self.windup = column_ms("windup_ms")
+        self.active = column_ms("active_ms")
+        self.recovery = column_ms("recovery_ms")
+        self.power = column("power")
+        self.toughness = column("toughness")
+        self.cost = column("cost")
+        self.atk_range = column("atk_range")
+        self.dash = column("dash")
+        self.knockback = column("knockback")
+        self.backdash = column("backdash")
+        self.effective_range = self.atk_range + self.dash
+        self.action_type = np.array([ACTION_CODES[n.action_type] if n else -1 for n in actions], dtype=np.int8)
+        # 前摇期间每帧的位移量，与标量引擎 dash * step / windup_ms 的计算顺序相同
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.dash_step = np.where(self.dash > 0, self.dash * step / self.windup, 0.0)
+            self.backdash_step = np.where(self.backdash > 0, self.backdash * step / self.windup, 0.0)
+        # next_node_name 为空串/None 时不触发连招取消；名字不存在时回到根节点 (-1)
+        self.has_next = np.array([bool(n and n.next_node_name) for n in actions])
+        self.next = np.array([name_index.get(n.next_node_name, -1) if n else -1 for n in actions], dtype=np.int64)
+
+        # 条件节点: 下标 -> (Condition, 真分支, 假分支)，分支为空时回到根节点 (-1)
+        self.conditions = [(k, n.check_func, name_index.get(n.true_node_name, -1), name_index.get(n.false_node_name, -1))
+                           for k, n in enumerate(unique) if actions[k] is None]
+        self.is_condition = np.array([n is None for n in actions])
+
+class SideState:
+    """一方在所有对局中的运行时状态 (每个字段都是长度为 n 的数组)"""
+    def __init__(self, flow, n):
+        self.flow = flow
+        self.hp = np.full(n, flow.max_hp)
+        self.state = np.zeros(n, dtype=np.int8)
+        self.timer = np.zeros(n, dtype=np.int64)           # 毫秒
+        self.limit = np.full(n, NO_LIMIT, dtype=np.int64)  # 当前阶段的时长 (前摇/判定/后摇/僵直)，IDLE/MOVE 为 NO_LIMIT
+        self.node = np.full(n, flow.root, dtype=np.int64)   # current_node_name，-1 表示回到根节点
+        self.action = np.full(n, -1, dtype=np.int64)        # current_action_node，-1 表示无
+        self.poise = np.zeros(n)
+        self.dash_step = np.zeros(n)         # 当前招式前摇期间每帧的突进/后撤距离
+        self.backdash_step = np.zeros(n)
+        self.stamina = np.full(n, flow.max_stamina)
+        self.damage_taken = np.zeros(n)
+        self.stun_count = np.zeros(n, dtype=np.int64)
+
+class VectorResult:
+    """逐场结果数组"""
+    def __init__(self, winner, duration, p1, p2, dt):
+        self.dt = dt
+        self.winner = winner
+        self.duration = duration
+        self.hp = (p1.hp, p2.hp)
+        self.damage_dealt = (p2.damage_taken, p1.damage_taken)
+        self.stuns = (p1.stun_count, p2.stun_count)
+
+    def to_batch_result(self):
+        """汇总成与标量批量模式相同的 BatchResult"""
+        result = BatchResult(self.dt)
+        result.duels = len(self.winner)
+        result.wins = [int(c) for c in np.bincount(self.winner, minlength=3)]
+        decided = self.winner > 0
+        ticks, counts = np.unique(np.rint(self.duration[decided] / self.dt).astype(np.int64), return_counts=True)
+        result.ttk_hist = {int(t): int(c) for t, c in zip(ticks, counts)}
+        result.damage_dealt = [float(self.damage_dealt[0].sum()), float(self.damage_dealt[1].sum())]
+        result.stuns = [int(self.stuns[0].sum()), int(self.stuns[1].sum())]
+        return result
+
+class VectorEngine:
+    """同一对流派、不同初始距离的 n 场对决同步推进"""
+    def __init__(self, p1, p2, distances, dt=0.1, time_limit=60.0):
+        self.dt = dt
+        self.step = to_ms(dt)
+        if self.step <= 0:
+            raise ValueError(f"dt 至少为 1 毫秒: {dt}")
+        self.time_limit = to_ms(time_limit)
+        self.distance = np.array(distances, dtype=float)
+        n = len(self.distance)
+        self.sides = (SideState(FlowTable(p1, dt), n), SideState(FlowTable(p2, dt), n))
+        self.ongoing = np.ones(n, dtype=bool)
+        self.duration = np.zeros(n)
+
+    def run(self):
+        p1, p2 = self.sides
+        elapsed = 0 # 毫秒
+        while elapsed < self.time_limit and self.ongoing.any():
+            self._update(p1, p2)
+            self._update(p2, p1)
+            elapsed += self.step
+            finished = self.ongoing & ((p1.hp <= 0) | (p2.hp <= 0))
+            self.duration[finished] = elapsed / TIME_UNIT
+            self.ongoing &= ~finished
+        self.duration[self.ongoing] = elapsed / TIME_UNIT
+
+        winner = np.zeros(len(self.distance), dtype=np.int64)
+        winner[p2.hp <= 0] = 1
+        winner[p1.hp <= 0] = 2
+        return VectorResult(winner, self.duration, p1, p2, self.dt)
+
+    def _update(self, me, en):
+        """对应 Fighter.update，me 为行动方，en 为对手"""
+        flow = me.flow
+        dist = self.distance
+        live = self.ongoing & (me.hp > 0)
+        np.add(me.timer, self.step, out=me.timer, where=live)
+        # 本帧开始时的状态 (已结束/阵亡的对局记为 -1)，各分支互斥
+        state = np.where(live, me.state, np.int8(-1))
+        due = me.timer >= me.limit
+
+        # 耐力恢复 (IDLE / RECOVERY / MOVE)
+        regen = _REGEN_STATES[state + 1]
+        np.minimum(flow.max_stamina, me.stamina + flow.regen_step, out=me.stamina, where=regen)
+
+        # --- 1. 僵直状态 ---
+        idx = np.flatnonzero(state == STUNNED)
+        if idx.size:
+            remaining = me.limit[idx] - me.timer[idx]
+            ukemi = (remaining > UKEMI_WINDOW_MS) & (me.stamina[idx] >= UKEMI_COST)
+            recovered = ~ukemi & (me.timer[idx] >= me.limit[idx])
+            me.stamina[idx[ukemi]] -= UKEMI_COST
+            self._enter(me, idx[ukemi | recovered], IDLE, NO_LIMIT)
+
+        # --- 2. 空闲状态 (思考下一招) ---
+        idx = np.flatnonzero(state == IDLE)
+        if idx.size:
+            node = me.node[idx]
+            node[node < 0] = flow.root
+            if flow.conditions:
+                node = self._resolve_conditions(me, en, idx, node)
+            me.node[idx] = node
+            far = (flow.atk_range[node] > 0) & (dist[idx] > flow.effective_range[node])
+            me.action[idx[far]] = node[far]
+            self._enter(me, idx[far], MOVE, NO_LIMIT)
+            start = ~far & (me.stamina[idx] >= flow.cost[node])
+            self._start_windup(me, idx[start], node[start])
+
+        # --- 2.5 移动状态 ---
+        idx = np.flatnonzero(state == MOVE)
+        if idx.size:
+            dist[idx] -= MOVE_SPEED * self.dt
+            node = me.action[idx]
+            arrived = dist[idx] <= flow.effective_range[node]
+            can_pay = me.stamina[idx] >= flow.cost[node]
+            self._start_windup(me, idx[arrived & can_pay], node[arrived & can_pay])
+            self._enter(me, idx[arrived & ~can_pay], IDLE, NO_LIMIT)
+            d = dist[idx]
+            dist[idx] = np.where(d < MIN_DISTANCE, MIN_DISTANCE, d)
+
+        # --- 3A. 前摇 ---
+        # 突进/后撤的每帧位移在起手时已写入 dash_step/backdash_step，这里不必再按节点取数
+        windup = state == WINDUP
+        moving = windup & (me.dash_step > 0)
+        np.subtract(dist, me.dash_step, out=dist, where=moving)
+        np.maximum(dist, MIN_DISTANCE, out=dist, where=moving)
+        np.add(dist, me.backdash_step, out=dist, where=windup & (me.backdash_step > 0))
+        idx = np.flatnonzero(windup & due)
+        if idx.size:
+            node = me.action[idx]
+            rng = flow.atk_range[node]
+            whiff = (rng > 0) & (dist[idx] > rng)
+            j = idx[whiff]
+            self._enter(me, j, IDLE, NO_LIMIT)
+            me.action[j] = -1
+            me.poise[j] = 0.0
+            j, node = idx[~whiff], node[~whiff]
+            self._enter(me, j, ACTIVE, flow.active[node])
+            self._hit_check(me, en, j, node)
+
+        # --- 3B. 判定 ---
+        idx = np.flatnonzero(due & (state == ACTIVE))
+        if idx.size:
+            node = me.action[idx]
+            combo = flow.has_next[node]
+            j = idx[combo]
+            self._enter(me, j, IDLE, NO_LIMIT)
+            me.node[j] = flow.next[node[combo]]
+            me.poise[j] = 0.0
+            self._enter(me, idx[~combo], RECOVERY, flow.recovery[node[~combo]])
+
+        # --- 3C. 后摇 ---
+        idx = np.flatnonzero(due & (state == RECOVERY))
+        if idx.size:
+            self._enter(me, idx, IDLE, NO_LIMIT)
+            me.node[idx] = flow.next[me.action[idx]]
+            me.poise[idx] = 0.0
+
+    def _resolve_conditions(self, me, en, idx, node):
+        """对应 get_next_action_node: 沿条件分支跳转直到落在动作节点 (招式图无纯条件环)"""
+        flow = me.flow
+        cache = None
+        pending = flow.is_condition[node]
+        while pending.any():
+            if cache is None:
+                en_action = en.action
+                cache = MaskCache(MaskInputs(
+                    self.distance, me.hp, me.stamina, en.hp, en.stamina, en.state == WINDUP,
+                    np.where(en_action >= 0, en.flow.action_type[np.maximum(en_action, 0)], -1), ACTION_CODES))
+            for k, condition, true_node, false_node in flow.conditions:
+                sel = pending & (node == k)
+                if sel.any():
+                    node[sel] = np.where(cache.get(condition)[idx[sel]], true_node, false_node)
+            node[node < 0] = flow.root
+            pending = flow.is_condition[node]
+        return node
+
+    @staticmethod
+    def _enter(side, idx, state, limit):
+        side.state[idx] = state
+        side.timer[idx] = 0
+        side.limit[idx] = limit
+
+    def _start_windup(self, me, idx, node):
+        me.stamina[idx] -= me.flow.cost[node]
+        me.action[idx] = node
+        me.poise[idx] = 0.0
+        me.dash_step[idx] = me.flow.dash_step[node]
+        me.backdash_step[idx] = me.flow.backdash_step[node]
+        self._enter(me, idx, WINDUP, me.flow.windup[node])
+
+    def _hit_check(self, me, en, idx, node):
+        """对应 Fighter.perform_hit_check"""
+        attack = me.flow.action_type[node] == ATTACK
+        idx, node = idx[attack], node[attack]
+        if not idx.size:
+            return
+        dist = self.distance
+        power = me.flow.power[node]
+
+        en_action = en.action[idx]
+        en_type = np.where(en_action >= 0, en.flow.action_type[en_action], -1)
+        en_state = en.state[idx]
+        en_active = en_state == ACTIVE
+        dodged = en_active & (en_type == DODGE)
+        blocked = en_active & (en_type == DEFEND)
+
+        # 格挡: 两成伤害，不打断，击退减半
+        if blocked.any():
+            j = idx[blocked]
+            damage = np.trunc(power[blocked] * 0.2)
+            en.hp[j] -= damage
+            en.damage_taken[j] += damage
+            push = me.flow.knockback[node[blocked]] * 0.5
+            dist[j] = np.where(dist[j] < push, push, dist[j])
+
+        hit = ~dodged & ~blocked
+        if not hit.any():
+            return
+        j, power, node = idx[hit], power[hit], node[hit]
+        interrupt = (en_state[hit] == WINDUP) | (en_state[hit] == RECOVERY)
+        en.hp[j] -= power
+        en.damage_taken[j] += power
+
+        # 打断: 闪避中免疫，否则累积削韧并与韧性比较
+        en_action = en_action[hit]
+        immune = (en_action >= 0) & (en_type[hit] == DODGE)
+        k = interrupt & ~immune
+        if k.any():
+            jk = j[k]
+            en.poise[jk] += power[k]
+            guarded = (en_action[k] >= 0) & ((en_state[hit][k] == WINDUP) | (en_state[hit][k] == ACTIVE))
+            toughness = np.where(guarded, en.flow.toughness[np.maximum(en_action[k], 0)], 0.0)
+            broken = en.poise[jk] > toughness
+            jb = jk[broken]
+            # 与 Fighter.take_damage 相同的四舍五入: int(伤害 * 50 + 0.5)
+            self._enter(en, jb, STUNNED, np.floor(power[k][broken] * STUN_MS_PER_DAMAGE + 0.5).astype(np.int64))
+            en.stun_count[jb] += 1
+            en.action[jb] = -1
+            en.node[jb] = -1
+            en.poise[jb] = 0.0
+
+        # 击退: 把距离拉开到 knockback
+        push = me.flow.knockback[node]
+        d = dist[j]
+        dist[j] = np.where((push > 0) & (d < push), push, d)
+
+def seed_distances(seeds, initial_distance=3.0, distance_jitter=0.5):
+    """wuxia_batch.duel_distance 的向量化版本 (splitmix64，逐位一致)"""
+    z = np.asarray(seeds, dtype=np.uint64)
+    if distance_jitter <= 0:
+        return np.full(len(z), float(initial_distance))
+    z = z + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    z ^= z >> np.uint64(31)
+    u = (z >> np.uint64(11)).astype(np.float64) * (1.0 / (1 << 53))
+    return initial_distance + (-distance_jitter + 2 * distance_jitter * u)
+
+def run_vector_batch(p1, p2, seeds, initial_distance=3.0, distance_jitter=0.5, dt=0.1, time_limit=60.0):
+    """与 run_batch 参数一致的向量化版本，返回 VectorResult"""
+    distances = seed_distances(seeds, initial_distance, distance_jitter)
+    return VectorEngine(p1, p2, distances, dt, time_limit).run()
+
+def verify_against_scalar(p1, p2, seeds, **duel_kwargs):
+    """逐场对比向量内核与标量 Fighter.update 的结果，返回不一致的种子列表"""
+    seeds = list(seeds)
+    vec = run_vector_batch(p1, p2, seeds, **duel_kwargs)
+    initial_distance = duel_kwargs.get("initial_distance", 3.0)
+    distance_jitter = duel_kwargs.get("distance_jitter", 0.5)
+    dt = duel_kwargs.get("dt", 0.1)
+    time_limit = duel_kwargs.get("time_limit", 60.0)
+    verbose = (p1.verbose, p2.verbose)
+    p1.verbose = p2.verbose = False
+    mismatches = []
+    try:
+        for k, seed in enumerate(seeds):
+            p1.reset()
+            p2.reset()
+            r = simulate_duel(p1, p2, duel_distance(seed, initial_distance, distance_jitter), dt, time_limit)
+            if (r.winner != vec.winner[k] or r.duration != vec.duration[k]
+                    or r.hp != (vec.hp[0][k], vec.hp[1][k])
+                    or r.stuns != (vec.stuns[0][k], vec.stuns[1][k])):
+                mismatches.append(seed)
+    finally:
+        p1.verbose, p2.verbose = verbose
+    return mismatches
+
+if __name__ == "__main__":
+    p1 = create_heavy_fighter(verbose=False)
+    p2 = create_swift_fighter(verbose=False)
+
+    mismatches = verify_against_scalar(p1, p2, range(2000))
+    print(f"一致性校验: 2000 场中 {len(mismatches)} 场与标量引擎不一致")
+
+    # 各跑 3 次取最快的一次，减少机器负载对加速比的影响
+    n_scalar, n_vector, repeats = 5000, 200000, 3
+    scalar_rate = vector_rate = 0.0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run_batch(p1, p2, range(n_scalar))
+        scalar_rate = max(scalar_rate, n_scalar / (time.perf_counter() - start))
+
+        start = time.perf_counter()
+        result = run_vector_batch(p1, p2, range(n_vector)).to_batch_result()
+        vector_rate = max(vector_rate, n_vector / (time.perf_counter() - start))
+
+    print(result.summary(p1.name, p2.name))
+    print(f"\n标量批量: {scalar_rate:,.0f} 场/秒 (3 次取最快)")
+    print(f"向量内核: {vector_rate:,.0f} 场/秒  (加速 {vector_rate / scalar_rate:.1f}x)")